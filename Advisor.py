@@ -1,9 +1,14 @@
-import sqlite3
+import functools
 from datetime import datetime, timedelta
 import streamlit as st
 import pytz
 import pandas as pd
 import uuid
+import Database
+import Profiler
+from services import advisor as advisor_sales
+from services import shards, workshop
+from services.errors import NotFound
 
 # Helper to get Kolkata time
 def get_kolkata_time():
@@ -12,7 +17,7 @@ def get_kolkata_time():
 
 # Helper function for database connection management
 def get_db_connection():
-    return sqlite3.connect("Tools_And_Tools.sqlite", check_same_thread=False)
+    return Database.get_db_connection(check_same_thread=False)
 
 # Ensure a unique session ID is initialized
 def initialize_session():
@@ -20,6 +25,25 @@ def initialize_session():
         st.session_state['session_id'] = str(uuid.uuid4())
 
 # Fix empty label warnings by collapsing labels
+def session_shard():
+    """The logged-in user's shard key, None before login or without TOOLS_SHARDS."""
+    return (st.session_state.get('user_data') or {}).get('shard')
+
+
+def session_routed(fn):
+    """Run fn against the session's shard.
+
+    ToolsAndTools.main() routes every script run, but form callbacks run
+    before it and a fragment rerun runs alone on a new thread, so both must
+    route themselves.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with shards.routed(session_shard()):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
 def styled_number_input(label, value, key):
     return st.number_input(
         label,
@@ -31,151 +55,115 @@ def styled_number_input(label, value, key):
         label_visibility="collapsed"
     )
 
+# (label, figure, widget key) of the figures keyed in on the entry screens
+ENTRY_FIELDS = [
+    ("Running Repair", "running_repair", "rr"),
+    ("Free Service", "free_service", "fs"),
+    ("Paid Service", "paid_service", "ps"),
+    ("Body Shop", "body_shop", "bs"),
+    ("Align", "align", "align"),
+    ("Balance", "balance", "balance"),
+]
+SUMMARY_COLUMNS = ["Running Repair", "Free Service", "Paid Service", "Body Shop", "Total", "Align", "Balance", "Align and Balance"]
+
+
+def show_entry_message(key):
+    """The outcome of the last submit, left in session_state by the form's callback."""
+    message = st.session_state.pop(key, None)
+    if message:
+        kind, text = message
+        if kind == "success":
+            st.success(text)
+        else:
+            st.error(text)
+
+
+@Profiler.profiled("Advisor.daily_workstation_data_entry")
 def daily_workstation_data_entry(workstation_name, supervisor_name):
     st.markdown('''###    :green[Daily Workstation Data Entry]''')
     # st.title("Daily Workstation Data Entry")
 
     initialize_session()
+    workstation_entry(workstation_name, supervisor_name)
+
 
-    kolkata_time = get_kolkata_time()
+@session_routed
+def save_workstation_day(current_date, workstation_name, supervisor_name):
+    # Runs before the fragment reruns, so the summary below already shows the saved figures
+    with Profiler.profile_block("Advisor.save_workstation_day"):
+        figures = {figure: st.session_state[key] for _, figure, key in ENTRY_FIELDS}
+        try:
+            workshop.save_day(current_date, workstation_name, supervisor_name, figures)
+            st.session_state["workstation_entry_message"] = ("success", "Workstation data submitted successfully!")
+        except ValueError:
+            st.session_state["workstation_entry_message"] = ("error", "Please enter valid integer values between 0 and 9999.")
+
+
+# Only this part reruns on a submit. The inputs sit in a form, so keying in
+# figures does not rerun anything until Submit Data is pressed.
+@st.fragment
+@Profiler.profiled("Advisor.workstation_entry")
+@session_routed
+def workstation_entry(workstation_name, supervisor_name):
     current_date = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%Y-%m-%d")
+    show_entry_message("workstation_entry_message")
 
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Fetch target value from User_Credentials
-        cursor.execute('SELECT Target FROM User_Credentials WHERE Name = ?', (workstation_name,))
-        target_value = cursor.fetchone()
-        target_display = target_value[0] if target_value else "No Target Assigned"
-        st.write(f"**Target:** {target_display}")
-
-        # Fetch cumulative data for the current month
-        start_of_month = datetime.now(pytz.timezone("Asia/Kolkata")).replace(day=1).strftime("%Y-%m-%d")
-        cursor.execute('''
-            SELECT SUM(running_repair), SUM(free_service), SUM(paid_service), SUM(body_shop), 
-                   SUM(total), SUM(align), SUM(balance), SUM(align_and_balance)
-            FROM Workstation_Data
-            WHERE date >= ? AND workstation_name = ?
-        ''', (start_of_month, workstation_name))
-        monthly_totals = cursor.fetchone()
-
-        st.subheader("Monthly Summary (From Start of Month to Today)")
-        if any(monthly_totals):
-            summary_df = pd.DataFrame(
-                [monthly_totals],
-                columns=[
-                    "Running Repair", "Free Service", "Paid Service", "Body Shop",
-                    "Total", "Align", "Balance", "Align and Balance"
-                ]
-            )
-            st.table(summary_df)
-        else:
-            st.write("No data submitted for this month.")
+    # Fetch target value from User_Credentials
+    target_value = workshop.target(workstation_name)
+    target_display = target_value if target_value is not None else "No Target Assigned"
+    st.write(f"**Target:** {target_display}")
 
-        # Fetch existing data for the current date
-        cursor.execute('''
-            SELECT running_repair, free_service, paid_service, body_shop, total, align, balance, align_and_balance
-            FROM Workstation_Data
-            WHERE date = ? AND workstation_name = ?
-        ''', (current_date, workstation_name))
-        existing_data = cursor.fetchone()
+    # Fetch cumulative data for the current month
+    monthly_totals = workshop.month_totals(workstation_name)
+
+    st.subheader("Monthly Summary (From Start of Month to Today)")
+    if monthly_totals:
+        st.table(pd.DataFrame([monthly_totals], columns=SUMMARY_COLUMNS))
+    else:
+        st.write("No data submitted for this month.")
+
+    # Fetch existing data for the current date
+    existing_data = workshop.day_figures(workstation_name, current_date)
 
     # Display Existing Data at the Top
     st.subheader("Existing Data for Today")
     if existing_data:
-        existing_df = pd.DataFrame(
-            [existing_data],
-            columns=[
-                "Running Repair", "Free Service", "Paid Service", "Body Shop",
-                "Total", "Align", "Balance", "Align and Balance"
-            ]
-        )
-        st.table(existing_df)
+        st.table(pd.DataFrame([existing_data], columns=SUMMARY_COLUMNS))
     else:
         st.write("No data submitted for today. (Empty)")
 
     # Input fields for new data
     st.subheader("Enter Data for Today")
     default_values = existing_data if existing_data else (0, 0, 0, 0, 0, 0, 0, 0)
-    st.write("Running Repair")
-    running_repair = styled_number_input("Running Repair", default_values[0], key="rr")
-    st.write("Free Service")
-    free_service = styled_number_input("Free Service", default_values[1], key="fs")
-    st.write("Paid Service")
-    paid_service = styled_number_input("Paid Service", default_values[2], key="ps")
-    st.write("Body Shop")
-    body_shop = styled_number_input("Body Shop", default_values[3], key="bs")
-    total = running_repair + free_service + paid_service + body_shop
-    st.markdown(f"**Total:** {total}")
-    st.write("Align")
-    align = styled_number_input("Align", default_values[5], key="align")
-    st.write("Balance")
-    balance = styled_number_input("Balance", default_values[6], key="balance")
-
-    
-
-    align_and_balance = align + balance
-    st.markdown(f"**Align and Balance:** {align_and_balance}")
-
-
-    # Submit Button
-    if st.button("Submit Data"):
-        try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                if existing_data:
-                    cursor.execute('''
-                        UPDATE Workstation_Data
-                        SET running_repair = ?, free_service = ?, paid_service = ?, body_shop = ?, 
-                            total = ?, align = ?, balance = ?, align_and_balance = ?, timestamp = ?
-                        WHERE date = ? AND workstation_name = ?
-                    ''', (
-                        running_repair, free_service, paid_service, body_shop, total,
-                        align, balance, align_and_balance, kolkata_time,
-                        current_date, workstation_name
-                    ))
-                else:
-                    cursor.execute('''
-                        INSERT INTO Workstation_Data (date, timestamp, workstation_name, supervisor_name, 
-                                                      running_repair, free_service, paid_service, body_shop, total, 
-                                                      align, balance, align_and_balance)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        current_date, kolkata_time, workstation_name, supervisor_name,
-                        running_repair, free_service, paid_service, body_shop, total,
-                        align, balance, align_and_balance
-                    ))
-                conn.commit()
-            st.success("Workstation data submitted successfully!")
-        except ValueError:
-            st.error("Please enter valid integer values between 0 and 9999.")
+    # day_figures() is in TOTALS order, which has total and align_and_balance in between
+    positions = {"running_repair": 0, "free_service": 1, "paid_service": 2, "body_shop": 3, "align": 5, "balance": 6}
+    with st.form("workstation_entry"):
+        for label, figure, key in ENTRY_FIELDS:
+            st.write(label)
+            styled_number_input(label, default_values[positions[figure]], key=key)
+        st.caption("Total and Align and Balance are added up when the data is submitted.")
+        st.form_submit_button("Submit Data", on_click=save_workstation_day,
+                              args=(current_date, workstation_name, supervisor_name))
 
     #==================================================
     #Main Page
+@Profiler.profiled("Advisor.workstation_interface")
 def workstation_interface(user_workstation_id):
     user_data = st.session_state.user_data
     st.success(f"Welcome to {user_data['name']}")
     st.title("Workstation Dashboard")
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
     # st.sidebar.title("Options")
     # option = st.sidebar.radio("Choose an Action", ["Daily Workstation Data Entry", "Daily Advisor Data Entry"])
     option = st.sidebar.selectbox("Choose an Action", ["Daily Workstation Data Entry", "Daily Advisor Data Entry"])
     # Retrieve Advisor names under the current Workstation
-    cursor.execute("SELECT name FROM User_Credentials WHERE Supervisor_Code = ? AND User_Role = 'Advisor'", (user_workstation_id,))
-    advisors = cursor.fetchall()
-
-
-
-    # Fetch supervisor name for the current workstation
-    cursor.execute("SELECT Supervisor_Code FROM User_Credentials WHERE code = ?", (user_workstation_id,))
-    supervisor_data = cursor.fetchone()
-    supervisor_name = supervisor_data[0] if supervisor_data else "N/A"
+    advisors = advisor_sales.advisor_names(user_workstation_id)
 
-    # Get the logged-in workstation name
-    cursor.execute("SELECT name FROM User_Credentials WHERE code = ?", (user_workstation_id,))
-    workstation_data = cursor.fetchone()
-    workstation_name = workstation_data[0] if workstation_data else "N/A"
+    # Fetch the logged-in workstation's name and its supervisor's code
+    try:
+        workstation_name, supervisor_name = workshop.workstation(user_workstation_id)
+    except NotFound:
+        workstation_name, supervisor_name = "N/A", "N/A"
+    supervisor_name = supervisor_name or "N/A"
 
     if option == "Daily Workstation Data Entry":
         daily_workstation_data_entry(workstation_name, supervisor_name)
@@ -183,117 +171,78 @@ def workstation_interface(user_workstation_id):
         if not advisors:
             st.write("No advisors found for this workstation.")
             return  # Stop if no advisors are found
-        daily_advisor_data_entry(user_workstation_id,supervisor_name) 
+        daily_advisor_data_entry(advisors, workstation_name, supervisor_name)
 
 
-def daily_advisor_data_entry(user_workstation_id,supervisor_name):
-    
+@Profiler.profiled("Advisor.daily_advisor_data_entry")
+def daily_advisor_data_entry(advisors, workstation_name, supervisor_name):
     st.markdown('''###    :blue[Daily Advisor Data Entry]''')
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-    # Retrieve Advisor names under the current Workstation
-    cursor.execute("SELECT name FROM User_Credentials WHERE Supervisor_Code = ? AND User_Role = 'Advisor'", (user_workstation_id,))
-    advisors = cursor.fetchall()
+    advisor_entry(advisors, workstation_name, supervisor_name)
+
+
+@session_routed
+def save_advisor_day(selected_date, advisors, existing, workstation_name, supervisor_name):
+    with Profiler.profile_block("Advisor.save_advisor_day"):
+        rows = {}
+        for advisor_name in advisors:
+            figures = {figure: st.session_state[f"{key}_{advisor_name}_{selected_date}"] for _, figure, key in ENTRY_FIELDS}
+            # Only rows that differ from what is stored are written
+            if tuple(figures.values()) != tuple(existing.get(advisor_name) or (0,) * len(ENTRY_FIELDS)):
+                rows[advisor_name] = figures
+        if not rows:
+            st.session_state["advisor_entry_message"] = ("success", "No changes to submit.")
+            return
+        try:
+            advisor_sales.save_day(selected_date, workstation_name, supervisor_name, rows)
+            st.session_state["advisor_entry_message"] = ("success", f"Data submitted for {len(rows)} advisor(s).")
+        except ValueError:
+            st.session_state["advisor_entry_message"] = ("error", "Please enter valid integer values between 0 and 9999.")
+
+
+# As for the workstation screen: the grid is one form inside a fragment, so
+# typing costs no reruns and a submit (or a new date) reruns only the grid.
+@st.fragment
+@Profiler.profiled("Advisor.advisor_entry")
+@session_routed
+def advisor_entry(advisors, workstation_name, supervisor_name):
+    show_entry_message("advisor_entry_message")
 
     # Get the date from the date picker
     start_date = datetime.now() - timedelta(days=180)
     selected_date = st.date_input("Select Date", value=datetime.now().date(), min_value=start_date.date(), max_value=datetime.now().date())
-  
-    # Display headers as a fixed row
-    st.markdown(
-        "<style>div.row-header {display: flex; justify-content: space-between; font-weight: bold;}</style>",
-        unsafe_allow_html=True
-    )
-    st.markdown('<div class="row-header">', unsafe_allow_html=True)
-    col1, col2, col3, col4, col5, col6, col7, col8, col9, col10 = st.columns([1.5, 1.5, 2, 2, 2, 2, 2, 2, 2, 2])
-    with col1:
-        st.write("Advisor Name")
-    with col2:
-        st.write("Edit")
-    with col3:
-        st.write("Running Repair")
-    with col4:
-        st.write("Free Service")
-    with col5:
-        st.write("Paid Service")
-    with col6:
-        st.write("Body Shop")
-    with col7:
-        st.write("Total")
-    with col8:
-        st.write("Align")
-    with col9:
-        st.write("Balance")
-    with col10:
-        st.write("Align and Balance")
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    # Display rows for each advisor
-    rows_data = []
-    for advisor in advisors:
-        advisor_name = advisor[0]
-
-        # Check if data exists for the selected date and advisor
-        cursor.execute("""
-            SELECT running_repair, free_service, paid_service, body_shop, align, balance
-            FROM Advisor_Data
-            WHERE date = ? AND advisor_name = ?
-        """, (selected_date, advisor_name))
-        result = cursor.fetchone()
-
-        # Set initial values based on existing data if found, or default values if not
-        if result:
-            initial_running_repair, initial_free_service, initial_paid_service, initial_body_shop, initial_align, initial_balance = result
-        else:
-            initial_running_repair = initial_free_service = initial_paid_service = initial_body_shop = initial_align = initial_balance = 0
-
-        # Arrange input fields in columns
-        col1, col2, col3, col4, col5, col6, col7, col8, col9, col10 = st.columns([1.5, 1.5, 2, 2, 2, 2, 2, 2, 2, 2])
-        with col1:
-            st.write(advisor_name)
-        with col2:
-            edit_row = st.checkbox("", key=f"edit_{advisor_name}")  # Checkbox in its own column
-        with col3:
-            running_repair = st.number_input(f"Running Repair {advisor_name}", min_value=0, value=initial_running_repair, step=1, key=f"rr_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-        with col4:
-            free_service = st.number_input(f"Free Service {advisor_name}", min_value=0, value=initial_free_service, step=1, key=f"fs_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-        with col5:
-            paid_service = st.number_input(f"Paid Service {advisor_name}", min_value=0, value=initial_paid_service, step=1, key=f"ps_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-        with col6:
-            body_shop = st.number_input(f"Body Shop {advisor_name}", min_value=0, value=initial_body_shop, step=1, key=f"bs_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-
-        # Total Calculation
-        total = running_repair + free_service + paid_service + body_shop
-        with col7:
-            st.write(total)  # Display total for reference
-
-        with col8:
-            align = st.number_input(f"Align {advisor_name}", min_value=0, value=initial_align, step=1, key=f"al_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-        with col9:
-            balance = st.number_input(f"Balance {advisor_name}", min_value=0, value=initial_balance, step=1, key=f"bal_{advisor_name}", disabled=not edit_row, max_value=9999, label_visibility="collapsed")
-
-        # Align and Balance Calculation
-        align_and_balance = align + balance
-        with col10:
-            st.write(align_and_balance)  # Display align_and_balance for reference
-
-        # Only add data to rows_data if the row is editable
-        if edit_row:
-            rows_data.append({
-                "date": selected_date,
-                "advisor_name": advisor_name,
-                "running_repair": running_repair,
-                "free_service": free_service,
-                "paid_service": paid_service,
-                "body_shop": body_shop,
-                "total": total,
-                "align": align,
-                "balance": balance,
-                "align_and_balance": align_and_balance
-            })
-
-        # Add a horizontal line after each advisor row
-        st.markdown("---")
+
+    # Existing data for the selected date, one query for all advisors
+    existing = advisor_sales.day_figures(advisors, selected_date)
+
+    with st.form("advisor_entry"):
+        widths = [2, 2, 2, 2, 2, 1.5, 2, 2, 1.5]
+        headers = ["Advisor Name", "Running Repair", "Free Service", "Paid Service", "Body Shop", "Total", "Align", "Balance",
+                   "Align and Balance"]
+        for column, header in zip(st.columns(widths), headers):
+            with column:
+                st.write(f"**{header}**")
+
+        for advisor_name in advisors:
+            # Set initial values based on existing data if found, or default values if not
+            initial = existing.get(advisor_name) or (0,) * len(ENTRY_FIELDS)
+            columns = st.columns(widths)
+            with columns[0]:
+                st.write(advisor_name)
+            # Keyed by date too, so picking another date shows that day's figures
+            inputs = dict(zip(("running_repair", "free_service", "paid_service", "body_shop"), columns[1:5]))
+            inputs.update(align=columns[6], balance=columns[7])
+            for (label, figure, key), value in zip(ENTRY_FIELDS, initial):
+                with inputs[figure]:
+                    st.number_input(f"{label} {advisor_name}", min_value=0, max_value=9999, value=value, step=1,
+                                    key=f"{key}_{advisor_name}_{selected_date}", label_visibility="collapsed")
+            # Stored totals; they are worked out again on submit
+            with columns[5]:
+                st.write(sum(initial[:4]))
+            with columns[8]:
+                st.write(initial[4] + initial[5])
+
+        st.form_submit_button("Submit Data", on_click=save_advisor_day,
+                              args=(selected_date, advisors, existing, workstation_name, supervisor_name))
 #================================================
 
 
@@ -0,0 +1,276 @@
+"""Read-only JSON API over the app's database, for dashboards and BI tools.
+
+    python Api.py --port 8600
+
+    GET /api/workshop?start=2024-11-01&end=2024-11-30[&supervisor=SV001]
+    GET /api/advisor?start=2024-11-01&end=2024-11-30[&supervisor=SV001]
+    GET /api/attendance?start=2024-11-01&end=2024-11-30[&supervisor=Supervisor%20Name][&scope=MGR01]
+    GET /api/versions
+    GET /api/changes?since=1200[&limit=1000][&shard=SV001]
+
+Dates are YYYY-MM-DD and inclusive. The sales endpoints filter on the
+supervisor code, attendance on the supervisor name, the same as the pages.
+A supervisor code covers their whole org subtree, so a manager's code gets
+every supervisor under them; attendance takes such a code as scope.
+
+Every report response carries an ETag built from the Table_Versions counters
+of the tables it reads. A client that sends it back in If-None-Match gets a
+304 after one primary-key lookup, without the report being run. Responses are
+gzipped for clients that accept it, and all queries go through a small pool
+of read-only connections, so the API can never block a punch-in.
+
+/api/changes pages through Change_Log: pass the returned `last` as `since`
+until `more` is false. With TOOLS_SHARDS each shard keeps its own sequence,
+so name the shard (the main file holds the users).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import tornado.web
+
+import Database
+from services import advisor, changes, clock, reports, schema, shards, workshop
+
+DEFAULT_PORT = 8600
+POOL_SIZE = 4
+# Report bodies kept per ETag, so a dashboard without ETag support still skips the query
+CACHE_SIZE = 128
+
+
+class ReadPool:
+    """A fixed set of read-only connections, each used by one worker thread at a time."""
+
+    def __init__(self, path=Database.DB_PATH, size=POOL_SIZE):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(Database.get_read_connection(path, check_same_thread=False))
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="api-read")
+
+    def _call(self, fn, *args):
+        conn = self._connections.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._connections.put(conn)
+
+    def run(self, fn, *args):
+        """Awaitable result of fn(conn, *args) on a pooled connection."""
+        return asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, *args)
+
+
+class ResponseCache:
+    def __init__(self, size=CACHE_SIZE):
+        self._size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+
+def _json_default(value):
+    # numpy scalars from the DataFrames
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def frame_json(df, **extra):
+    body = dict(extra, rows=df.to_dict(orient="records"))
+    return json.dumps(body, default=_json_default).encode("utf-8")
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    def initialize(self, pool, cache):
+        self.pool = pool
+        self.cache = cache
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        # Dashboards may keep a copy but must revalidate it with the ETag
+        self.set_header("Cache-Control", "no-cache")
+
+    def compute_etag(self):
+        # Report handlers set their own ETag before running the query
+        return None
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+
+class VersionsHandler(ApiHandler):
+    async def get(self):
+        self.write(await self.pool.run(schema.table_versions))
+
+
+def _shard_versions(tables):
+    with Database.reading() as conn:
+        return schema.table_versions(conn, tables)
+
+
+def table_versions(conn, tables):
+    """Versions of the tables, from every shard when the data is sharded."""
+    if shards.enabled():
+        return [sorted(versions.items()) for versions in shards.gather(_shard_versions, tables)]
+    return sorted(schema.table_versions(conn, tables).items())
+
+
+def report_connection(conn):
+    # Sharded reports fan out over the shards themselves instead of using the pooled connection
+    return None if shards.enabled() else conn
+
+
+class ReportHandler(ApiHandler):
+    # Tables the report reads; their versions make up the ETag
+    tables = ()
+    # Optional query arguments passed on to build() after the dates
+    filters = ("supervisor",)
+
+    def build(self, conn, start, end, supervisor):
+        """The report body as JSON bytes."""
+        raise NotImplementedError
+
+    def _date(self, name):
+        value = self.get_query_argument(name, None)
+        if value is None:
+            raise tornado.web.HTTPError(400, reason=f"missing {name} (YYYY-MM-DD)")
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason=f"{name} must be YYYY-MM-DD")
+
+    async def get(self):
+        start, end = self._date("start"), self._date("end")
+        filters = [self.get_query_argument(name, None) for name in self.filters]
+
+        versions = await self.pool.run(table_versions, self.tables)
+        key = json.dumps([self.request.path, str(start), str(end), *filters, versions])
+        etag = '"' + hashlib.sha1(key.encode("utf-8")).hexdigest() + '"'
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        body = self.cache.get(etag)
+        if body is None:
+            body = await self.pool.run(self.build, start, end, *filters)
+            self.cache.put(etag, body)
+        self.write(body)
+
+
+class WorkshopHandler(ReportHandler):
+    # User_Credentials for the org tree the supervisor filter reads
+    tables = ("Workstation_Data", "User_Credentials")
+
+    def build(self, conn, start, end, supervisor):
+        totals = workshop.workshop_totals(start, end, supervisor, conn=report_connection(conn))
+        return frame_json(totals, start=str(start), end=str(end), supervisor=supervisor)
+
+
+class AdvisorHandler(ReportHandler):
+    tables = ("Advisor_Data", "User_Credentials")
+
+    def build(self, conn, start, end, supervisor):
+        totals = advisor.advisor_totals(start, end, supervisor, conn=report_connection(conn))
+        return frame_json(totals, start=str(start), end=str(end), supervisor=supervisor)
+
+
+class AttendanceHandler(ReportHandler):
+    tables = ("Attendance", "User_Credentials")
+    filters = ("supervisor", "scope")
+
+    def build(self, conn, start, end, supervisor, scope):
+        summary = reports.attendance_summary(start.strftime(clock.ATTENDANCE_DATE_FORMAT), end.strftime(clock.ATTENDANCE_DATE_FORMAT),
+                                             supervisor, chunk_rows=reports.CHUNK_ROWS, conn=report_connection(conn), scope=scope)
+        return frame_json(summary, start=str(start), end=str(end), supervisor=supervisor, scope=scope)
+
+
+def _changes(conn, since, limit):
+    rows = changes.since(since, limit + 1, conn=conn)
+    records = []
+    for row in rows.head(limit).to_dict(orient="records"):
+        row["Row_Key"] = json.loads(row["Row_Key"])
+        # Passwords are never logged (schema.CHANGE_LOG_EXCLUDED)
+        row["Row_Data"] = json.loads(row["Row_Data"]) if row["Row_Data"] else None
+        records.append(row)
+    return {"since": since, "last": records[-1]["Seq"] if records else since, "more": len(rows) > limit, "rows": records}
+
+
+def _shard_changes(path, since, limit):
+    conn = Database.get_read_connection(path)
+    try:
+        return _changes(conn, since, limit)
+    finally:
+        conn.close()
+
+
+class ChangesHandler(ApiHandler):
+    async def get(self):
+        try:
+            since = int(self.get_query_argument("since", "0"))
+            limit = min(int(self.get_query_argument("limit", str(changes.CHUNK_ROWS))), changes.CHUNK_ROWS)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="since and limit must be integers")
+        shard = self.get_query_argument("shard", None)
+        if shard is None:
+            body = await self.pool.run(_changes, since, limit)
+        elif shards.enabled() and os.path.exists(shards.shard_path(shard)):
+            body = await self.pool.run(lambda conn: _shard_changes(shards.shard_path(shard), since, limit))
+        else:
+            raise tornado.web.HTTPError(404, reason=f"no shard {shard}")
+        self.write(json.dumps(body, default=_json_default))
+
+
+def make_app(pool, cache=None):
+    args = {"pool": pool, "cache": cache or ResponseCache()}
+    return tornado.web.Application([
+        (r"/api/versions", VersionsHandler, args),
+        (r"/api/changes", ChangesHandler, args),
+        (r"/api/workshop", WorkshopHandler, args),
+        (r"/api/advisor", AdvisorHandler, args),
+        (r"/api/attendance", AttendanceHandler, args),
+    ], compress_response=True)
+
+
+async def serve(address, port, pool_size):
+    make_app(ReadPool(size=pool_size)).listen(port, address)
+    print(f"serving on http://{address}:{port}/api/")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="read-only connections / worker threads")
+    parser.add_argument("-C", "--directory", help="app folder holding the database (default: current)")
+    args = parser.parse_args()
+    if args.directory:
+        os.chdir(args.directory)
+
+    # Table_Versions and its triggers have to exist before read-only connections can use them
+    schema.create_tables()
+    asyncio.run(serve(args.address, args.port, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import Profiler
+import SqlTrace
+
+DB_PATH = "Tools_And_Tools.sqlite"
+
+# Seconds a connection waits on a locked database before raising "database is locked"
+BUSY_TIMEOUT = 30
+
+# Write coordinator settings
+WRITE_QUEUE_SIZE = 256       # pending writes before callers are pushed back
+MAX_BATCH_SIZE = 64          # writes folded into one group commit
+WRITE_TIMEOUT = 60           # seconds a caller waits for its write to finish
+WRITER_BUSY_TIMEOUT = 2      # the writer gives up quickly and retries with backoff instead
+MAX_RETRIES = 8
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 2.0
+METRICS_WINDOW = 2000        # latency samples kept for the percentiles
+
+# Report reads: read-only connections whose scans come from memory-mapped pages.
+# TOOLS_READ_ONLY_REPORTS=0 sends them over ordinary read-write connections again.
+READ_ONLY_REPORTS = os.environ.get("TOOLS_READ_ONLY_REPORTS", "1") != "0"
+READ_MMAP_SIZE = int(os.environ.get("TOOLS_READ_MMAP_SIZE", 256 * 1024 * 1024))
+READ_CACHE_KB = int(os.environ.get("TOOLS_READ_CACHE_KB", 64 * 1024))
+
+_configured_paths = set()
+_configure_lock = threading.Lock()
+
+# Database file that calls without an explicit path go to in this thread/task,
+# e.g. a supervisor's shard. None means DB_PATH.
+_route = contextvars.ContextVar("database_route", default=None)
+
+
+def route(path):
+    """Send this thread's default-path connections and writes to another file (None: back to DB_PATH)."""
+    _route.set(path)
+
+
+def routed_path():
+    return _route.get()
+
+
+@contextmanager
+def routed(path):
+    token = _route.set(path)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+def resolve_path(path=None):
+    if path is not None:
+        return path
+    return _route.get() or DB_PATH
+
+
+class WriteQueueFull(sqlite3.OperationalError):
+    """Raised when the writer is so far behind that the queue stayed full for WRITE_TIMEOUT."""
+
+
+class WriteTimedOut(sqlite3.OperationalError):
+    """Raised when a write was still queued after the caller's timeout; it was withdrawn and never applied."""
+
+
+def is_busy_error(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED errors that are worth retrying."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _configure_database(path):
+    # WAL lets readers keep reading while a writer holds the lock. The mode is
+    # stored in the file, so this only has to happen once per process.
+    with _configure_lock:
+        if path in _configured_paths:
+            return
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.OperationalError:
+            # Another process is switching the mode right now, it will be WAL either way
+            pass
+        finally:
+            conn.close()
+        _configured_paths.add(path)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports statement time and returned rows to Profiler and SqlTrace.
+
+    Rows read by iterating the cursor are counted here and reported once, when
+    it runs out, runs another statement or is closed; their fetch time is not
+    measured, so iteration costs no more per row than a plain cursor.
+    """
+
+    _statement = ""
+    _iterated = 0
+
+    def execute(self, sql, parameters=()):
+        self._report_iterated()
+        self._statement = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            Profiler.record_sql(sql, elapsed)
+            SqlTrace.record(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._report_iterated()
+        self._statement = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            Profiler.record_sql(sql, elapsed)
+            SqlTrace.record(self.connection, sql, (), elapsed)
+
+    def _fetched(self, rows, seconds):
+        Profiler.record_fetch(rows, seconds)
+        SqlTrace.record_rows(self._statement, rows)
+
+    def _report_iterated(self):
+        if self._iterated:
+            rows, self._iterated = self._iterated, 0
+            self._fetched(rows, 0.0)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(0 if row is None else 1, time.perf_counter() - start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._report_iterated()
+            raise
+        self._iterated += 1
+        return row
+
+    def close(self):
+        self._report_iterated()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) are ProfiledCursors."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3's C implementation of these does not go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Helper function for database connection management
+def get_db_connection(path=None, check_same_thread=True):
+    path = resolve_path(path)
+    _configure_database(path)
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread, factory=ProfiledConnection)
+
+
+def get_read_connection(path=None, check_same_thread=True):
+    """A read-only connection: it can never take the write lock, so it never holds up a punch-in.
+
+    Pages are read through an mmap of READ_MMAP_SIZE bytes and a READ_CACHE_KB
+    page cache, so a long scan copies little through the read() path. Files
+    attached to it (the yearly archives) are opened read-only as well.
+    """
+    path = resolve_path(path)
+    _configure_database(path)
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread, factory=ProfiledConnection)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA mmap_size = {int(READ_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = -{int(READ_CACHE_KB)}")
+    return conn
+
+
+@contextmanager
+def connection(conn=None, path=None):
+    """Use the caller's connection if it passed one, else open one and close it afterwards."""
+    if conn is not None:
+        yield conn
+        return
+    conn = get_db_connection(path)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_report_connection(path=None):
+    """Connection for reports and exports: get_read_connection() unless READ_ONLY_REPORTS is off."""
+    return get_read_connection(path) if READ_ONLY_REPORTS else get_db_connection(path)
+
+
+@contextmanager
+def reading(conn=None, path=None):
+    """Like connection(), but opens a report connection."""
+    if conn is not None:
+        yield conn
+        return
+    conn = get_report_connection(path)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _percentile(samples, percent):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _WriteJob:
+    __slots__ = ("fn", "future", "enqueued_at")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class WriteCoordinator:
+    """Single writer thread that funnels every write for one database file.
+
+    Callers hand in a function taking a connection. The writer drains up to
+    MAX_BATCH_SIZE queued functions, runs each inside its own savepoint and
+    commits them together, so a burst of punch-ins costs one fsync instead of
+    one per technician. SQLITE_BUSY (e.g. another process holding the lock)
+    is retried with exponential backoff instead of surfacing to the user.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.connection = None
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._latencies = deque(maxlen=METRICS_WINDOW)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "writes": 0,
+            "failed_writes": 0,
+            "batches": 0,
+            "busy_retries": 0,
+            "max_queue_depth": 0,
+        }
+        self._thread = threading.Thread(target=self._run, name=f"sqlite-writer:{path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Queue fn(conn) for the writer thread and return a Future with its result."""
+        job = _WriteJob(fn)
+        try:
+            self._queue.put(job, timeout=WRITE_TIMEOUT)
+        except queue.Full:
+            raise WriteQueueFull("database is busy, too many pending writes") from None
+        with self._stats_lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+        return job.future
+
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def _connect(self):
+        _configure_database(self.path)
+        conn = sqlite3.connect(self.path, timeout=WRITER_BUSY_TIMEOUT, check_same_thread=False, factory=ProfiledConnection)
+        # Transactions are managed explicitly by the batch loop
+        conn.isolation_level = None
+        return conn
+
+    def _run(self):
+        conn = self.connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Jobs whose caller gave up waiting were cancelled and must not be written
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._run_batch(conn, batch)
+            except Exception as e:
+                # The connection is in an unknown state, fail the batch and start over
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                conn = self.connection = self._connect()
+
+    def _run_batch(self, conn, batch):
+        attempt = 0
+        while True:
+            try:
+                results = self._execute_batch(conn, batch)
+                break
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not is_busy_error(e) or attempt >= MAX_RETRIES:
+                    raise
+                with self._stats_lock:
+                    self._stats["busy_retries"] += 1
+                time.sleep(min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                attempt += 1
+
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            for job, _, error in results:
+                self._stats["writes"] += 1
+                if error is not None:
+                    self._stats["failed_writes"] += 1
+                self._latencies.append(finished - job.enqueued_at)
+
+        for job, result, error in results:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def _execute_batch(self, conn, batch):
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for job in batch:
+            # Each write gets a savepoint so one bad row does not sink the whole group commit
+            conn.execute("SAVEPOINT write_job")
+            try:
+                result = job.fn(conn)
+            except Exception as e:
+                if is_busy_error(e):
+                    raise
+                conn.execute("ROLLBACK TO write_job")
+                conn.execute("RELEASE write_job")
+                results.append((job, None, e))
+            else:
+                conn.execute("RELEASE write_job")
+                results.append((job, result, None))
+        conn.execute("COMMIT")
+        return results
+
+    def metrics(self):
+        """Latency percentiles (ms), queue depth and counters for the admin page."""
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            stats = dict(self._stats)
+        p50 = _percentile(latencies, 50)
+        p99 = _percentile(latencies, 99)
+        stats.update({
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": WRITE_QUEUE_SIZE,
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "avg_batch_size": round(stats["writes"] / stats["batches"], 2) if stats["batches"] else None,
+        })
+        return stats
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path=None):
+    """Return the process wide write coordinator for a database file."""
+    path = resolve_path(path)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = WriteCoordinator(path)
+        return writer
+
+
+def run_write(fn, path=None, timeout=WRITE_TIMEOUT, label=None):
+    """Run fn(conn) on the writer thread, wait for the commit and return fn's result.
+
+    Exceptions raised by fn (e.g. sqlite3.IntegrityError) are re-raised here.
+    fn must not commit or roll back itself. A write still queued after timeout
+    is withdrawn and WriteTimedOut raised, so a failed save never lands later;
+    one the writer has already started is waited for.
+    """
+    writer = get_writer(path)
+    if writer.in_writer_thread():
+        # Already inside a write job, just run it in the current transaction
+        return fn(writer.connection)
+    start = time.perf_counter()
+    try:
+        future = writer.submit(fn)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if not future.cancel():
+                # Already in the writer's transaction: its outcome is the answer
+                return future.result()
+            raise WriteTimedOut("database is busy, the write was not saved") from None
+    finally:
+        # The caller's wait (queue + group commit) is what the page pays for the write
+        Profiler.record_sql(label or f"write: {getattr(fn, '__name__', 'job')}", time.perf_counter() - start)
+
+
+def execute_write(query, params=(), path=None):
+    """Run a single write statement through the coordinator and return its rowcount."""
+    return run_write(lambda conn: conn.execute(query, params).rowcount, path, label=query)
+
+
+def sql_values(row):
+    """A DataFrame row as SQLite parameters: NaN, NaT and pd.NA as NULL, numpy scalars (nullable dtypes) as Python values."""
+    return tuple(None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value for value in row)
+
+
+def insert_dataframe(conn, table_name, df):
+    """Append DataFrame rows to a table inside a write job (a commit-free to_sql)."""
+    columns = ", ".join(f'"{column}"' for column in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    rows = (sql_values(row) for row in df.itertuples(index=False, name=None))
+    conn.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})", rows)
+
+
+def write_metrics(path=None):
+    return get_writer(path).metrics()
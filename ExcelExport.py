@@ -0,0 +1,172 @@
+import io
+import re
+import zipfile
+import datetime
+import numbers
+from xml.sax.saxutils import escape
+
+# Rows are buffered and flushed to the ZIP stream in chunks of this size
+FLUSH_ROWS = 1000
+
+# Characters that are not allowed in XML 1.0 documents
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Style 0 is the default cell, style 1 is the bold header row (same as pandas' header)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_SHEET_FOOTER = '</sheetData></worksheet>'
+
+
+def column_letter(index):
+    """Convert a zero based column index to an Excel column name (0 -> A, 26 -> AA)."""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _text_cell(ref, value, style=""):
+    value = _ILLEGAL_XML_CHARS.sub("", value)
+    return f'<c r="{ref}" t="inlineStr"{style}><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+
+
+def _cell(ref, value):
+    # Empty cells are simply skipped, the same way openpyxl leaves them out
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Number):
+        # NaN and infinity have no representation in a numeric cell
+        if value != value or value in (float("inf"), float("-inf")):
+            return ""
+        if isinstance(value, numbers.Integral):
+            return f'<c r="{ref}"><v>{int(value)}</v></c>'
+        return f'<c r="{ref}"><v>{float(value)!r}</v></c>'
+    if isinstance(value, datetime.datetime):
+        if value != value:  # NaT
+            return ""
+        return _text_cell(ref, value.strftime("%Y-%m-%d %H:%M:%S"))
+    if isinstance(value, datetime.date):
+        return _text_cell(ref, value.strftime("%Y-%m-%d"))
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return _text_cell(ref, str(value))
+
+
+def write_xlsx(target, columns, rows, sheet_name="Sheet1", progress=None):
+    """Stream a header row and an iterable of rows into an .xlsx file.
+
+    target can be a path or a binary file object. Rows are written straight into
+    the ZIP container as they are consumed, so memory use does not grow with the
+    number of rows. progress, if given, is called with the rows written so far
+    every FLUSH_ROWS rows. Returns the number of data rows written.
+    """
+    letters = [column_letter(i) for i in range(len(columns))]
+    row_count = 0
+
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+        zipf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zipf.writestr("_rels/.rels", _ROOT_RELS)
+        zipf.writestr("xl/workbook.xml", _WORKBOOK.format(sheet_name=escape(sheet_name, {'"': "&quot;"})))
+        zipf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zipf.writestr("xl/styles.xml", _STYLES)
+
+        with zipf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEADER.encode("utf-8"))
+
+            header = "".join(_text_cell(f"{letter}1", str(column), ' s="1"') for letter, column in zip(letters, columns))
+            buffer = [f'<row r="1">{header}</row>']
+
+            for row_number, row in enumerate(rows, start=2):
+                cells = "".join(_cell(f"{letter}{row_number}", value) for letter, value in zip(letters, row))
+                buffer.append(f'<row r="{row_number}">{cells}</row>')
+                row_count += 1
+                if len(buffer) >= FLUSH_ROWS:
+                    sheet.write("".join(buffer).encode("utf-8"))
+                    buffer = []
+                    if progress is not None:
+                        progress(row_count)
+
+            buffer.append(_SHEET_FOOTER)
+            sheet.write("".join(buffer).encode("utf-8"))
+
+    return row_count
+
+
+def dataframe_to_xlsx(df, sheet_name="Sheet1"):
+    """Serialize a DataFrame (without its index) to .xlsx bytes."""
+    output = io.BytesIO()
+    write_xlsx(output, list(df.columns), df.itertuples(index=False, name=None), sheet_name)
+    return output.getvalue()
+
+
+def query_to_xlsx(conn, query, params=(), target=None, sheet_name="Sheet1", progress=None):
+    """Run a query and stream its cursor into an .xlsx file without building a DataFrame.
+
+    When target is None the workbook is returned as bytes, otherwise it is
+    written to the given path or file object and the row count is returned.
+    """
+    cursor = conn.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+
+    if target is not None:
+        return write_xlsx(target, columns, cursor, sheet_name, progress)
+
+    output = io.BytesIO()
+    write_xlsx(output, columns, cursor, sheet_name, progress)
+    return output.getvalue()
@@ -0,0 +1,171 @@
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Finished page/function timings kept in memory for the Performance page
+RING_SIZE = 1000
+# Individual SQL statements kept for the "slowest queries" table
+QUERY_RING_SIZE = 2000
+# Lines of cProfile output kept per capture
+CPROFILE_LINES = 40
+
+_records = deque(maxlen=RING_SIZE)
+_queries = deque(maxlen=QUERY_RING_SIZE)
+_lock = threading.Lock()
+
+# Streamlit runs every script run of a session on its own thread, so the
+# records that are currently open are tracked per thread
+_local = threading.local()
+
+
+class Record:
+    """Timing of one call of a profiled entry point."""
+
+    __slots__ = ("name", "started_at", "wall_time", "sql_count", "sql_time", "rows", "cprofile_text")
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.wall_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.cprofile_text = None
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_time * 1000, 2),
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_time * 1000, 2),
+            "rows": self.rows,
+        }
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def profile_block(name, cprofile=False):
+    """Time a block and attribute the SQL run inside it to `name`.
+
+    Blocks can be nested, SQL is counted for every open block. With cprofile=True
+    the block also runs under cProfile and the top functions end up in
+    record.cprofile_text.
+    """
+    record = Record(name)
+    stack = _stack()
+    stack.append(record)
+    profiler = cProfile.Profile() if cprofile else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record.wall_time = time.perf_counter() - start
+        stack.pop()
+        if profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(CPROFILE_LINES)
+            record.cprofile_text = output.getvalue()
+        with _lock:
+            _records.append(record)
+
+
+def profiled(name=None):
+    """Decorator form of profile_block, named after the function by default."""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_block(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_sql(statement, seconds):
+    """Called by Database for every statement run while a block is open."""
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return
+    for record in stack:
+        record.sql_count += 1
+        record.sql_time += seconds
+    with _lock:
+        _queries.append((stack[-1].name, " ".join(statement.split()), seconds))
+
+
+def record_fetch(rows, seconds):
+    """Rows returned by a cursor, the time spent fetching them counts as SQL time."""
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return
+    for record in stack:
+        record.rows += rows
+        record.sql_time += seconds
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def page_summary():
+    """Per entry point call count and p50/p95 of wall and SQL time."""
+    with _lock:
+        records = list(_records)
+
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record.name, []).append(record)
+
+    summary = []
+    for name, items in grouped.items():
+        walls = [r.wall_time * 1000 for r in items]
+        summary.append({
+            "Page": name,
+            "Calls": len(items),
+            "p50_ms": round(_percentile(walls, 50), 2),
+            "p95_ms": round(_percentile(walls, 95), 2),
+            "Avg_SQL_Statements": round(sum(r.sql_count for r in items) / len(items), 1),
+            "Avg_SQL_ms": round(sum(r.sql_time for r in items) * 1000 / len(items), 2),
+            "Avg_Rows": round(sum(r.rows for r in items) / len(items), 1),
+        })
+    return sorted(summary, key=lambda row: row["p95_ms"], reverse=True)
+
+
+def slowest_queries(limit=20):
+    with _lock:
+        queries = list(_queries)
+    queries.sort(key=lambda query: query[2], reverse=True)
+    return [
+        {"Page": page, "Statement": statement, "ms": round(seconds * 1000, 2)}
+        for page, statement, seconds in queries[:limit]
+    ]
+
+
+def recent_records():
+    with _lock:
+        return [record.as_dict() for record in _records]
+
+
+def clear():
+    with _lock:
+        _records.clear()
+        _queries.clear()
@@ -0,0 +1,300 @@
+"""Run several app workers on one host behind a local proxy with sticky sessions.
+
+    python Serve.py --port 8501                # one worker per CPU core
+    python Serve.py --port 8501 --workers 4
+
+A Streamlit process runs every session's pandas, openpyxl and PIL work under
+one GIL, so a large export stalls every punch-in in the same process. Serve.py
+starts --workers `streamlit run ToolsAndTools.py` processes on 127.0.0.1
+(ports --worker-port, --worker-port + 1, ...) and a proxy on --port in front
+of them. The workers share the database (WAL, so readers never wait for the
+writer and writers wait for each other through busy_timeout) and Images/
+through the filesystem.
+
+A browser is pinned to one worker by the tools_worker cookie. Its websocket,
+file uploads and media downloads must all reach the process that holds its
+session. New browsers go to the healthy worker with the fewest open sessions.
+A worker that exits is started again. Its browsers move to another worker and
+have to log in again, since Streamlit keeps the session in process memory.
+
+    GET /healthz   the proxy's view of every worker as JSON, 503 when none is up
+
+Per-process state stays per worker. That covers the login rate limits (a
+client that drops the cookie can spread attempts over the workers), the
+Performance page timings and the report caches. Each worker also has its own
+job pool for report builds (services.jobs, TOOLS_JOB_WORKERS processes).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import tornado.httpclient
+import tornado.web
+import tornado.websocket
+
+DEFAULT_PORT = 8501
+DEFAULT_WORKER_PORT = 8601
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ToolsAndTools.py")
+COOKIE = "tools_worker"
+# Seconds between worker health checks, and before a worker that exited is started again
+HEALTH_INTERVAL = 2
+RESTART_DELAY = 1
+# Largest request body passed on, e.g. an upload; Streamlit's own limit is server.maxUploadSize (200 MB)
+MAX_BODY_BYTES = 200 * 1024 * 1024
+
+# Headers that describe one connection and are not passed on
+HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+               "transfer-encoding", "upgrade", "content-length"}
+
+
+class Worker:
+    """One `streamlit run` process and what the proxy knows about it."""
+
+    def __init__(self, index, port, directory, extra_args=()):
+        self.index = index
+        self.port = port
+        self.directory = directory
+        self.extra_args = list(extra_args)
+        self.process = None
+        self.healthy = False
+        self.sessions = 0
+        self.starts = 0
+        self.exited_at = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        command = [sys.executable, "-m", "streamlit", "run", APP, "--server.port", str(self.port),
+                   "--server.address", "127.0.0.1", "--server.headless", "true", *self.extra_args]
+        self.process = subprocess.Popen(command, cwd=self.directory, env={**os.environ, "TOOLS_WORKER": str(self.index)})
+        self.starts += 1
+        self.healthy = False
+        self.exited_at = None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def as_dict(self):
+        return {"index": self.index, "port": self.port, "pid": self.process.pid if self.process else None,
+                "healthy": self.healthy, "sessions": self.sessions, "starts": self.starts}
+
+
+class Pool:
+    """The workers, their health, and which one a browser is pinned to."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        # Made in serve(), on the proxy's event loop
+        self.client = None
+
+    def pick(self, cookie):
+        """The browser's worker if it is still healthy, otherwise the healthy one with the fewest sessions."""
+        if cookie is not None and cookie.isdigit() and int(cookie) < len(self.workers):
+            worker = self.workers[int(cookie)]
+            if worker.healthy:
+                return worker
+        healthy = [worker for worker in self.workers if worker.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda worker: (worker.sessions, worker.index))
+
+    async def check(self, worker):
+        if worker.process.poll() is not None:
+            # Exited: wait a moment so a worker that fails on start does not spin
+            worker.healthy = False
+            worker.exited_at = worker.exited_at or time.monotonic()
+            if time.monotonic() - worker.exited_at >= RESTART_DELAY:
+                worker.start()
+            return
+        try:
+            response = await self.client.fetch(f"{worker.url}/_stcore/health", request_timeout=HEALTH_INTERVAL)
+            worker.healthy = response.code == 200
+        except Exception:
+            worker.healthy = False
+
+    async def watch(self):
+        while True:
+            await asyncio.gather(*(self.check(worker) for worker in self.workers))
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+# Set by the proxy itself; whatever the client sent under these names is dropped
+FORWARDED_HEADERS = {"x-forwarded-for", "x-real-ip", "x-forwarded-proto"}
+
+
+def forwarded_headers(request):
+    headers = {name: value for name, value in request.headers.get_all()
+               if name.lower() not in HOP_HEADERS and name.lower() not in FORWARDED_HEADERS}
+    # The login rate limit is per client address (ToolsAndTools.client_address), so only
+    # the peer this proxy saw is passed on, never a client-supplied chain
+    headers["X-Forwarded-For"] = headers["X-Real-Ip"] = request.remote_ip
+    headers["X-Forwarded-Proto"] = request.protocol
+    return headers
+
+
+class PinnedHandler:
+    """Picks the worker for a request and pins the browser to it."""
+
+    def worker(self):
+        worker = self.pool.pick(self.get_cookie(COOKIE))
+        if worker is None:
+            raise tornado.web.HTTPError(503, reason="no app worker is up")
+        if self.get_cookie(COOKIE) != str(worker.index):
+            self.set_cookie(COOKIE, str(worker.index), httponly=True, samesite="Lax")
+        return worker
+
+
+class ProxyHandler(PinnedHandler, tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS")
+
+    def initialize(self, pool):
+        self.pool = pool
+
+    async def _forward(self):
+        worker = self.worker()
+        request = tornado.httpclient.HTTPRequest(
+            worker.url + self.request.uri, method=self.request.method, headers=forwarded_headers(self.request),
+            body=self.request.body if self.request.method in ("POST", "PUT", "PATCH") else None,
+            follow_redirects=False, decompress_response=False, allow_nonstandard_methods=True, request_timeout=600)
+        response = await self.pool.client.fetch(request, raise_error=False)
+        if response.code == 599:
+            raise tornado.web.HTTPError(502, reason=f"worker {worker.index} did not answer")
+        self.set_status(response.code, response.reason)
+        self._headers.pop("Content-Type", None)
+        for name, value in response.headers.get_all():
+            if name.lower() not in HOP_HEADERS and name.lower() not in ("server", "date"):
+                self.add_header(name, value)
+        if response.code != 304 and response.body:
+            self.write(response.body)
+
+    get = head = post = put = delete = patch = options = _forward
+
+
+class StreamHandler(PinnedHandler, tornado.websocket.WebSocketHandler):
+    """Streamlit's websocket (/_stcore/stream), relayed to the browser's worker."""
+
+    def initialize(self, pool):
+        self.pool = pool
+        self.upstream = None
+        self.worker_used = None
+
+    def check_origin(self, origin):
+        # The worker applies Streamlit's own origin check to the headers passed on
+        return True
+
+    def select_subprotocol(self, subprotocols):
+        # Streamlit sends its protocol name first, then the XSRF token and session id
+        return subprotocols[0] if subprotocols else None
+
+    async def open(self):
+        self.worker_used = self.worker()
+        request = tornado.httpclient.HTTPRequest(
+            self.worker_used.url.replace("http", "ws", 1) + self.request.uri, headers=forwarded_headers(self.request))
+        subprotocols = [value.strip() for value in self.request.headers.get("Sec-WebSocket-Protocol", "").split(",") if value.strip()]
+        try:
+            self.upstream = await tornado.websocket.websocket_connect(request, subprotocols=subprotocols or None,
+                                                                      max_message_size=MAX_BODY_BYTES)
+        except Exception:
+            self.close(1011, "app worker unavailable")
+            return
+        self.worker_used.sessions += 1
+        asyncio.ensure_future(self._relay())
+
+    async def _relay(self):
+        while True:
+            message = await self.upstream.read_message()
+            if message is None:
+                break
+            try:
+                await self.write_message(message, binary=isinstance(message, bytes))
+            except tornado.websocket.WebSocketClosedError:
+                break
+        self.close()
+
+    async def on_message(self, message):
+        if self.upstream is not None:
+            await self.upstream.write_message(message, binary=isinstance(message, bytes))
+
+    def on_close(self):
+        if self.upstream is not None:
+            self.upstream.close()
+            self.upstream = None
+            self.worker_used.sessions -= 1
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, pool):
+        self.pool = pool
+
+    def get(self):
+        workers = [worker.as_dict() for worker in self.pool.workers]
+        up = sum(worker["healthy"] for worker in workers)
+        self.set_status(200 if up else 503)
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Cache-Control", "no-store")
+        self.write(json.dumps({"healthy": up, "workers": workers}))
+
+
+def make_app(pool):
+    args = {"pool": pool}
+    return tornado.web.Application([
+        (r"/healthz", HealthHandler, args),
+        (r"/_stcore/stream", StreamHandler, args),
+        (r"/.*", ProxyHandler, args),
+    ], websocket_max_message_size=MAX_BODY_BYTES)
+
+
+async def serve(address, port, pool):
+    tornado.httpclient.AsyncHTTPClient.configure(None, max_clients=256)
+    pool.client = tornado.httpclient.AsyncHTTPClient()
+    make_app(pool).listen(port, address, max_body_size=MAX_BODY_BYTES)
+    print(f"serving {len(pool.workers)} workers on http://{address}:{port}/ (health: /healthz)")
+    await pool.watch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--address", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="app processes (default: CPU cores)")
+    parser.add_argument("--worker-port", type=int, default=DEFAULT_WORKER_PORT, help="first worker's port on 127.0.0.1")
+    parser.add_argument("-C", "--directory", help="app folder holding the database and Images/ (default: current)")
+    args, streamlit_args = parser.parse_known_args()
+    directory = os.path.abspath(args.directory or os.getcwd())
+
+    # Create the tables once here, so the workers do not all start on an empty file at the same time
+    sys.path.insert(0, os.path.dirname(APP))
+    os.chdir(directory)
+    from services import schema
+    schema.create_tables()
+
+    # Anything not recognised above (e.g. --server.maxUploadSize 50) goes to every worker
+    workers = [Worker(index, args.worker_port + index, directory, streamlit_args) for index in range(args.workers)]
+    pool = Pool(workers)
+    for worker in workers:
+        worker.start()
+    try:
+        asyncio.run(serve(args.address, args.port, pool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Statements slower than this (ms) go to the slow query log with their query plan
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+# Set SQL_TRACE=0 to switch the tracer off
+ENABLED = os.environ.get("SQL_TRACE", "1") != "0"
+# Latency samples kept per fingerprint for the percentiles
+SAMPLES_PER_FINGERPRINT = 200
+
+_PLANNABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_lock = threading.Lock()
+_fingerprints = {}
+_logger = None
+
+
+class FingerprintStats:
+    __slots__ = ("fingerprint", "count", "total_time", "max_time", "rows", "samples", "plan", "example")
+
+    def __init__(self, fingerprint, example):
+        self.fingerprint = fingerprint
+        self.example = example
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES_PER_FINGERPRINT)
+        self.plan = None
+
+    def as_dict(self):
+        ordered = sorted(self.samples)
+
+        def percentile(percent):
+            if not ordered:
+                return None
+            index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+            return round(ordered[index] * 1000, 3)
+
+        return {
+            "fingerprint": self.fingerprint,
+            "example": self.example,
+            "count": self.count,
+            "total_ms": round(self.total_time * 1000, 3),
+            "avg_ms": round(self.total_time * 1000 / self.count, 3) if self.count else None,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "max_ms": round(self.max_time * 1000, 3),
+            "rows": self.rows,
+            "plan": self.plan,
+        }
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(statement):
+    """Normalise a statement so calls that only differ by values group together."""
+    text = _COMMENT.sub(" ", statement)
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = " ".join(text.split())
+    text = _IN_LIST.sub("IN (?+)", text)
+    return text
+
+
+def _slow_log():
+    global _logger
+    with _lock:
+        if _logger is None:
+            logger = logging.getLogger("toolsapp.slow_queries")
+            logger.propagate = False
+            # The logger outlives a reload of this module; keep it to one file handler
+            if not logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(
+                    SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            _logger = logger
+    return _logger
+
+
+def explain(conn, statement, params=()):
+    """EXPLAIN QUERY PLAN for a statement, as 'detail' lines, or None if it has none."""
+    if not statement.lstrip().upper().startswith(_PLANNABLE):
+        return None
+    try:
+        # The base class method keeps the plan lookup itself out of the trace
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + statement, params).fetchall()
+    except sqlite3.Error:
+        return None
+    return [row[-1] for row in rows]
+
+
+def record(conn, statement, params, seconds):
+    """Called by Database for every executed statement."""
+    if not ENABLED:
+        return
+    key = fingerprint(statement)
+    slow = seconds * 1000 >= SLOW_QUERY_MS
+
+    with _lock:
+        stats = _fingerprints.get(key)
+        if stats is None:
+            stats = _fingerprints[key] = FingerprintStats(key, " ".join(statement.split()))
+        stats.count += 1
+        stats.total_time += seconds
+        stats.max_time = max(stats.max_time, seconds)
+        stats.samples.append(seconds)
+        need_plan = slow and stats.plan is None
+
+    if not slow:
+        return
+
+    plan = explain(conn, statement, params if isinstance(params, (tuple, list, dict)) else ())
+    if need_plan:
+        with _lock:
+            stats.plan = plan
+    _slow_log().info(json.dumps({
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ms": round(seconds * 1000, 3),
+        "fingerprint": key,
+        "statement": " ".join(statement.split()),
+        "params": [repr(value)[:80] for value in params] if isinstance(params, (tuple, list)) else None,
+        "plan": plan,
+    }))
+
+
+def record_rows(statement, rows):
+    if not ENABLED or not rows:
+        return
+    key = fingerprint(statement)
+    with _lock:
+        stats = _fingerprints.get(key)
+        if stats is not None:
+            stats.rows += rows
+
+
+def snapshot():
+    """All fingerprints with their stats, most total time first."""
+    with _lock:
+        stats = [entry.as_dict() for entry in _fingerprints.values()]
+    return sorted(stats, key=lambda entry: entry["total_ms"], reverse=True)
+
+
+def export_json(path=None):
+    """Dump the trace as JSON (to path if given) so index changes can be replayed against real traffic."""
+    data = json.dumps({
+        "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "slow_query_ms": SLOW_QUERY_MS,
+        "fingerprints": snapshot(),
+    }, indent=2)
+    if path is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+    return data
+
+
+def reset():
+    with _lock:
+        _fingerprints.clear()
@@ -0,0 +1,334 @@
+"""Bulk import, export and reports without Streamlit.
+
+Run from the app folder (or point -C at it):
+
+    python ToolsCli.py import users users.xlsx
+    python ToolsCli.py import attendance attendance.csv --dry-run
+    python ToolsCli.py export-all --output backup.zip
+    python ToolsCli.py attendance-report --start 2024-11-01 --end 2024-11-30 --output november.xlsx
+    python ToolsCli.py attendance-exceptions --start 2024-01-01 --end 2024-12-31 --shift-start 09:00 --output late.xlsx
+    python ToolsCli.py attendance-report --start 2024-11-01 --end 2024-11-30 --scope MGR01 --output region.xlsx
+    python ToolsCli.py workshop-report --start 2024-11-01 --end 2024-11-30 --supervisor SV001 --output ws.csv
+    python ToolsCli.py advisor-report --start 2024-11-01 --end 2024-11-30 --output advisors.xlsx
+    python ToolsCli.py images --output photos.zip
+    TOOLS_SHARDS=shards python ToolsCli.py shard-split
+    python ToolsCli.py archive --vacuum
+    python ToolsCli.py backup
+    python ToolsCli.py restore latest --verify-only
+    python ToolsCli.py changes --since 1200 --output changes.jsonl
+    python ToolsCli.py mirror reporting.sqlite
+    python ToolsCli.py snapshot
+    python ToolsCli.py hash-passwords
+    TOOLS_SUPER_ADMIN_HASH="$(python ToolsCli.py hash-password)" streamlit run ToolsAndTools.py
+
+The archive command is meant for a nightly scheduled job: it moves months
+closed more than --keep-days ago into archive/Tools_And_Tools_<year>.sqlite,
+keeping monthly rollups in the live file so the reports stay the same.
+
+The backup command copies the live database page by page while the app
+keeps running, gzips it into backups/ with a manifest of the photos and
+archive files, and keeps the newest --keep snapshots. restore checks a
+snapshot before putting it back; stop the app first.
+
+changes writes what was inserted, updated or deleted after a Change_Log
+sequence number and prints the last one, to pass as --since next time;
+mirror keeps a copy of the database current the same way.
+
+snapshot writes the Parquet copies that TOOLS_SNAPSHOTS=1 reports read
+(snapshots/ beside the database); run it after a large import or on a
+schedule so the first report of the day does not pay for the refresh.
+
+Imports are validated with the same rules as the upload pages, read in chunks
+and loaded in one write. Exports stream from the database cursor to the output
+file, so memory stays flat however large the tables are.
+"""
+import argparse
+import getpass
+import os
+import sys
+from datetime import date
+
+import Database
+import ExcelExport
+from services import (advisor, analytics, archive, backup, bulk, changes, clock, images, passwords, reports, schema, shards, snapshots,
+                      users, workshop)
+from services.errors import ServiceError
+
+
+def write_frame(df, output):
+    """Write a report DataFrame to .csv or .xlsx, by the output's extension."""
+    if output.lower().endswith(".csv"):
+        df.to_csv(output, index=False)
+    else:
+        ExcelExport.write_xlsx(output, list(df.columns), df.itertuples(index=False, name=None))
+    return len(df)
+
+
+def cmd_import(args):
+    load = bulk.import_users if args.table == "users" else bulk.import_attendance
+    rows = load(args.file, chunk_rows=args.chunk_rows, dry_run=args.dry_run)
+    verb = "validated" if args.dry_run else "imported"
+    print(f"{verb} {rows} rows from {args.file}")
+
+
+def cmd_export_all(args):
+    output = args.output or reports.archive_name()
+    reports.export_archive(target=output)
+    print(f"wrote {output}")
+
+
+def cmd_attendance_report(args):
+    start = args.start.strftime(clock.ATTENDANCE_DATE_FORMAT)
+    end = args.end.strftime(clock.ATTENDANCE_DATE_FORMAT)
+    summary = reports.attendance_summary(start, end, args.supervisor, chunk_rows=args.chunk_rows, scope=args.scope)
+    print(f"wrote {write_frame(summary, args.output)} technicians to {args.output}")
+
+
+def cmd_attendance_exceptions(args):
+    start = args.start.strftime(clock.ATTENDANCE_DATE_FORMAT)
+    end = args.end.strftime(clock.ATTENDANCE_DATE_FORMAT)
+    exceptions = analytics.attendance_analytics(start, end, args.supervisor, shift_start=args.shift_start,
+                                                grace_minutes=args.grace_minutes, standard_hours=args.standard_hours,
+                                                scope=args.scope)
+    print(f"wrote {write_frame(exceptions, args.output)} technicians to {args.output}")
+
+
+def cmd_workshop_report(args):
+    totals = workshop.workshop_totals(args.start, args.end, args.supervisor)
+    print(f"wrote {write_frame(totals, args.output)} workstations to {args.output}")
+
+
+def cmd_advisor_report(args):
+    totals = advisor.advisor_totals(args.start, args.end, args.supervisor)
+    print(f"wrote {write_frame(totals, args.output)} advisors to {args.output}")
+
+
+def cmd_images(args):
+    images.zip_folder(target=args.output)
+    print(f"wrote {args.output}")
+
+
+def cmd_shard_split(args):
+    if not shards.enabled():
+        print("error: set TOOLS_SHARDS to the folder the shards should live in", file=sys.stderr)
+        return 1
+    for table_name, rows in shards.split(args.chunk_rows).items():
+        print(f"moved {rows} {table_name} rows into {shards.SHARDS_DIR}")
+
+
+def database_paths():
+    """The main file, after every shard when the data is sharded."""
+    return (shards.paths() if shards.enabled() else []) + [Database.DB_PATH]
+
+
+def cmd_archive(args):
+    # Each shard keeps its own archive folder beside it
+    for path in database_paths():
+        with Database.routed(path):
+            stats = archive.run(args.keep_days, vacuum=args.vacuum)
+        rows = ", ".join(f"{rows} {table_name}" for table_name, rows in stats["rows"].items())
+        print(f"{path}: archived through {stats['archived_through']}: {rows} rows "
+              f"(commit {stats['commit_ms']} ms, {stats['seconds']} s)")
+
+
+def cmd_backup(args):
+    for path in database_paths():
+        with Database.routed(path):
+            stats = backup.snapshot(keep=args.keep, pages=args.pages)
+        print(f"{path}: {stats['name']}: {stats['pages']} pages in {stats['steps']} steps, {stats['restarts']} restarts, "
+              f"{stats['copy_seconds']} s copying, writer stall max {stats['stall_max_ms']} ms; "
+              f"{stats['gzip_bytes']} bytes gzipped, {stats['new_files']} of {stats['files']} files new")
+
+
+def cmd_backups(args):
+    for path in database_paths():
+        with Database.routed(path):
+            for manifest in backup.snapshots():
+                print(f"{path}: {manifest['name']}  {manifest['created']}  {len(manifest['files'])} files")
+
+
+def cmd_restore(args):
+    for path in database_paths():
+        with Database.routed(path):
+            if args.verify_only:
+                tables = backup.verify(args.snapshot)
+                print(f"{path}: {args.snapshot} is intact, {sum(tables.values())} rows in {len(tables)} tables")
+            else:
+                stats = backup.restore(args.snapshot)
+                print(f"{path}: restored {stats['name']}, {sum(stats['tables'].values())} rows, "
+                      f"{stats['files_restored']} of {stats['files']} files put back")
+
+
+def shard_database(args):
+    """The file a single-database command works on: a shard with --shard, else the main file."""
+    if args.shard and not shards.enabled():
+        raise ServiceError("--shard needs TOOLS_SHARDS set")
+    return shards.ensure(args.shard) if args.shard else Database.DB_PATH
+
+
+def cmd_changes(args):
+    with Database.routed(shard_database(args)):
+        rows, last = changes.export(args.since, args.output, args.table)
+    print(f"wrote {rows} changes to {args.output}; next --since {last}")
+
+
+def cmd_mirror(args):
+    with Database.routed(shard_database(args)):
+        applied, seq = changes.sync_mirror(args.target)
+    print(f"{args.target}: {'copied in full' if not applied else f'applied {applied} changes'}, up to Seq {seq}")
+
+
+def cmd_prune_changes(args):
+    for path in database_paths():
+        with Database.routed(path):
+            print(f"{path}: removed {changes.prune(args.keep_days)} Change_Log rows")
+
+
+def cmd_snapshot(args):
+    for path in database_paths():
+        with Database.routed(path):
+            stats = snapshots.refresh(force=args.rebuild)
+        if stats["rebuilt"]:
+            rows = ", ".join(f"{rows} {table_name}" for table_name, rows in stats["rows"].items())
+            print(f"{path}: rebuilt {stats['generation']} up to Seq {stats['seq']}: {rows} rows ({stats['seconds']} s)")
+        else:
+            print(f"{path}: {stats['changes']} changes, {stats['partitions']} month files rewritten, up to Seq {stats['seq']}")
+
+
+def cmd_hash_password(args):
+    password = getpass.getpass("Password: ")
+    if password != getpass.getpass("Again: "):
+        print("error: the passwords differ", file=sys.stderr)
+        return 1
+    print(passwords.hash_password(password))
+
+
+def cmd_hash_passwords(args):
+    print(f"hashed {users.hash_stored_passwords()} plaintext passwords")
+
+
+SCOPE_HELP = "supervisor or manager code: everyone anywhere under them"
+
+
+def add_range(parser, supervisor_help):
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--supervisor", help=supervisor_help)
+    parser.add_argument("--output", required=True, help=".xlsx or .csv")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ToolsCli.py", description=__doc__.splitlines()[0])
+    parser.add_argument("-C", "--directory", help="app folder holding the database and Images/ (default: current)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="replace User_Credentials or Attendance from a .xlsx/.csv file")
+    command.add_argument("table", choices=["users", "attendance"])
+    command.add_argument("file")
+    command.add_argument("--dry-run", action="store_true", help="validate only, leave the table alone")
+    command.add_argument("--chunk-rows", type=int, default=bulk.CHUNK_ROWS, help="rows held in memory at once")
+    command.set_defaults(handler=cmd_import)
+
+    command = commands.add_parser("export-all", help="every table as .xlsx plus the photos, in one ZIP")
+    command.add_argument("--output", help="default: today's date, as the Download All Reports button names it")
+    command.set_defaults(handler=cmd_export_all)
+
+    command = commands.add_parser("attendance-report", help="days, hours and Sundays per technician")
+    add_range(command, "supervisor name")
+    command.add_argument("--scope", help=SCOPE_HELP)
+    command.add_argument("--chunk-rows", type=int, default=reports.CHUNK_ROWS, help="attendance rows held in memory at once")
+    command.set_defaults(handler=cmd_attendance_report)
+
+    command = commands.add_parser("attendance-exceptions", help="late arrivals, missing punch-outs and overtime per technician")
+    add_range(command, "supervisor name")
+    command.add_argument("--scope", help=SCOPE_HELP)
+    command.add_argument("--shift-start", help=f"HH:MM (default {analytics.SHIFT_START})")
+    command.add_argument("--grace-minutes", type=int, help=f"default {analytics.LATE_GRACE_MINUTES}")
+    command.add_argument("--standard-hours", type=float, help=f"overtime starts after this (default {analytics.STANDARD_SHIFT_HOURS:g})")
+    command.set_defaults(handler=cmd_attendance_exceptions)
+
+    command = commands.add_parser("workshop-report", help="sales totals per workstation")
+    add_range(command, "supervisor code, covering every supervisor under them")
+    command.set_defaults(handler=cmd_workshop_report)
+
+    command = commands.add_parser("advisor-report", help="sales totals per advisor")
+    add_range(command, "supervisor code, covering every supervisor under them")
+    command.set_defaults(handler=cmd_advisor_report)
+
+    command = commands.add_parser("images", help="ZIP of the Images/ folder")
+    command.add_argument("--output", required=True)
+    command.set_defaults(handler=cmd_images)
+
+    command = commands.add_parser("shard-split", help="move the main file's attendance and sales rows into per-supervisor shards")
+    command.add_argument("--chunk-rows", type=int, default=bulk.CHUNK_ROWS, help="rows held in memory at once")
+    command.set_defaults(handler=cmd_shard_split)
+
+    command = commands.add_parser("archive", help="move closed months into yearly archive files, keeping monthly rollups")
+    command.add_argument("--keep-days", type=int, default=archive.KEEP_DAYS,
+                         help="only months that ended this many days ago are moved")
+    command.add_argument("--vacuum", action="store_true", help="also VACUUM the live file (blocks writers while it runs)")
+    command.set_defaults(handler=cmd_archive)
+
+    command = commands.add_parser("backup", help="online snapshot of the database, photos and archive files into backups/")
+    command.add_argument("--keep", type=int, default=backup.KEEP, help="snapshots to keep")
+    command.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP, help="pages copied per step")
+    command.set_defaults(handler=cmd_backup)
+
+    command = commands.add_parser("backups", help="list the snapshots")
+    command.set_defaults(handler=cmd_backups)
+
+    command = commands.add_parser("restore", help="verify a snapshot and put it back (stop the app first)")
+    command.add_argument("snapshot", nargs="?", default="latest", help="snapshot name or timestamp (default: latest)")
+    command.add_argument("--verify-only", action="store_true", help="check the snapshot, leave the live data alone")
+    command.set_defaults(handler=cmd_restore)
+
+    command = commands.add_parser("changes", help="inserts, updates and deletes after a Change_Log sequence number")
+    command.add_argument("--since", type=int, default=0, help="last Seq already seen (default: everything still logged)")
+    command.add_argument("--table", action="append", choices=list(schema.CHANGE_LOGGED_TABLES), help="repeat for several")
+    command.add_argument("--output", required=True, help=".jsonl or .csv")
+    command.add_argument("--shard", help="supervisor code of the shard to read (TOOLS_SHARDS)")
+    command.set_defaults(handler=cmd_changes)
+
+    command = commands.add_parser("mirror", help="bring a copy of the database up to date from Change_Log")
+    command.add_argument("target", help="mirror .sqlite file, created on the first run")
+    command.add_argument("--shard", help="supervisor code of the shard to mirror (TOOLS_SHARDS)")
+    command.set_defaults(handler=cmd_mirror)
+
+    command = commands.add_parser("snapshot", help="bring the Parquet report snapshots (TOOLS_SNAPSHOTS) up to date")
+    command.add_argument("--rebuild", action="store_true", help="write them again from scratch")
+    command.set_defaults(handler=cmd_snapshot)
+
+    command = commands.add_parser("hash-password", help="print the hash of a password, e.g. for TOOLS_SUPER_ADMIN_HASH")
+    command.set_defaults(handler=cmd_hash_password)
+
+    command = commands.add_parser("hash-passwords", help="replace plaintext passwords in User_Credentials with hashes")
+    command.set_defaults(handler=cmd_hash_passwords)
+
+    command = commands.add_parser("prune-changes", help="drop old Change_Log rows")
+    command.add_argument("--keep-days", type=int, default=changes.KEEP_DAYS)
+    command.set_defaults(handler=cmd_prune_changes)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.directory:
+        # Outputs given as relative paths still land where the command was run
+        for name in ("output", "file", "target"):
+            if getattr(args, name, None):
+                setattr(args, name, os.path.abspath(getattr(args, name)))
+        # The database and Images/ are resolved relative to the working directory
+        os.chdir(args.directory)
+    # Older files may predate Archive_State and the rollup tables the reports read
+    schema.create_tables()
+    try:
+        return args.handler(args) or 0
+    except ServiceError as e:
+        print(f"error: {e}", file=sys.stderr)
+        for problem in getattr(e, "problems", None) or []:
+            print(f"  {problem}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Time the app's core functions headlessly against a synthetic database.
+
+Run from the repository root:
+
+    python -m benchmarks --supervisors 5 --technicians 20 --days 90 --output bench.json
+    python -m benchmarks --output new.json --baseline bench.json
+
+Streamlit runs in bare mode, so st.* calls inside the timed functions are
+no-ops. Every run generates a fresh database from --seed, so two commits
+benchmarked with the same arguments see the same data.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from benchmarks import synthetic
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=synthetic.REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, repeat):
+    """Call fn() `repeat` times and return min/median/max wall time in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def build_cases(app, workdir, days):
+    """(name, callable) pairs, each callable being one call of the function under test."""
+    import pandas as pd
+
+    import Database
+    from services import advisor, analytics, credentials, leaderboard, reports, users, workshop
+
+    db_path = os.path.join(workdir, synthetic.DB_FILE)
+    technicians = synthetic.technicians(db_path)
+    photos = synthetic.sample_photos()
+    today = datetime.now(pytz.timezone("Asia/Kolkata")).date()
+    start_date = (today - timedelta(days=days)).strftime("%d-%m-%Y")
+    end_date = today.strftime("%d-%m-%Y")
+    first_supervisor = technicians[0][2]
+
+    conn = Database.get_db_connection()
+    attendance = pd.read_sql_query("SELECT * FROM Attendance", conn)
+    conn.close()
+
+    calls = {"login": 0, "punch": 0, "photo": 0}
+
+    def login():
+        # The lookup and hash check alone; the login rate limiter would refuse repeated logins of one code
+        code = technicians[calls["login"] % len(technicians)][0]
+        calls["login"] += 1
+        assert users.authenticate(code, synthetic.password_for(code)) is not None
+
+    token = credentials.start_session({"code": technicians[0][0], "name": technicians[0][1], "role": "Technician"})
+
+    def punch():
+        # Today is never in the generated history, so every technician has one fresh punch
+        code, name, _ = technicians[calls["punch"] % len(technicians)]
+        calls["punch"] += 1
+        app.insert_attendance(code, name, "Workstation 1-1", "09.01.05 AM", f"Images/{code}_in.jpg", None, None, None, None)
+        app.insert_attendance(code, name, "Workstation 1-1", None, None, "06.31.45 PM", f"Images/{code}_out.jpg", None, None)
+
+    def photo():
+        index = calls["photo"]
+        calls["photo"] += 1
+        app.save_image(photos[index % len(photos)], technicians[index % len(technicians)][0], "in")
+
+    def table(name):
+        conn = Database.get_db_connection()
+        df = pd.read_sql_query(f"SELECT * FROM {name}", conn)
+        conn.close()
+        return df
+
+    def workshop_report():
+        workshop.summarize_workshop_data(table("Workstation_Data"), today - timedelta(days=days), today)
+
+    def advisor_report():
+        advisor.summarize_advisor_data(table("Advisor_Data"), today - timedelta(days=days), today)
+
+    return [
+        ("authenticate_user", login),
+        ("session check (every rerun)", lambda: credentials.session_user(token)),
+        ("insert_attendance (in + out)", punch),
+        ("save_image", photo),
+        # The pages build these in the job pool (services.jobs); timed here as the build itself
+        ("generate_attendance_report", lambda: reports.attendance_report(start_date, end_date)),
+        ("generate_sv_attendance_report", lambda: reports.attendance_report(start_date, end_date, first_supervisor)),
+        ("attendance_analytics", lambda: analytics.attendance_analytics(start_date, end_date)),
+        ("workshop_report", workshop_report),
+        ("leaderboard", lambda: leaderboard.leaderboard(day=today)),
+        ("advisor_report", advisor_report),
+        ("overwrite_table (Attendance)", lambda: app.overwrite_table("Attendance", attendance)),
+        ("download_all_reports", reports.export_archive),
+    ]
+
+
+def compare(results, baseline, threshold):
+    """Print median deltas against a previous run. Returns the names that got slower than threshold."""
+    regressions = []
+    print(f"\n{'benchmark':<32}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<32}{'-':>14}{current['median_ms']:>14.2f}{'new':>10}")
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1 if previous["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  <-- slower"
+        print(f"{name:<32}{previous['median_ms']:>14.2f}{current['median_ms']:>14.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--supervisors", type=int, default=5)
+    parser.add_argument("--workstations", type=int, default=4, help="per supervisor")
+    parser.add_argument("--advisors", type=int, default=3, help="per workstation")
+    parser.add_argument("--technicians", type=int, default=20, help="per supervisor")
+    parser.add_argument("--days", type=int, default=90, help="days of history")
+    parser.add_argument("--photo-days", type=int, default=1, help="days of history that get photos on disk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", help="run only benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="median slowdown that counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the generated working directory")
+    args = parser.parse_args()
+
+    sys.path.insert(0, synthetic.REPO_DIR)
+    workdir = tempfile.mkdtemp(prefix="tools_bench_")
+    rows = synthetic.generate_database(workdir, args.supervisors, args.workstations, args.advisors,
+                                       args.technicians, args.days, args.photo_days, args.seed)
+    print(f"generated {workdir}: " + ", ".join(f"{table}={count}" for table, count in rows.items()), file=sys.stderr)
+
+    # The app resolves its database, Images/ and export folders relative to the working directory
+    os.chdir(workdir)
+    import ToolsAndTools as app
+
+    results = {}
+    try:
+        for name, fn in build_cases(app, workdir, args.days):
+            if args.only and not any(part in name for part in args.only):
+                continue
+            results[name] = measure(fn, args.repeat)
+            print(f"{name:<32}{results[name]['median_ms']:>10.2f} ms", file=sys.stderr)
+    finally:
+        os.chdir(synthetic.REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {
+            "supervisors": args.supervisors,
+            "workstations": args.workstations,
+            "advisors": args.advisors,
+            "technicians": args.technicians,
+            "days": args.days,
+            "photo_days": args.photo_days,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "rows": rows,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != report["scale"]:
+            print("\nwarning: baseline was run at a different scale", file=sys.stderr)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
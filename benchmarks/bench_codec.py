@@ -0,0 +1,99 @@
+"""Decode, encode and output size of each image codec backend on the sample photos.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_codec --repeat 3
+
+Every photo in Images/ is run as it is (camera-sized frames) and scaled up
+--upscale times (phone-sized uploads, where reduced JPEG decoding matters).
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from benchmarks.synthetic import SAMPLE_IMAGES
+from services import codecs, images
+
+
+def sample_sets(upscale, limit):
+    names = sorted(name for name in os.listdir(SAMPLE_IMAGES) if name.endswith(".jpg"))[:limit]
+    camera = []
+    for name in names:
+        with open(os.path.join(SAMPLE_IMAGES, name), "rb") as file:
+            camera.append(file.read())
+    large = []
+    for data in camera:
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        image = image.resize((image.width * upscale, image.height * upscale))
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=92)
+        large.append(output.getvalue())
+    return {"camera": camera, f"x{upscale}": large}
+
+
+def baseline_compress(data, max_bytes=images.MAX_PHOTO_BYTES):
+    # compress_photo before the codec backends: full decode, one encode per quality step
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    quality = 95
+    while True:
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality)
+        if output.tell() <= max_bytes or quality <= 5:
+            return output.getvalue()
+        quality -= 5
+
+
+def timed_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def run_codec(codec, photos, repeat):
+    decode_ms, encode_ms, compress_ms, sizes = [], [], [], []
+    for data in photos:
+        elapsed, image = timed_ms(lambda: codec.decode(data), repeat)
+        decode_ms.append(elapsed)
+        elapsed, _ = timed_ms(lambda: codec.encode(image, 85), repeat)
+        encode_ms.append(elapsed)
+        elapsed, stored = timed_ms(lambda: images.compress_photo(data, codec=codec.name), repeat)
+        compress_ms.append(elapsed)
+        sizes.append(len(stored))
+    return {
+        "decode_ms": round(statistics.median(decode_ms), 3),
+        "encode_q85_ms": round(statistics.median(encode_ms), 3),
+        "compress_photo_ms": round(statistics.median(compress_ms), 3),
+        "output_bytes": round(statistics.mean(sizes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per photo; the fastest counts")
+    parser.add_argument("--limit", type=int, default=40, help="sample photos used")
+    parser.add_argument("--upscale", type=int, default=4)
+    args = parser.parse_args()
+
+    results = {}
+    for set_name, photos in sample_sets(args.upscale, args.limit).items():
+        results[set_name] = {"photos": len(photos), "input_bytes": round(statistics.mean(len(data) for data in photos))}
+        baseline = [timed_ms(lambda: baseline_compress(data), args.repeat) for data in photos]
+        results[set_name]["baseline"] = {
+            "compress_photo_ms": round(statistics.median(elapsed for elapsed, _ in baseline), 3),
+            "output_bytes": round(statistics.mean(len(stored) for _, stored in baseline)),
+        }
+        for name in codecs.CODECS:
+            results[set_name][name] = run_codec(codecs.get_codec(name), photos, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
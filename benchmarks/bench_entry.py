@@ -0,0 +1,112 @@
+"""Count the reruns and SQL statements of one data-entry session on each entry screen.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_entry --supervisors 2 --technicians 5 --days 30
+
+Each session opens a screen, keys in a new value for every figure and
+submits. Streamlit's AppTest drives the app; the counts follow what a
+browser would do. Changing a widget outside a form reruns the script,
+and one inside a form does not. A rerun caused by a widget inside a
+fragment only reruns the fragment. AppTest always reruns the whole
+script, so for those steps only the SQL of the fragment and of the form
+callback is counted, taken from the Profiler records.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+from benchmarks import synthetic
+
+APP = "import ToolsAndTools\nToolsAndTools.run_app()\n"
+
+# screen -> (login code, sidebar choice, fragment record, form callback record)
+SCREENS = {
+    "workstation": ("WS00101", "Daily Workstation Data Entry", "Advisor.workstation_entry", "Advisor.save_workstation_day"),
+    "advisor": ("WS00101", "Daily Advisor Data Entry", "Advisor.advisor_entry", "Advisor.save_advisor_day"),
+    "supervisor": ("SV001", "Sales Admin", "workstation_entry_by_supervisor", "save_supervisor_entry"),
+}
+
+
+class Session:
+    def __init__(self, app_file, code, password):
+        import Profiler
+        from streamlit.testing.v1 import AppTest
+
+        self.profiler = Profiler
+        self.at = AppTest.from_file(app_file, default_timeout=120).run()
+        self.at.text_input[0].input(code)
+        self.at.text_input[1].input(password)
+        self.at.button[0].click().run()
+        self.steps = []
+
+    def run(self, fragment, callback):
+        """Rerun, and count it the way a browser would have run it."""
+        before = len(self.profiler.recent_records())
+        self.at.run()
+        records = self.profiler.recent_records()[before:]
+        in_fragment = [r for r in records if r["name"] == fragment]
+        scope = in_fragment or [r for r in records if r["name"] == "main"]
+        sql = sum(r["sql_count"] for r in scope) + sum(r["sql_count"] for r in records if r["name"] == callback)
+        self.steps.append(("fragment" if in_fragment else "script", sql))
+
+    def totals(self):
+        return {
+            "script_reruns": sum(1 for kind, _ in self.steps if kind == "script"),
+            "fragment_reruns": sum(1 for kind, _ in self.steps if kind == "fragment"),
+            "sql_statements": sum(sql for _, sql in self.steps),
+        }
+
+
+def enter_figures(session, fragment, callback):
+    at = session.at
+    # Before forms, rows had to be unlocked with an Edit checkbox first
+    for index in range(len(at.checkbox)):
+        box = at.checkbox[index]
+        if box.key and box.key.startswith("edit_") and not box.value:
+            box.check()
+            session.run(fragment, callback)
+    for index in range(len(at.number_input)):
+        widget = at.number_input[index]
+        widget.set_value(widget.value + 1)
+        if not widget.form_id:
+            session.run(fragment, callback)
+    # The advisor grid had no submit button before it was a form
+    submit = next((button for button in at.button if button.label == "Submit Data"), None)
+    if submit is not None:
+        submit.click()
+        session.run(fragment, callback)
+    return submit is not None, [element.value for element in at.exception]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--supervisors", type=int, default=2)
+    parser.add_argument("--technicians", type=int, default=5, help="technicians per supervisor")
+    parser.add_argument("--days", type=int, default=30, help="days of synthetic history")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_entry_")
+    results = {}
+    try:
+        with synthetic.working_directory(workdir):
+            synthetic.generate_database(workdir, supervisors=args.supervisors, technicians=args.technicians,
+                                        days=args.days, photo_days=0)
+            app_file = os.path.join(workdir, "bench_entry_app.py")
+            with open(app_file, "w") as f:
+                f.write(APP)
+            for screen, (code, choice, fragment, callback) in SCREENS.items():
+                session = Session(app_file, code, synthetic.password_for(code))
+                session.at.sidebar.selectbox[0].select(choice).run()
+                submitted, exceptions = enter_figures(session, fragment, callback)
+                results[screen] = {**session.totals(), "submitted": submitted, "exceptions": exceptions}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the openpyxl export path with the streaming ExcelExport writer.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_excel --rows 100000
+"""
+import argparse
+import io
+import json
+import sqlite3
+import time
+
+import pandas as pd
+
+import ExcelExport
+
+
+def build_attendance(conn, rows):
+    """Fill an Attendance table with rows shaped like real punches."""
+    conn.execute('''CREATE TABLE Attendance (
+                        Code TEXT, Name TEXT, Workstation_Name TEXT, Attendance_Date TEXT,
+                        In_Time TEXT, In_Time_Photo_Link TEXT, Out_Time TEXT, Out_Time_Photo_Link TEXT,
+                        Supervisor_Name TEXT, Shift_Duration TEXT, Holiday INTEGER, Holiday_Remarks TEXT,
+                        PRIMARY KEY (Code, Attendance_Date))''')
+
+    def generate():
+        for i in range(rows):
+            code = f"T{i % 500:03}"
+            day = f"{i // 500 % 28 + 1:02}-{i // 14000 % 12 + 1:02}-{2024 + i // 168000}"
+            yield (code, f"Technician {code}", f"Workstation {i % 40}", day,
+                   "09.02.11 AM", f"Images/{code}_{day}_in.jpg", "06.15.40 PM", f"Images/{code}_{day}_out.jpg",
+                   f"Supervisor {i % 12}", "9:13:29", None, None)
+
+    conn.executemany("INSERT INTO Attendance VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", generate())
+    conn.commit()
+
+
+def openpyxl_export(conn):
+    # The path download_data_as_excel used before ExcelExport
+    df = pd.read_sql_query("SELECT * FROM Attendance", conn)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+    return output.getvalue()
+
+
+def streaming_export(conn):
+    return ExcelExport.query_to_xlsx(conn, "SELECT * FROM Attendance")
+
+
+def timed(func, conn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = func(conn)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    build_attendance(conn, args.rows)
+
+    old_seconds, old_size = timed(openpyxl_export, conn, args.repeat)
+    new_seconds, new_size = timed(streaming_export, conn, args.repeat)
+
+    # Make sure the streamed workbook reads back to the same table
+    expected = pd.read_sql_query("SELECT * FROM Attendance LIMIT 1000", conn)
+    actual = pd.read_excel(io.BytesIO(streaming_export(conn)), nrows=1000)
+    assert list(actual.columns) == list(expected.columns)
+    assert actual["Code"].tolist() == expected["Code"].tolist()
+
+    print(json.dumps({
+        "rows": args.rows,
+        "openpyxl_seconds": round(old_seconds, 3),
+        "openpyxl_bytes": old_size,
+        "streaming_seconds": round(new_seconds, 3),
+        "streaming_bytes": new_size,
+        "speedup": round(old_seconds / new_seconds, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Measure how a report build on the app process slows other sessions, against building it in the job pool.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_jobs --supervisors 10 --technicians 30 --days 365
+
+While the Attendance workbook and the attendance report are built, a
+second thread stands in for another session: every 20 ms it runs a small
+pandas step of the kind a rerun does and records how long after it was
+due the step finished. With the build on a thread of the same process
+(how the pages ran it before) the two share one GIL; with services.jobs
+the build runs in a pool process.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+
+BUILDS = [("table_xlsx", ("Attendance",)), ("attendance_report", ("01-01-2000", "31-12-2100"))]
+
+
+def session_step(frame):
+    return frame.groupby("key")["value"].sum()
+
+
+def measure(run_builds):
+    """Run the builds while timing the other session's steps. Returns (build seconds, step milliseconds)."""
+    frame = pd.DataFrame({"key": np.arange(5000) % 50, "value": np.arange(5000)})
+    steps = []
+    done = threading.Event()
+
+    def other_session():
+        # Timed from when the step was due, so waiting for the GIL after the sleep counts
+        due = time.perf_counter()
+        while not done.is_set():
+            session_step(frame)
+            steps.append((time.perf_counter() - due) * 1000)
+            due = time.perf_counter() + 0.02
+            time.sleep(0.02)
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    started = time.perf_counter()
+    try:
+        run_builds()
+    finally:
+        seconds = time.perf_counter() - started
+        done.set()
+        thread.join()
+    return seconds, np.array(steps)
+
+
+def in_process():
+    from services import reports
+    for name, args in BUILDS:
+        builder = threading.Thread(target=getattr(reports, name), args=args)
+        builder.start()
+        builder.join()
+
+
+def in_pool():
+    from services import jobs, reports
+    for name, args in BUILDS:
+        job = jobs.submit(getattr(reports, name), *args)
+        while jobs.status(job)["state"] in ("queued", "running"):
+            time.sleep(0.05)
+        jobs.result(job)
+        jobs.discard(job)
+
+
+def summary(seconds, steps):
+    return {"build_seconds": round(seconds, 2), "steps": len(steps),
+            "step_p50_ms": round(float(np.percentile(steps, 50)), 2),
+            "step_p99_ms": round(float(np.percentile(steps, 99)), 2),
+            "step_max_ms": round(float(steps.max()), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--supervisors", type=int, default=10)
+    parser.add_argument("--technicians", type=int, default=30, help="technicians per supervisor")
+    parser.add_argument("--days", type=int, default=365, help="days of synthetic history")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_jobs_")
+    results = {}
+    try:
+        with synthetic.working_directory(workdir):
+            synthetic.generate_database(workdir, supervisors=args.supervisors, technicians=args.technicians,
+                                        days=args.days, photo_days=0)
+            results["idle"] = summary(*measure(lambda: time.sleep(2)))
+            results["app_process"] = summary(*measure(in_process))
+            # The first job also starts the pool's processes; time a second round
+            in_pool()
+            results["job_pool"] = summary(*measure(in_pool))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
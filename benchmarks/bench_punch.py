@@ -0,0 +1,179 @@
+"""Count statements and connections per punch for the old and the upsert attendance paths.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_punch --technicians 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import pytz
+
+import Database
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StatementCounter:
+    """Counts connections opened and statements run through Database."""
+
+    def __init__(self):
+        self.connections = 0
+        self.statements = 0
+        self._connect = Database.get_db_connection
+
+    def _trace(self, statement):
+        self.statements += 1
+
+    def _trace_writer(self, statement):
+        # Transaction control issued by the writer itself is not a round trip of the punch
+        if statement.split()[0].upper() not in ("BEGIN", "COMMIT", "SAVEPOINT", "RELEASE"):
+            self.statements += 1
+
+    def connect(self, *args, **kwargs):
+        self.connections += 1
+        conn = self._connect(*args, **kwargs)
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def install(self):
+        Database.get_db_connection = self.connect
+        writer = Database.get_writer()
+        # Wait for the writer thread to open its connection, then trace it as well
+        while writer.connection is None:
+            time.sleep(0.01)
+        writer.connection.set_trace_callback(self._trace_writer)
+
+    def reset(self):
+        self.connections = 0
+        self.statements = 0
+
+
+def legacy_punch_in(code, name, workstation, in_time, photo_link):
+    # has_in_time_recorded_today, fetch_supervisor_name and insert_attendance as they were
+    today_date = datetime.now(pytz.timezone('Asia/Kolkata')).strftime("%d-%m-%Y")
+
+    conn = Database.get_db_connection()
+    existing = conn.execute('SELECT * FROM Attendance WHERE Code = ? AND Attendance_Date = ?', (code, today_date)).fetchone()
+    conn.close()
+    if existing:
+        return
+
+    def supervisor_name():
+        conn = Database.get_db_connection()
+        supervisor_code = conn.execute('SELECT Supervisor_Code FROM User_Credentials WHERE Code = ?', (code,)).fetchone()[0]
+        name = conn.execute('SELECT Name FROM User_Credentials WHERE Code = ?', (supervisor_code,)).fetchone()[0]
+        conn.close()
+        return name
+
+    supervisor_name()  # technician_data looked it up once and threw it away
+
+    conn = Database.get_db_connection()
+    existing = conn.execute('SELECT * FROM Attendance WHERE Code = ? AND Attendance_Date = ?', (code, today_date)).fetchone()
+    if not existing:
+        conn.execute('''INSERT INTO Attendance (Code, Name, Workstation_Name, Attendance_Date, In_Time, In_Time_Photo_Link, Supervisor_Name)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (code, name, workstation, today_date, in_time, photo_link, supervisor_name()))
+    conn.commit()
+    conn.close()
+
+
+def legacy_punch_out(code, out_time, photo_link):
+    from ToolsAndTools import calculate_shift_duration
+
+    today_date = datetime.now(pytz.timezone('Asia/Kolkata')).strftime("%d-%m-%Y")
+
+    conn = Database.get_db_connection()
+    conn.execute('SELECT * FROM Attendance WHERE Code = ? AND Attendance_Date = ?', (code, today_date)).fetchone()
+    conn.close()
+
+    conn = Database.get_db_connection()
+    in_time = conn.execute('SELECT In_Time FROM Attendance WHERE Code = ? AND Attendance_Date = ?', (code, today_date)).fetchone()[0]
+    conn.close()
+
+    shift_duration = str(calculate_shift_duration(in_time, out_time))
+    conn = Database.get_db_connection()
+    conn.execute('SELECT * FROM Attendance WHERE Code = ? AND Attendance_Date = ?', (code, today_date)).fetchone()
+    conn.execute('''UPDATE Attendance SET Out_Time = ?, Out_Time_Photo_Link = ?, Shift_Duration = ?
+                    WHERE Code = ? AND Attendance_Date = ?''', (out_time, photo_link, shift_duration, code, today_date))
+    conn.commit()
+    conn.close()
+
+
+def upsert_punch_in(code, name, workstation, in_time, photo_link):
+    from ToolsAndTools import fetch_today_attendance
+    from services.attendance import punch_in
+
+    if fetch_today_attendance(code) is None:
+        punch_in(code, name, workstation, in_time, photo_link)
+
+
+def upsert_punch_out(code, out_time, photo_link):
+    from ToolsAndTools import fetch_today_attendance
+    from services.attendance import punch_out
+
+    if fetch_today_attendance(code) is not None:
+        punch_out(code, out_time, photo_link)
+
+
+def run_path(counter, technicians, punch_in, punch_out):
+    counter.reset()
+    start = time.perf_counter()
+    for code, name in technicians:
+        punch_in(code, name, "Workstation 1", "09.01.05 AM", f"Images/{code}_in.jpg")
+    for code, _ in technicians:
+        punch_out(code, "06.31.45 PM", f"Images/{code}_out.jpg")
+    elapsed = time.perf_counter() - start
+    punches = 2 * len(technicians)
+    return {
+        "seconds": round(elapsed, 3),
+        "statements_per_punch": round(counter.statements / punches, 2),
+        "connections_per_punch": round(counter.connections / punches, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--technicians", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_punch_")
+    shutil.copy(os.path.join(REPO_DIR, "Tools_And_Tools.sqlite"), workdir)
+    os.chdir(workdir)
+
+    conn = sqlite3.connect(Database.DB_PATH)
+    conn.execute("DELETE FROM Attendance")
+    conn.execute("INSERT OR REPLACE INTO User_Credentials (Code, Name, Password, Supervisor_Code, User_Role) VALUES ('BSV', 'Bench Supervisor', 'x', NULL, 'Supervisor')")
+    technicians = [(f"BT{i:04}", f"Bench Technician {i}") for i in range(args.technicians)]
+    conn.executemany("INSERT OR REPLACE INTO User_Credentials (Code, Name, Password, Supervisor_Code, User_Role) VALUES (?, ?, 'x', 'BSV', 'Technician')", technicians)
+    conn.commit()
+    conn.close()
+
+    counter = StatementCounter()
+    counter.install()
+
+    legacy = run_path(counter, technicians, legacy_punch_in, legacy_punch_out)
+    Database.execute_write("DELETE FROM Attendance")
+    upsert = run_path(counter, technicians, upsert_punch_in, upsert_punch_out)
+
+    check = sqlite3.connect(Database.DB_PATH)
+    complete = check.execute("SELECT COUNT(*) FROM Attendance WHERE Shift_Duration = '9:30:40' AND Supervisor_Name = 'Bench Supervisor'").fetchone()[0]
+    check.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({
+        "technicians": args.technicians,
+        "legacy": legacy,
+        "upsert": upsert,
+        "upsert_rows_complete": complete,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
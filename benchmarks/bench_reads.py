@@ -0,0 +1,144 @@
+"""Report scan times, and punch latency while reports run, with read-only report connections on and off.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reads --days 365 --technicians 40
+
+"off" sends the reports over ordinary read-write connections, as before;
+"on" uses Database.get_read_connection() (mode=ro, query_only, mmap_size,
+cache_size). Writer latency is measured for punches issued every
+--punch-interval seconds while --readers threads scan reports in a loop.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import Database
+from benchmarks import synthetic
+from services import advisor, attendance, reports, workshop
+
+
+def scans(days):
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days)
+    first, last = start.strftime("%d-%m-%Y"), end.strftime("%d-%m-%Y")
+    def page_scan():
+        # The SQLite side of a scan alone, without building Python rows
+        with Database.reading() as conn:
+            conn.execute("SELECT COUNT(*), SUM(LENGTH(Shift_Duration)), SUM(LENGTH(In_Time_Photo_Link)) FROM Attendance").fetchone()
+
+    return {
+        "page_scan Attendance": page_scan,
+        "attendance_summary": lambda: reports.attendance_summary(first, last),
+        "workshop_totals": lambda: workshop.workshop_totals(start, end),
+        "advisor_totals": lambda: advisor.advisor_totals(start, end),
+        "display_table Attendance": lambda: reports.table_frame("Attendance"),
+        "table_xlsx Workstation_Data": lambda: reports.table_xlsx("Workstation_Data"),
+    }
+
+
+def time_scans(cases, repeat):
+    results = {}
+    for name, fn in cases.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = round(statistics.median(timings), 1)
+    return results
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))], 2)
+
+
+def punch_latency(technicians, day, punches, interval, readers, cases):
+    """Latency of punch-in/punch-out writes while `readers` threads scan reports."""
+    stop = threading.Event()
+    scanned = [0]
+
+    def scan_loop():
+        while not stop.is_set():
+            for fn in cases.values():
+                fn()
+                scanned[0] += 1
+                if stop.is_set():
+                    return
+
+    threads = [threading.Thread(target=scan_loop, daemon=True) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    latencies, errors = [], 0
+    try:
+        for i in range(punches):
+            code, name, _ = technicians[i % len(technicians)]
+            start = time.perf_counter()
+            try:
+                if i < len(technicians):
+                    attendance.punch_in(code, name, "Workstation 1", "09.01.05 AM", f"Images/{code}_in.jpg", day)
+                else:
+                    attendance.punch_out(code, "06.31.45 PM", f"Images/{code}_out.jpg", day)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(interval)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return {
+        "punches": punches,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": round(max(latencies), 2),
+        "scans_completed": scanned[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365, help="days of synthetic history")
+    parser.add_argument("--supervisors", type=int, default=8)
+    parser.add_argument("--technicians", type=int, default=40, help="technicians per supervisor")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--readers", type=int, default=2, help="threads scanning reports during the punch test")
+    parser.add_argument("--punches", type=int, default=300)
+    parser.add_argument("--punch-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_reads_")
+    try:
+        with synthetic.working_directory(workdir):
+            counts = synthetic.generate_database(workdir, supervisors=args.supervisors, technicians=args.technicians,
+                                                 days=args.days, photo_days=0)
+            technicians = synthetic.technicians(synthetic.DB_FILE)
+            cases = scans(args.days)
+            results = {"rows": counts, "db_mb": round(os.path.getsize(synthetic.DB_FILE) / 2 ** 20, 1)}
+            # Each run punches on its own far-future day, outside the scanned range
+            for mode, read_only, day in (("off", False, "01-01-2099"), ("on", True, "02-01-2099")):
+                Database.READ_ONLY_REPORTS = read_only
+                time_scans(cases, 1)  # warm the OS page cache the same way for both
+                results[mode] = {
+                    "scan_ms": time_scans(cases, args.repeat),
+                    "punch_while_scanning": punch_latency(technicians, day, args.punches, args.punch_interval,
+                                                          args.readers, cases),
+                }
+            Database.READ_ONLY_REPORTS = True
+            results["punch_idle"] = punch_latency(technicians, "03-01-2099", args.punches, args.punch_interval, 0, cases)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
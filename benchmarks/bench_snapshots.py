@@ -0,0 +1,99 @@
+"""Multi-year Super Admin reports from SQLite and from the Parquet snapshots.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_snapshots --days 1095
+
+Builds a synthetic database, times the company-wide attendance summary and
+the workshop and advisor totals over the whole history both ways, checks
+that both give the same tables, and times the snapshot's full build and an
+incremental refresh after a day of punches and sales entries.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from benchmarks import synthetic
+from services import advisor, attendance, reports, snapshots, workshop
+
+
+def timed_ms(fn, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 1), result
+
+
+def report_cases(days):
+    end = date.today()
+    start = end - timedelta(days=days)
+    first, last = start.strftime("%d-%m-%Y"), end.strftime("%d-%m-%Y")
+    return {
+        "attendance_summary": lambda: reports.attendance_summary(first, last),
+        "workshop_totals": lambda: workshop.workshop_totals(start, end),
+        "advisor_totals": lambda: advisor.advisor_totals(start, end),
+    }
+
+
+def a_day_of_changes(technicians):
+    day = "01-01-2099"
+    for code, name, _ in technicians:
+        attendance.punch_in(code, name, "Workstation 1", "09.01.05 AM", f"Images/{code}_in.jpg", day)
+        attendance.punch_out(code, "06.31.45 PM", f"Images/{code}_out.jpg", day)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=1095, help="days of synthetic history")
+    parser.add_argument("--supervisors", type=int, default=6)
+    parser.add_argument("--technicians", type=int, default=30, help="technicians per supervisor")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_snapshots_")
+    try:
+        with synthetic.working_directory(workdir):
+            counts = synthetic.generate_database(workdir, supervisors=args.supervisors, technicians=args.technicians,
+                                                 days=args.days, photo_days=0)
+            cases = report_cases(args.days)
+            results = {"rows": counts, "sqlite_ms": {}, "snapshot_ms": {}, "same_result": {}}
+
+            snapshots.ENABLED = False
+            sqlite_results = {}
+            for name, fn in cases.items():
+                results["sqlite_ms"][name], sqlite_results[name] = timed_ms(fn, args.repeat)
+
+            snapshots.ENABLED = True
+            build = snapshots.refresh(force=True)
+            results["snapshot_build_s"] = build["seconds"]
+            results["snapshot_mb"] = round(sum(os.path.getsize(os.path.join(root, name))
+                                               for root, _, names in os.walk(snapshots.snapshot_dir())
+                                               for name in names) / 2 ** 20, 1)
+            for name, fn in cases.items():
+                results["snapshot_ms"][name], result = timed_ms(fn, args.repeat)
+                try:
+                    pd.testing.assert_frame_equal(sqlite_results[name], result)
+                    results["same_result"][name] = True
+                except AssertionError:
+                    results["same_result"][name] = False
+
+            technicians = synthetic.technicians(synthetic.DB_FILE)
+            a_day_of_changes(technicians)
+            results["incremental_refresh"] = snapshots.refresh()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
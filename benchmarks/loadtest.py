@@ -0,0 +1,327 @@
+"""Simulate a shift start: many technicians logging in and punching at once.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest --sessions 60 --concurrency 20 --ramp 10
+    python -m benchmarks.loadtest --driver direct --sessions 500 --concurrency 50
+
+Every session is one technician going through the real page with
+streamlit.testing's AppTest: log in, pick a workstation, send an In Time
+photo, then an Out Time photo. AppTest cannot drive st.camera_input, so the
+camera widget is replaced by one that returns the photo the session put in
+session_state, taken from the sample Images/. `--driver direct` skips the
+page and calls the same functions technician_data calls, which shows the
+ceiling of the database and image path on its own.
+
+The database is a synthetic one (see benchmarks/synthetic.py) in a temp
+directory, with at least as many technicians as sessions.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+
+from benchmarks import synthetic
+
+STEPS = ("login", "select_workstation", "punch_in", "punch_out")
+
+IN_PHOTO_KEY = "loadtest_in_photo"
+OUT_PHOTO_KEY = "loadtest_out_photo"
+
+
+# The AppTest script, the same entry point `streamlit run` uses. It is written
+# to disk once: AppTest.from_function rewrites its temp file on every call,
+# which races when sessions start in parallel.
+SESSION_SCRIPT = """import ToolsAndTools
+
+ToolsAndTools.run_app()
+"""
+
+
+def install_fake_camera():
+    """Replace st.camera_input with one that returns the photo the session was handed."""
+    import streamlit as st
+
+    def camera_input(label, *args, **kwargs):
+        key = IN_PHOTO_KEY if label.startswith("Start Shift") else OUT_PHOTO_KEY
+        photo = st.session_state.get(key)
+        return io.BytesIO(photo) if photo else None
+
+    st.camera_input = camera_input
+
+
+def share_apptest_runtime():
+    """Let AppTest sessions run on parallel threads.
+
+    Every AppTest run installs its own mock Runtime singleton and switches the
+    global.appTest option on, and puts both back when it finishes, which pulls
+    them out from under any other session still running. Sessions fall back to
+    one shared mock runtime instead, and the option stays on.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.runtime import Runtime
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared)
+    Runtime.exists = classmethod(lambda cls: True)
+    config.set_option("global.appTest", True)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(percent):
+        return round(ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))], 2)
+
+    return {"count": len(ordered), "p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "max_ms": round(ordered[-1], 2)}
+
+
+def is_lock_error(message):
+    message = message.lower()
+    return "locked" in message or "busy" in message
+
+
+class Results:
+    """Step latencies and failures collected from all session threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.sessions = []
+        self.completed = 0
+        self.errors = []
+        self.lock_errors = 0
+
+    def step(self, name, seconds):
+        with self.lock:
+            self.latencies[name].append(seconds * 1000)
+
+    def failure(self, code, step, message):
+        with self.lock:
+            self.errors.append({"code": code, "step": step, "error": message[:300]})
+            if is_lock_error(message):
+                self.lock_errors += 1
+
+    def finished(self, seconds):
+        with self.lock:
+            self.completed += 1
+            self.sessions.append(seconds * 1000)
+
+
+class StepFailed(Exception):
+    pass
+
+
+def _check(at, step):
+    """Raise StepFailed with the page's exception or error message, if it showed one."""
+    if at.exception:
+        raise StepFailed(at.exception[0].message)
+    if step != "select_workstation" and at.error:
+        raise StepFailed(at.error[0].value)
+
+
+def apptest_session(code, photo_in, photo_out, results, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.abspath("loadtest_session.py"), default_timeout=timeout)
+    step = "login"
+    started = time.perf_counter()
+    try:
+        at.run()
+        at.text_input[0].input(code)
+        at.text_input[1].input(synthetic.password_for(code))
+        start = time.perf_counter()
+        at.button[0].click().run()
+        results.step(step, time.perf_counter() - start)
+        _check(at, step)
+        if not at.selectbox:
+            raise StepFailed("no workstation selectbox after login")
+
+        step = "select_workstation"
+        options = [option for option in at.selectbox[0].options if option]
+        start = time.perf_counter()
+        at.selectbox[0].select(random.choice(options)).run()
+        results.step(step, time.perf_counter() - start)
+        _check(at, step)
+
+        step = "punch_in"
+        at.session_state[IN_PHOTO_KEY] = photo_in
+        start = time.perf_counter()
+        at.run()
+        results.step(step, time.perf_counter() - start)
+        _check(at, step)
+
+        step = "punch_out"
+        at.session_state[OUT_PHOTO_KEY] = photo_out
+        start = time.perf_counter()
+        at.run()
+        results.step(step, time.perf_counter() - start)
+        _check(at, step)
+    except Exception as e:
+        results.failure(code, step, str(e))
+        return
+    results.finished(time.perf_counter() - started)
+
+
+def direct_session(code, photo_in, photo_out, results, timeout):
+    import ToolsAndTools as app
+    from services import attendance
+
+    step = "login"
+    started = time.perf_counter()
+    try:
+        start = time.perf_counter()
+        user = app.authenticate_user(code, synthetic.password_for(code))
+        results.step(step, time.perf_counter() - start)
+        if user is None:
+            raise StepFailed("login rejected")
+
+        step = "select_workstation"
+        start = time.perf_counter()
+        workstation = random.choice(app.fetch_workstations())
+        app.fetch_today_attendance(code)
+        results.step(step, time.perf_counter() - start)
+
+        step = "punch_in"
+        start = time.perf_counter()
+        link = app.save_image(photo_in, code, "in")
+        attendance.punch_in(code, user["name"], workstation, time.strftime("%I.%M.%S %p"), link)
+        results.step(step, time.perf_counter() - start)
+
+        step = "punch_out"
+        start = time.perf_counter()
+        app.fetch_today_attendance(code)
+        link = app.save_image(photo_out, code, "out")
+        attendance.punch_out(code, time.strftime("%I.%M.%S %p"), link)
+        results.step(step, time.perf_counter() - start)
+    except Exception as e:
+        results.failure(code, step, str(e))
+        return
+    results.finished(time.perf_counter() - started)
+
+
+def storage_size(workdir):
+    """Bytes used by the database (with its WAL) and by Images/."""
+    database = sum(
+        os.path.getsize(os.path.join(workdir, synthetic.DB_FILE + suffix))
+        for suffix in ("", "-wal", "-shm")
+        if os.path.exists(os.path.join(workdir, synthetic.DB_FILE + suffix))
+    )
+    images_dir = os.path.join(workdir, synthetic.IMAGES_DIR)
+    images = sum(entry.stat().st_size for entry in os.scandir(images_dir) if entry.is_file())
+    return {"database_bytes": database, "images_bytes": images}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=60, help="technicians punching in and out")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions in flight at once")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which session starts are spread")
+    parser.add_argument("--driver", choices=("apptest", "direct"), default="apptest")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds one page run may take")
+    parser.add_argument("--supervisors", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30, help="days of history in the generated database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--keep", action="store_true", help="keep the generated working directory")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sys.path.insert(0, synthetic.REPO_DIR)
+    workdir = tempfile.mkdtemp(prefix="tools_loadtest_")
+    per_supervisor = -(-args.sessions // args.supervisors)
+    synthetic.generate_database(workdir, supervisors=args.supervisors, technicians=per_supervisor,
+                                days=args.days, photo_days=0, seed=args.seed)
+    technicians = [code for code, _, _ in synthetic.technicians(os.path.join(workdir, synthetic.DB_FILE))][:args.sessions]
+    photos = synthetic.sample_photos()
+
+    os.chdir(workdir)
+    import Database
+    import ToolsAndTools  # noqa: F401  imported once here, not by the first sessions in parallel
+
+    install_fake_camera()
+    if args.driver == "apptest":
+        share_apptest_runtime()
+        with open("loadtest_session.py", "w", encoding="utf-8") as f:
+            f.write(SESSION_SCRIPT)
+    session = apptest_session if args.driver == "apptest" else direct_session
+    results = Results()
+    size_before = storage_size(workdir)
+    started = time.perf_counter()
+
+    def run(index, code):
+        delay = started + index * args.ramp / max(len(technicians), 1) - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        session(code, photos[(2 * index) % len(photos)], photos[(2 * index + 1) % len(photos)], results, args.timeout)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(run, index, code) for index, code in enumerate(technicians)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        size_after = storage_size(workdir)
+        conn = Database.get_db_connection()
+        today = datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%d-%m-%Y")
+        punched = conn.execute("SELECT COUNT(*) FROM Attendance WHERE Attendance_Date = ? AND Out_Time IS NOT NULL", (today,)).fetchone()[0]
+        conn.close()
+        writer = Database.write_metrics()
+    finally:
+        os.chdir(synthetic.REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "driver": args.driver,
+        "sessions": len(technicians),
+        "concurrency": args.concurrency,
+        "ramp_seconds": args.ramp,
+        "elapsed_seconds": round(elapsed, 3),
+        "completed_sessions": results.completed,
+        "rows_punched_out": punched,
+        "sessions_per_second": round(results.completed / elapsed, 2),
+        "punches_per_second": round(2 * results.completed / elapsed, 2),
+        "session_latency": percentiles(results.sessions),
+        "step_latency": {step: percentiles(values) for step, values in results.latencies.items()},
+        "errors": len(results.errors),
+        "lock_errors": results.lock_errors,
+        "error_samples": results.errors[:10],
+        "writer": writer,
+        "storage_before": size_before,
+        "storage_after": size_after,
+        "growth_per_session_bytes": {
+            key: round((size_after[key] - size_before[key]) / max(results.completed, 1))
+            for key in size_before
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if results.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
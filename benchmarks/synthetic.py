@@ -0,0 +1,182 @@
+"""Synthetic data for benchmarks and load tests.
+
+Builds a Tools_And_Tools.sqlite with the app's own schema and a realistic org
+tree (supervisors -> workstations -> advisors, supervisors -> technicians),
+`days` of history up to yesterday, and JPEG punch photos copied from the
+sample Images/ folder.
+"""
+import os
+import random
+import shutil
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytz
+
+from services import passwords, schema
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGES = os.path.join(REPO_DIR, "Images")
+DB_FILE = "Tools_And_Tools.sqlite"
+IMAGES_DIR = "Images"
+
+
+@contextmanager
+def working_directory(path):
+    """The app resolves the database and Images/ relative to the working directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+def password_for(code):
+    return f"pw-{code}"
+
+
+def build_users(supervisors, workstations, advisors, technicians, rng):
+    """User_Credentials rows: (Code, Name, Password, Supervisor_Code, User_Role, Target)."""
+    users = []
+    for s in range(supervisors):
+        supervisor_code = f"SV{s + 1:03}"
+        users.append((supervisor_code, f"Supervisor {s + 1}", password_for(supervisor_code), None, "Supervisor", None))
+        for w in range(workstations):
+            workstation_code = f"WS{s + 1:03}{w + 1:02}"
+            users.append((workstation_code, f"Workstation {s + 1}-{w + 1}", password_for(workstation_code),
+                          supervisor_code, "Workstation", rng.randrange(300, 900, 50)))
+            for a in range(advisors):
+                advisor_code = f"AD{s + 1:03}{w + 1:02}{a + 1:02}"
+                users.append((advisor_code, f"Advisor {s + 1}-{w + 1}-{a + 1}", password_for(advisor_code),
+                              workstation_code, "Advisor", rng.randrange(100, 300, 25)))
+        for t in range(technicians):
+            technician_code = f"T{s + 1:03}{t + 1:03}"
+            users.append((technician_code, f"Technician {s + 1}-{t + 1}", password_for(technician_code),
+                          supervisor_code, "Technician", None))
+    return users
+
+
+def _sales_figures(rng):
+    running_repair, free_service, paid_service, body_shop = (rng.randint(0, 12) for _ in range(4))
+    align, balance = rng.randint(0, 8), rng.randint(0, 8)
+    return (running_repair, free_service, paid_service, body_shop,
+            running_repair + free_service + paid_service + body_shop,
+            align, balance, align + balance)
+
+
+def generate_database(workdir, supervisors=5, workstations=4, advisors=3, technicians=20, days=90,
+                      photo_days=1, seed=42):
+    """Create workdir/Tools_And_Tools.sqlite and workdir/Images. Returns row counts per table.
+
+    workstations and technicians are per supervisor, advisors per workstation.
+    Photos are only written for the last `photo_days` days of attendance.
+    """
+    from ToolsAndTools import create_tables
+
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(workdir, IMAGES_DIR), exist_ok=True)
+    db_path = os.path.join(workdir, DB_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    with working_directory(workdir):
+        create_tables()
+
+    users = build_users(supervisors, workstations, advisors, technicians, rng)
+    names = {code: name for code, name, *_ in users}
+    today = datetime.now(pytz.timezone("Asia/Kolkata")).date()
+    dates = [today - timedelta(days=offset) for offset in range(days, 0, -1)]
+    samples = sorted(os.path.join(SAMPLE_IMAGES, f) for f in os.listdir(SAMPLE_IMAGES) if f.endswith(".jpg"))
+
+    conn = sqlite3.connect(db_path)
+    # Stored hashed, as the app stores them; TOOLS_PBKDF2_ITERATIONS=1000 makes large sets quick to build
+    hashes = passwords.hash_many(password for _, _, password, *_ in users)
+    conn.executemany("INSERT INTO User_Credentials (Code, Name, Password, Supervisor_Code, User_Role, Target) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(code, name, hashed, *rest) for (code, name, _, *rest), hashed in zip(users, hashes)])
+    schema.rebuild_org(conn)
+
+    attendance = []
+    photos = []
+    for code, name, _, supervisor_code, role, _ in users:
+        if role != "Technician":
+            continue
+        for day in dates:
+            # Roughly one day off in ten, and a forgotten punch-out now and then
+            if rng.random() < 0.1:
+                continue
+            date_text = day.strftime("%d-%m-%Y")
+            in_dt = datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randint(510, 600), seconds=rng.randint(0, 59))
+            out_dt = in_dt + timedelta(hours=rng.uniform(7.5, 10.5))
+            in_time = in_dt.strftime("%I.%M.%S %p")
+            in_link = os.path.join(IMAGES_DIR, f"{code}_{date_text}_in.jpg")
+            if rng.random() < 0.05:
+                out_time = out_link = shift_duration = None
+            else:
+                out_time = out_dt.strftime("%I.%M.%S %p")
+                out_link = os.path.join(IMAGES_DIR, f"{code}_{date_text}_out.jpg")
+                shift_duration = str(datetime.strptime(out_time, "%I.%M.%S %p") - datetime.strptime(in_time, "%I.%M.%S %p"))
+            workstation = f"Workstation {supervisor_code[2:].lstrip('0')}-{rng.randint(1, max(workstations, 1))}"
+            attendance.append((code, name, workstation, date_text, in_time, in_link, out_time, out_link,
+                               names[supervisor_code], shift_duration))
+            if (today - day).days <= photo_days:
+                photos.append(in_link)
+                if out_link:
+                    photos.append(out_link)
+    conn.executemany('''INSERT INTO Attendance (Code, Name, Workstation_Name, Attendance_Date, In_Time, In_Time_Photo_Link,
+                                                Out_Time, Out_Time_Photo_Link, Supervisor_Name, Shift_Duration)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', attendance)
+
+    workstation_rows = []
+    advisor_rows = []
+    workstation_names = {code: (name, supervisor_code) for code, name, _, supervisor_code, role, _ in users if role == "Workstation"}
+    for day in dates:
+        date_text = day.strftime("%Y-%m-%d")
+        stamp = f"{date_text} 19:30:00"
+        for workstation_code, (workstation_name, supervisor_code) in workstation_names.items():
+            workstation_rows.append((date_text, stamp, workstation_name, supervisor_code) + _sales_figures(rng))
+        for code, name, _, workstation_code, role, _ in users:
+            if role == "Advisor":
+                workstation_name, supervisor_code = workstation_names[workstation_code]
+                advisor_rows.append((date_text, stamp, workstation_name, supervisor_code, name) + _sales_figures(rng))
+    conn.executemany('''INSERT INTO Workstation_Data (date, timestamp, workstation_name, supervisor_name, running_repair, free_service,
+                                                      paid_service, body_shop, total, align, balance, align_and_balance)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', workstation_rows)
+    conn.executemany('''INSERT INTO Advisor_Data (date, timestamp, workstation_name, supervisor_name, advisor_name, running_repair,
+                                                  free_service, paid_service, body_shop, total, align, balance, align_and_balance)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', advisor_rows)
+    conn.commit()
+    conn.close()
+
+    for index, link in enumerate(photos):
+        shutil.copyfile(samples[index % len(samples)], os.path.join(workdir, link))
+
+    return {
+        "User_Credentials": len(users),
+        "Attendance": len(attendance),
+        "Workstation_Data": len(workstation_rows),
+        "Advisor_Data": len(advisor_rows),
+        "photos": len(photos),
+    }
+
+
+def sample_photos():
+    """Raw bytes of the sample JPEGs, as a camera frame would arrive."""
+    photos = []
+    for name in sorted(os.listdir(SAMPLE_IMAGES)):
+        if name.endswith(".jpg"):
+            with open(os.path.join(SAMPLE_IMAGES, name), "rb") as f:
+                photos.append(f.read())
+    return photos
+
+
+def technicians(db_path):
+    """(Code, Name, Supervisor name) for every technician in a generated database."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''SELECT u.Code, u.Name, s.Name
+                           FROM User_Credentials u
+                           JOIN User_Credentials s ON s.Code = u.Supervisor_Code
+                           WHERE u.User_Role = 'Technician' ORDER BY u.Code''').fetchall()
+    conn.close()
+    return rows
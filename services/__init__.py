@@ -0,0 +1,4 @@
+# UI-free business logic shared by the Streamlit pages, scripts and workers.
+# Everything here returns plain data (tuples, dicts, DataFrames, bytes) and
+# raises the errors in services.errors instead of calling st.*.
+from services.errors import AttendanceError, BackupError, ImageError, JobCancelled, NotFound, RateLimited, ServiceError, ValidationError
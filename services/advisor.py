@@ -0,0 +1,89 @@
+import pandas as pd
+
+import Database
+from services import clock, schema, shards
+from services.workshop import TOTALS, summarize, totals, validate_days, with_totals
+
+
+# Sum Advisor_Data rows per supervisor, workstation and advisor between two dates (inclusive)
+def summarize_advisor_data(df, start_date, end_date):
+    return summarize(df, start_date, end_date, ['supervisor_name', 'workstation_name', 'advisor_name'])
+
+
+def advisor_totals(start_date, end_date, supervisor_code=None, conn=None):
+    return totals("Advisor_Data", ['supervisor_name', 'workstation_name', 'advisor_name'], start_date, end_date, supervisor_code, conn=conn)
+
+
+@shards.federated
+def advisor_data(supervisor_code=None):
+    """Advisor_Data as a DataFrame; a supervisor only sees the advisors of workstations in their org subtree."""
+    with Database.reading() as conn:
+        if supervisor_code is None:
+            return pd.read_sql_query("SELECT * FROM Advisor_Data", conn)
+        return pd.read_sql_query(f"SELECT * FROM Advisor_Data WHERE supervisor_name IN ({schema.SQL_ORG_SUBTREE})",
+                                 conn, params=(supervisor_code,))
+
+
+def replace_advisor_data(df):
+    validate_days("Advisor_Data", df)
+    if shards.enabled():
+        return shards.replace_table("Advisor_Data", df, lambda conn, rows: Database.insert_dataframe(conn, "Advisor_Data", rows))
+
+    # Replace the table contents in a single write so readers never see it empty
+    def replace_rows(conn):
+        conn.execute("DELETE FROM Advisor_Data")
+        Database.insert_dataframe(conn, "Advisor_Data", df)
+
+    Database.run_write(replace_rows)
+    return len(df)
+
+
+def advisor_names(workstation_code):
+    """Names of the advisors under a workstation login."""
+    conn = Database.get_db_connection()
+    try:
+        rows = conn.execute("SELECT name FROM User_Credentials WHERE Supervisor_Code = ? AND User_Role = 'Advisor'",
+                            (workstation_code,)).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+def day_figures(advisor_names, date):
+    """{advisor_name: (running_repair, free_service, paid_service, body_shop, align, balance)} for one day."""
+    if not advisor_names:
+        return {}
+    conn = Database.get_db_connection()
+    try:
+        rows = conn.execute(f"""
+            SELECT advisor_name, running_repair, free_service, paid_service, body_shop, align, balance
+            FROM Advisor_Data
+            WHERE date = ? AND advisor_name IN ({", ".join("?" for _ in advisor_names)})
+        """, (str(date), *advisor_names)).fetchall()
+    finally:
+        conn.close()
+    return {row[0]: row[1:] for row in rows}
+
+
+def save_day(date, workstation_name, supervisor_code, rows):
+    """Insert or update several advisors' figures for one day in one write.
+
+    rows is {advisor_name: figures}. Returns {advisor_name: stored values}.
+    """
+    values = {advisor_name: with_totals(figures) for advisor_name, figures in rows.items()}
+    date = str(date)
+
+    def save_rows(conn):
+        timestamp = clock.timestamp()
+        # One statement per advisor on the (date, advisor_name) index
+        conn.executemany(f'''
+            INSERT INTO Advisor_Data (date, timestamp, workstation_name, supervisor_name, advisor_name, {", ".join(TOTALS)})
+            VALUES (?, ?, ?, ?, ?, {", ".join("?" for _ in TOTALS)})
+            ON CONFLICT (date, advisor_name) DO UPDATE SET
+                timestamp = excluded.timestamp, {", ".join(f"{name} = excluded.{name}" for name in TOTALS)}
+        ''', [(date, timestamp, workstation_name, supervisor_code, advisor_name, *(figures[name] for name in TOTALS))
+              for advisor_name, figures in values.items()])
+
+    if values:
+        Database.run_write(save_rows)
+    return values
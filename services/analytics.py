@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import Database
+from services import archive, clock, shards
+from services.schema import SQL_ATTENDANCE_DATE, SQL_ORG_SUBTREE
+
+# When a shift is due to start ('HH:MM'), and the minutes after it that still count as on time
+SHIFT_START = os.environ.get("TOOLS_SHIFT_START", "09:30")
+LATE_GRACE_MINUTES = int(os.environ.get("TOOLS_LATE_GRACE_MINUTES", 10))
+# Hours of a normal shift; time beyond it is overtime
+STANDARD_SHIFT_HOURS = float(os.environ.get("TOOLS_STANDARD_SHIFT_HOURS", 9))
+
+ANALYTICS_COLUMNS = ['Supervisor_Name', 'Code', 'Technician_Name', 'Days', 'Late_Arrivals', 'Missing_Punch_Outs',
+                     'Overtime_Hours', 'Average_Shift_Hours']
+# Per technician before formatting; shards' parts are summed on FIGURE_KEYS
+FIGURE_KEYS = ['Supervisor_Name', 'Code', 'Technician_Name']
+FIGURE_COLUMNS = [*FIGURE_KEYS, 'Days', 'Late_Arrivals', 'Missing_Punch_Outs', 'Overtime_Seconds', 'Shift_Seconds', 'Shifts']
+
+# The text columns are decoded into numbers by SQLite, in C, so pandas only sees
+# numeric arrays. In_Time is 'HH.MM.SS AM' (camera) or 'HH:MM:SS AM' (supervisor);
+# anything else is NULL. Shift_Duration is str(timedelta): 'H:MM:SS' or '-1 day, H:MM:SS'.
+PUNCHES_SQL = f'''
+    SELECT Code, Day, In_Seconds, Punched_Out,
+           CASE WHEN Shift_Duration LIKE '%day%' THEN CAST(Shift_Duration AS INTEGER) * 86400 ELSE 0 END
+           + CAST(Shift_Clock AS INTEGER) * 3600
+           + CAST(substr(Shift_Clock, instr(Shift_Clock, ':') + 1, 2) AS INTEGER) * 60
+           + CAST(substr(Shift_Clock, instr(Shift_Clock, ':') + 4, 2) AS INTEGER) AS Shift_Seconds
+    FROM (
+        SELECT a.Code, {SQL_ATTENDANCE_DATE.format("a.Attendance_Date")} AS Day, a.Shift_Duration,
+               substr(a.Shift_Duration, instr(a.Shift_Duration, ',') + 1) AS Shift_Clock,
+               CASE WHEN a.In_Time GLOB '[01][0-9][.:][0-5][0-9][.:][0-5][0-9] [AaPp][Mm]'
+                    THEN CAST(substr(a.In_Time, 1, 2) AS INTEGER) % 12 * 3600
+                         + CAST(substr(a.In_Time, 4, 2) AS INTEGER) * 60 + CAST(substr(a.In_Time, 7, 2) AS INTEGER)
+                         + 43200 * (upper(substr(a.In_Time, 10, 1)) = 'P')
+               END AS In_Seconds,
+               TRIM(COALESCE(a.Out_Time, '')) != '' AS Punched_Out
+        FROM {{attendance}} a
+        JOIN User_Credentials u ON a.Code = u.Code
+        JOIN User_Credentials s ON u.Supervisor_Code = s.Code
+        WHERE TRIM(COALESCE(a.In_Time, '')) != '' AND COALESCE(a.Holiday, 0) != 1
+          AND {SQL_ATTENDANCE_DATE.format("a.Attendance_Date")} BETWEEN DATE(?) AND DATE(?){{where}}
+    )
+'''
+TECHNICIANS_SQL = '''
+    SELECT s.Name AS Supervisor_Name, u.Code, u.Name AS Technician_Name
+    FROM User_Credentials u
+    JOIN User_Credentials s ON u.Supervisor_Code = s.Code
+'''
+
+
+def scope_filter(supervisor_name=None, scope=None):
+    """The WHERE terms and parameters limiting an attendance query (u technicians, s supervisors) to a supervisor or a subtree."""
+    where, params = "", []
+    if supervisor_name is not None:
+        where, params = " AND s.Name = ? COLLATE NOCASE", [supervisor_name]
+    if scope is not None:
+        where, params = f"{where} AND u.Code IN ({SQL_ORG_SUBTREE})", [*params, scope]
+    return where, params
+
+
+def _punches(start, end, where, params, conn):
+    frames = []
+    with Database.reading(conn) as conn:
+        # Archived days are read from the yearly files: lateness needs the punches, not the monthly rollups
+        ranges = archive.row_ranges(conn, "Attendance", start, end)
+        with archive.attached(conn, [year for year, _, _ in ranges]) as years:
+            sources = [("Attendance", start, end)]
+            sources += [(f"archive_{year}.Attendance", first, last) for year, first, last in ranges if year in years]
+            for table, first, last in sources:
+                query = PUNCHES_SQL.format(attendance=table, where=where)
+                frames.append(pd.read_sql_query(query, conn, params=[first, last, *params]))
+        technicians = pd.read_sql_query(TECHNICIANS_SQL, conn)
+    # Years with no rows in range give empty frames; concatenating those is deprecated in pandas
+    return shards.concat(frames), technicians
+
+
+def attendance_analytics(start_date, end_date, supervisor_name=None, shift_start=None, grace_minutes=None,
+                         standard_hours=None, today=None, conn=None, scope=None):
+    """Late arrivals, missing punch-outs, overtime and average shift per technician between two 'DD-MM-YYYY' dates.
+
+    A day is late when In_Time is after shift_start plus grace_minutes, and
+    overtime is the time beyond standard_hours, both from the settings above
+    unless given. Missing punch-outs count days with an In_Time but no
+    Out_Time before today (a shift still running is not missing). Holidays
+    are left out. supervisor_name and scope filter as in
+    reports.attendance_summary(). Returns a DataFrame with ANALYTICS_COLUMNS.
+    """
+    start, end = clock.to_iso(start_date), clock.to_iso(end_date)
+    where, params = scope_filter(supervisor_name, scope)
+    hours, minutes = (int(part) for part in (shift_start or SHIFT_START).split(":"))
+    late_after = hours * 3600 + minutes * 60 + 60 * (LATE_GRACE_MINUTES if grace_minutes is None else grace_minutes)
+    standard = 3600 * (STANDARD_SHIFT_HOURS if standard_hours is None else standard_hours)
+    today = (today or clock.now().date()).isoformat()
+
+    summary = _technician_figures(start, end, where, params, late_after, standard, today, conn=conn)
+    if summary.empty:
+        return pd.DataFrame(columns=ANALYTICS_COLUMNS)
+    # Hours and the average only now, after the shards' sums were added up
+    summary['Overtime_Hours'] = (summary['Overtime_Seconds'] / 3600).round(2)
+    summary['Average_Shift_Hours'] = (summary['Shift_Seconds'] / summary['Shifts'] / 3600).round(2)
+    summary = summary.sort_values(['Supervisor_Name', 'Code'], ignore_index=True)
+    return summary[ANALYTICS_COLUMNS]
+
+
+@shards.federated(merge=shards.summed(FIGURE_KEYS))
+def _technician_figures(start, end, where, params, late_after, standard, today, conn=None):
+    """FIGURE_COLUMNS per technician: counts and summed seconds, for attendance_analytics()."""
+    df, technicians = _punches(start, end, where, params, conn)
+    if df.empty:
+        return pd.DataFrame(columns=FIGURE_COLUMNS)
+
+    shift = df['Shift_Seconds'].to_numpy(dtype=float)
+    figures = pd.DataFrame({
+        'Code': df['Code'].to_numpy(),
+        'Days': 1,
+        'Late_Arrivals': (df['In_Seconds'].to_numpy(dtype=float) > late_after).astype(int),
+        'Missing_Punch_Outs': ((df['Punched_Out'].to_numpy() == 0) & (df['Day'].to_numpy() < today)).astype(int),
+        'Overtime_Seconds': np.clip(np.nan_to_num(shift) - standard, 0, None),
+        'Shift_Seconds': shift,
+    })
+    # Shifts counts the days with a known duration, so the average can be taken after merging
+    totals = figures.groupby('Code').agg(
+        Days=('Days', 'sum'),
+        Late_Arrivals=('Late_Arrivals', 'sum'),
+        Missing_Punch_Outs=('Missing_Punch_Outs', 'sum'),
+        Overtime_Seconds=('Overtime_Seconds', 'sum'),
+        Shift_Seconds=('Shift_Seconds', 'sum'),
+        Shifts=('Shift_Seconds', 'count'),
+    )
+    return technicians.join(totals, on='Code', how='inner')[FIGURE_COLUMNS]
@@ -0,0 +1,288 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import Database
+from services import clock, schema
+from services.attendance import SQL_ATTENDANCE_DATE
+
+# Data entry reaches back 180 days (advisor grid), so months are only closed after this
+KEEP_DAYS = 190
+ARCHIVE_DIR = "archive"
+CHUNK_ROWS = 5000
+
+FIGURES = ("running_repair", "free_service", "paid_service", "body_shop", "total", "align", "balance", "align_and_balance")
+
+# Fact table -> (rollup table, grouping columns, date column)
+SALES_TABLES = {
+    "Workstation_Data": ("Workstation_Monthly", ("workstation_name", "supervisor_name"), "date"),
+    "Advisor_Data": ("Advisor_Monthly", ("supervisor_name", "workstation_name", "advisor_name"), "date"),
+}
+ATTENDANCE_ISO_DATE = SQL_ATTENDANCE_DATE.format("Attendance_Date")
+
+
+def archive_path(year, db_path=None):
+    """The yearly archive file beside the (routed) database."""
+    folder = os.path.join(os.path.dirname(Database.resolve_path(db_path)), ARCHIVE_DIR)
+    return os.path.join(folder, f"Tools_And_Tools_{year}.sqlite")
+
+
+def archived_years(db_path=None):
+    """Years that have an archive file beside the (routed) database."""
+    folder = os.path.dirname(archive_path(0, db_path))
+    if not os.path.isdir(folder):
+        return []
+    matches = (re.fullmatch(r"Tools_And_Tools_(\d+)\.sqlite", name) for name in os.listdir(folder))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _month_end(day):
+    return (_month_start(day) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def archived_through(conn, table_name):
+    """Last archived day of a table as a date, or None if nothing was archived."""
+    row = conn.execute("SELECT Archived_Through FROM Archive_State WHERE Table_Name = ?", (table_name,)).fetchone()
+    return date.fromisoformat(row[0]) if row and row[0] else None
+
+
+def plan(conn, table_name, start, end):
+    """How to read the archived part of [start, end] (ISO dates or dates).
+
+    Returns (months, ranges): whole months to take from the rollup table and
+    (year, first, last) day ranges to read from the yearly archive files.
+    Both are empty when the range does not reach back into the archive.
+    """
+    start, end = date.fromisoformat(str(start)), date.fromisoformat(str(end))
+    through = archived_through(conn, table_name)
+    if through is None or start > through:
+        return [], []
+    months, ranges = [], []
+    month = _month_start(start)
+    last = min(end, through)
+    while month <= last:
+        month_end = _month_end(month)
+        if start <= month and month_end <= end:
+            months.append(month.strftime("%Y-%m"))
+        else:
+            ranges.append((month.year, max(start, month).isoformat(), min(end, month_end).isoformat()))
+        month = month_end + timedelta(days=1)
+    return months, ranges
+
+
+def row_ranges(conn, table_name, start, end):
+    """(year, first, last) archived day ranges in [start, end] for reads that need the rows, not the rollups."""
+    months, ranges = plan(conn, table_name, start, end)
+    for month in months:
+        first = date.fromisoformat(f"{month}-01")
+        ranges.append((first.year, first.isoformat(), _month_end(first).isoformat()))
+    # One range per yearly file; the archived days of a year are contiguous
+    years = {}
+    for year, first, last in ranges:
+        known = years.get(year)
+        years[year] = (min(first, known[0]), max(last, known[1])) if known else (first, last)
+    return [(year, first, last) for year, (first, last) in sorted(years.items())]
+
+
+@contextmanager
+def attached(conn, years):
+    """ATTACH the yearly archive files that exist as archive_<year>; yields the attached years."""
+    names = []
+    try:
+        for year in sorted(set(years)):
+            path = archive_path(year)
+            if os.path.exists(path):
+                conn.execute(f"ATTACH DATABASE ? AS archive_{year}", (os.path.abspath(path),))
+                names.append(year)
+        yield names
+    finally:
+        for year in names:
+            conn.execute(f"DETACH DATABASE archive_{year}")
+
+
+def _archive_connection(path):
+    # Only the archive job writes these files, so they keep the default rollback
+    # journal and stay out of the WAL write coordinator; compact() swaps them whole.
+    new = not os.path.exists(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=Database.BUSY_TIMEOUT)
+    with conn:
+        if new:
+            for statement in schema.ARCHIVE_TABLES:
+                conn.execute(statement)
+        for statement in schema.ARCHIVE_INDEXES:
+            conn.execute(statement)
+    return conn
+
+
+def _copy_to_archive(table_name, rows, touched):
+    # OR REPLACE keeps a re-run after a crash from duplicating rows (Attendance key, sales id)
+    for year, year_rows in rows.groupby("_year"):
+        path = archive_path(int(year))
+        touched.add(path)
+        year_rows = year_rows.drop(columns=["_year"])
+        columns = ", ".join(f'"{column}"' for column in year_rows.columns)
+        placeholders = ", ".join("?" for _ in year_rows.columns)
+        values = [Database.sql_values(row) for row in year_rows.itertuples(index=False, name=None)]
+        conn = _archive_connection(path)
+        try:
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {table_name} ({columns}) VALUES ({placeholders})", values)
+        finally:
+            conn.close()
+
+
+def _archive_attendance(cutoff, touched):
+    moved = []
+    totals = []
+    days = []
+    conn = Database.get_db_connection()
+    try:
+        query = f"SELECT * FROM Attendance WHERE {ATTENDANCE_ISO_DATE} < DATE(?)"
+        for chunk in pd.read_sql_query(query, conn, params=(cutoff.isoformat(),), chunksize=CHUNK_ROWS):
+            day = pd.to_datetime(chunk["Attendance_Date"], format=clock.ATTENDANCE_DATE_FORMAT, errors="coerce")
+            # Dates SQLite accepted but pandas cannot read (e.g. 31-02) stay in the live table
+            chunk, day = chunk[day.notna()].copy(), day[day.notna()]
+            chunk["_year"] = day.dt.year
+            _copy_to_archive("Attendance", chunk, touched)
+            moved.extend(zip(chunk["Code"], chunk["Attendance_Date"]))
+
+            frame = pd.DataFrame({
+                "Month": day.dt.strftime("%Y-%m"),
+                "Code": chunk["Code"],
+                "Day": day,
+                "Seconds": pd.to_timedelta(chunk["Shift_Duration"], errors="coerce").dt.total_seconds().fillna(0),
+                "Sunday": day.dt.dayofweek == 6,
+            })
+            totals.append(frame.groupby(["Month", "Code"]).agg(Shift_Seconds=("Seconds", "sum"), Sundays=("Sunday", "sum")))
+            days.append(frame[["Month", "Code", "Day"]].drop_duplicates())
+    finally:
+        conn.close()
+
+    if not moved:
+        return 0, []
+    rollup = pd.concat(totals).groupby(level=["Month", "Code"]).sum()
+    rollup["Days"] = pd.concat(days).groupby(["Month", "Code"])["Day"].nunique()
+    rollup_rows = [(month, code, int(row.Days), int(row.Shift_Seconds), int(row.Sundays))
+                   for (month, code), row in rollup.iterrows()]
+
+    def finish(conn):
+        conn.executemany('''INSERT INTO Attendance_Monthly (Month, Code, Days, Shift_Seconds, Sundays) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT (Month, Code) DO UPDATE SET Days = Days + excluded.Days,
+                                Shift_Seconds = Shift_Seconds + excluded.Shift_Seconds, Sundays = Sundays + excluded.Sundays''',
+                         rollup_rows)
+        conn.executemany("DELETE FROM Attendance WHERE Code = ? AND Attendance_Date = ?", moved)
+
+    return len(moved), [finish]
+
+
+def _archive_sales(table_name, cutoff, touched):
+    rollup_table, keys, date_column = SALES_TABLES[table_name]
+    moved = []
+    sums = []
+    conn = Database.get_db_connection()
+    try:
+        query = f"SELECT * FROM {table_name} WHERE {date_column} < ?"
+        for chunk in pd.read_sql_query(query, conn, params=(cutoff.isoformat(),), chunksize=CHUNK_ROWS):
+            day = pd.to_datetime(chunk[date_column].astype(str).str[:10], format=clock.SALES_DATE_FORMAT, errors="coerce")
+            chunk, day = chunk[day.notna()].copy(), day[day.notna()]
+            chunk["_year"] = day.dt.year
+            _copy_to_archive(table_name, chunk, touched)
+            moved.extend((int(row_id),) for row_id in chunk["id"])
+
+            chunk["month"] = day.dt.strftime("%Y-%m")
+            sums.append(chunk.groupby(["month", *keys], dropna=False)[list(FIGURES)].sum())
+    finally:
+        conn.close()
+
+    if not moved:
+        return 0, []
+    rollup = pd.concat(sums).groupby(level=["month", *keys], dropna=False).sum().reset_index()
+    columns = ["month", *keys, *FIGURES]
+    rollup_rows = [tuple(None if pd.isna(value) else (int(value) if name in FIGURES else value) for name, value in zip(columns, row))
+                   for row in rollup[columns].itertuples(index=False, name=None)]
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in FIGURES)
+
+    def finish(conn):
+        conn.executemany(f'''INSERT INTO {rollup_table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})
+                             ON CONFLICT ({", ".join(["month", *keys])}) DO UPDATE SET {updates}''', rollup_rows)
+        conn.executemany(f"DELETE FROM {table_name} WHERE id = ?", moved)
+
+    return len(moved), [finish]
+
+
+def compact(path):
+    """Rewrite an archive file with VACUUM INTO and swap it in; only the archive job writes to it."""
+    compacted = path + ".compact"
+    if os.path.exists(compacted):
+        os.remove(compacted)
+    conn = sqlite3.connect(path, timeout=Database.BUSY_TIMEOUT)
+    try:
+        conn.execute("VACUUM INTO ?", (compacted,))
+    finally:
+        conn.close()
+    os.replace(compacted, path)
+
+
+def run(keep_days=KEEP_DAYS, today=None, vacuum=False):
+    """Move months that closed more than keep_days ago into the yearly archive files.
+
+    Rows are copied into archive/Tools_And_Tools_<year>.sqlite first. Then, in
+    one write on the live file, the monthly rollups are added, the moved rows
+    are deleted and Archive_State advances. Returns a dict of counts and timings.
+    """
+    started = time.perf_counter()
+    today = today or clock.now().date()
+    cutoff = _month_start(today - timedelta(days=keep_days))
+    through = cutoff - timedelta(days=1)
+
+    stats = {"archived_through": through.isoformat(), "rows": {}}
+    finishers = []
+    touched = set()
+    count, finish = _archive_attendance(cutoff, touched)
+    stats["rows"]["Attendance"] = count
+    finishers += finish
+    for table_name in SALES_TABLES:
+        count, finish = _archive_sales(table_name, cutoff, touched)
+        stats["rows"][table_name] = count
+        finishers += finish
+
+    def commit(conn):
+        logged = conn.execute("SELECT COALESCE(MAX(Seq), 0) FROM Change_Log").fetchone()[0]
+        for finish in finishers:
+            finish(conn)
+        # The rows still exist in the archive files; tell Change_Log consumers they moved rather than went away
+        conn.execute("UPDATE Change_Log SET Operation = 'archive' WHERE Seq > ? AND Operation = 'delete'", (logged,))
+        # The deletes took the moved months' counters to zero; the leaderboard only reads live months
+        conn.execute("DELETE FROM Sales_Counters WHERE month < ?", (cutoff.strftime("%Y-%m"),))
+        for table_name in ("Attendance", *SALES_TABLES):
+            conn.execute('''INSERT INTO Archive_State (Table_Name, Archived_Through) VALUES (?, ?)
+                            ON CONFLICT (Table_Name) DO UPDATE SET Archived_Through = MAX(Archived_Through, excluded.Archived_Through)''',
+                         (table_name, through.isoformat()))
+
+    write_start = time.perf_counter()
+    Database.run_write(commit, timeout=None, label="archive: commit")
+    stats["commit_ms"] = round((time.perf_counter() - write_start) * 1000, 1)
+
+    for path in sorted(touched):
+        compact(path)
+    if vacuum:
+        # Hand the freed pages back to the filesystem; takes the write lock for its duration
+        conn = Database.get_db_connection()
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return stats
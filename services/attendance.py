@@ -0,0 +1,279 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import Database
+from services import clock, shards
+from services.schema import SQL_ATTENDANCE_DATE
+from services.errors import AttendanceError, ValidationError
+
+ATTENDANCE_COLUMNS = ['Code', 'Name', 'Workstation_Name', 'Attendance_Date', 'In_Time', 'In_Time_Photo_Link',
+                      'Out_Time', 'Out_Time_Photo_Link', 'Supervisor_Name', 'Shift_Duration']
+INSERT_ATTENDANCE_SQL = (f'INSERT INTO Attendance ({", ".join(ATTENDANCE_COLUMNS)}) '
+                         f'VALUES ({", ".join("?" for _ in ATTENDANCE_COLUMNS)})')
+
+
+def shift_duration(in_time_str, out_time_str, time_format=clock.PUNCH_TIME_FORMAT):
+    # Convert string time to datetime objects using the correct format for 12-hour time with AM/PM
+    in_time = datetime.strptime(in_time_str, time_format)  # Adjusting for format like '08.32.09 PM'
+    out_time = datetime.strptime(out_time_str, time_format)
+    return out_time - in_time
+
+
+# Shift_Duration as stored in Attendance, computed inside the punch-out statement
+def _sql_shift_duration(in_time_str, out_time_str):
+    if not in_time_str or not out_time_str:
+        return None
+    try:
+        return str(shift_duration(in_time_str, out_time_str))
+    except ValueError:
+        return None
+
+
+# Punch in: one statement that creates today's row, resolving the supervisor's
+# name in the same statement. A second punch-in for the day is a no-op.
+PUNCH_IN_SQL = '''
+    INSERT INTO Attendance (Code, Name, Workstation_Name, Attendance_Date, In_Time, In_Time_Photo_Link, Supervisor_Name)
+    VALUES (?, ?, ?, ?, ?, ?, (
+        SELECT s.Name
+        FROM User_Credentials u
+        JOIN User_Credentials s ON s.Code = u.Supervisor_Code
+        WHERE u.Code = ?
+    ))
+    ON CONFLICT(Code, Attendance_Date) DO NOTHING
+'''
+
+# Punch out: the row always exists by now, so a keyed UPDATE is the single
+# statement. Shift_Duration is derived from the stored In_Time in the same write.
+PUNCH_OUT_SQL = '''
+    UPDATE Attendance
+    SET Out_Time = ?, Out_Time_Photo_Link = ?, Shift_Duration = shift_duration(In_Time, ?)
+    WHERE Code = ? AND Attendance_Date = ?
+'''
+
+
+def today_record(code, attendance_date=None):
+    """(In_Time,) of the technician's row for the day, or None if there is none yet."""
+    conn = Database.get_db_connection()
+    try:
+        return conn.execute('SELECT In_Time FROM Attendance WHERE Code = ? AND Attendance_Date = ?',
+                            (code, attendance_date or clock.attendance_date())).fetchone()
+    finally:
+        conn.close()
+
+
+def punch_in(code, name, workstation, in_time, in_photo_link, attendance_date=None):
+    """Record In Time for the day. Returns True if the row was created."""
+    if attendance_date is None:
+        attendance_date = clock.attendance_date()
+    params = (code, name, workstation, attendance_date, in_time, in_photo_link, code)
+    return Database.execute_write(PUNCH_IN_SQL, params) == 1
+
+
+def punch_out(code, out_time, out_photo_link, attendance_date=None):
+    """Record Out Time and Shift_Duration for the day. Returns True if a row was updated."""
+    if attendance_date is None:
+        attendance_date = clock.attendance_date()
+
+    def write_out_time(conn):
+        conn.create_function("shift_duration", 2, _sql_shift_duration, deterministic=True)
+        return conn.execute(PUNCH_OUT_SQL, (out_time, out_photo_link, out_time, code, attendance_date)).rowcount
+
+    return Database.run_write(write_out_time) == 1
+
+
+def record(code, attendance_date):
+    """(In_Time, Out_Time) of one day, or None."""
+    conn = Database.get_db_connection()
+    try:
+        return conn.execute('SELECT In_Time, Out_Time FROM Attendance WHERE Code = ? AND Attendance_Date = ?',
+                            (code, attendance_date)).fetchone()
+    finally:
+        conn.close()
+
+
+def mark_in(technician_code, technician_name, workstation_name, marked_by, attendance_time=None, attendance_date=None):
+    """A supervisor starts a technician's shift. marked_by (the supervisor's name) is kept as photo link and supervisor."""
+    attendance_date = attendance_date or clock.attendance_date()
+    attendance_time = attendance_time or clock.now().strftime(clock.MANUAL_TIME_FORMAT)
+    Database.execute_write(
+        '''
+        INSERT INTO Attendance (Code, Name, Workstation_Name, Attendance_Date, In_Time, In_Time_Photo_Link, Supervisor_Name)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(Code, Attendance_Date) DO UPDATE SET
+        In_Time = COALESCE(EXCLUDED.In_Time, In_Time),
+        In_Time_Photo_Link = COALESCE(EXCLUDED.In_Time_Photo_Link, In_Time_Photo_Link)
+        ''',
+        (technician_code, technician_name, workstation_name, attendance_date, attendance_time, marked_by, marked_by)
+    )
+    return attendance_time
+
+
+def mark_out(technician_code, marked_by, attendance_time=None, attendance_date=None):
+    """A supervisor ends a technician's shift, Shift_Duration comes from the stored In_Time."""
+    attendance_date = attendance_date or clock.attendance_date()
+    attendance_time = attendance_time or clock.now().strftime(clock.MANUAL_TIME_FORMAT)
+
+    def write_out_time(conn):
+        # Fetch In Time to calculate Shift Duration
+        row = conn.execute('SELECT In_Time FROM Attendance WHERE Code = ? AND Attendance_Date = ?',
+                           (technician_code, attendance_date)).fetchone()
+        in_time = row[0] if row else None
+
+        duration = None
+        if in_time:
+            try:
+                duration = str(shift_duration(in_time, attendance_time, clock.MANUAL_TIME_FORMAT))
+            except ValueError as e:
+                raise AttendanceError(f"Stored In Time {in_time!r} is not in the supervisor format") from e
+
+        conn.execute('''
+            UPDATE Attendance
+            SET Out_Time = ?, Out_Time_Photo_Link = ?, Shift_Duration = ?
+            WHERE Code = ? AND Attendance_Date = ?
+            ''', (attendance_time, marked_by, duration, technician_code, attendance_date))
+
+    Database.run_write(write_out_time)
+    return attendance_time
+
+
+def mark_past(technician_code, technician_name, workstation_name, attendance_date, in_time, out_time, marked_by):
+    """Insert a past day, or fill in the missing times of an existing one."""
+    duration = None
+    if in_time and out_time:
+        duration = str(shift_duration(in_time, out_time, clock.MANUAL_TIME_FORMAT))
+
+    Database.execute_write(
+        '''
+        INSERT INTO Attendance (Code, Name, Workstation_Name, Attendance_Date, In_Time, Out_Time, Shift_Duration, In_Time_Photo_Link, Out_Time_Photo_Link, Supervisor_Name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(Code, Attendance_Date) DO UPDATE SET
+        In_Time = COALESCE(EXCLUDED.In_Time, In_Time),
+        Out_Time = COALESCE(EXCLUDED.Out_Time, Out_Time),
+        Shift_Duration = COALESCE(EXCLUDED.Shift_Duration, Shift_Duration),
+        In_Time_Photo_Link = COALESCE(EXCLUDED.In_Time_Photo_Link, In_Time_Photo_Link),
+        Out_Time_Photo_Link = COALESCE(EXCLUDED.Out_Time_Photo_Link, Out_Time_Photo_Link)
+        ''',
+        (technician_code, technician_name, workstation_name, attendance_date, in_time, out_time, duration, marked_by, marked_by, marked_by)
+    )
+    return duration
+
+
+def set_holiday(code, attendance_date, remarks):
+    if not remarks or not remarks.strip():
+        raise ValidationError("Holiday remarks cannot be blank.")
+    return Database.execute_write('''
+        UPDATE Attendance
+        SET Holiday = 1, Holiday_Remarks = ?
+        WHERE Code = ? AND Attendance_Date = ?
+        ''', (remarks, code, attendance_date))
+
+
+def clear_holiday(code, attendance_date):
+    return Database.execute_write('''
+        UPDATE Attendance
+        SET Holiday = NULL, Holiday_Remarks = NULL
+        WHERE Code = ? AND Attendance_Date = ?
+        ''', (code, attendance_date))
+
+
+def technicians_with_shifts(supervisor_code):
+    """Technicians under a supervisor that have at least one finished shift, by name."""
+    conn = Database.get_db_connection()
+    try:
+        return pd.read_sql_query('''
+            SELECT DISTINCT u.Name AS Technician_Name, u.Code AS Technician_Code
+            FROM Attendance a
+            JOIN User_Credentials u ON a.Code = u.Code
+            WHERE u.Supervisor_Code = ? AND a.Shift_Duration IS NOT NULL
+            ORDER BY u.Name ASC
+        ''', conn, params=(supervisor_code,))
+    finally:
+        conn.close()
+
+
+def recent_shift_dates(code, days=30):
+    """Attendance_Date of the technician's finished shifts in the last `days` days, newest first."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    date_limit = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    date_expr = SQL_ATTENDANCE_DATE.format("Attendance_Date")
+    conn = Database.get_db_connection()
+    try:
+        rows = conn.execute(f'''
+            SELECT Attendance_Date
+            FROM Attendance
+            WHERE Code = ? AND Shift_Duration IS NOT NULL
+              AND {date_expr} BETWEEN DATE(?) AND DATE(?)
+            ORDER BY {date_expr} DESC
+        ''', (code, date_limit, today)).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+def supervisor_attendance(supervisor_code):
+    """Every Attendance row of the technicians under a supervisor, newest first."""
+    conn = Database.get_db_connection()
+    try:
+        return pd.read_sql_query('''
+            SELECT a.Code, a.Name, a.Workstation_Name, a.Attendance_Date, a.In_Time, a.In_Time_Photo_Link, a.Out_Time, a.Out_Time_Photo_Link,
+                   a.Supervisor_Name, a.Shift_Duration, a.Holiday, a.Holiday_Remarks
+            FROM Attendance a
+            JOIN User_Credentials u ON a.Code = u.Code
+            WHERE u.Supervisor_Code = ?
+            ORDER BY a.Attendance_Date DESC
+        ''', conn, params=(supervisor_code,))
+    finally:
+        conn.close()
+
+
+def past_attendance_settings():
+    """(enabled, days) of the past attendance option."""
+    # A company-wide setting, so it always lives in the main file, never in a shard
+    conn = Database.get_db_connection(Database.DB_PATH)
+    try:
+        settings = conn.execute("SELECT Status, Days FROM Past_Attendance LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    if not settings:
+        return False, 0
+    enabled = settings[0] == "Enabled"
+    return enabled, (settings[1] or 0) if enabled else 0
+
+
+def save_past_attendance_settings(enabled, days):
+    def save_settings(conn):
+        conn.execute("DELETE FROM Past_Attendance")  # Clear existing settings
+        conn.execute("INSERT INTO Past_Attendance (Status, Days) VALUES (?, ?)",
+                     ("Enabled" if enabled else "Disabled", int(days) if enabled else 0))
+
+    Database.run_write(save_settings, Database.DB_PATH)
+
+
+def validate_attendance(df):
+    """Raise ValidationError listing the missing columns or the first bad row of an upload."""
+    missing = [column for column in ATTENDANCE_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValidationError("Missing columns", [f"Missing column: {column}" for column in missing])
+
+    for index, row in df.iterrows():
+        if pd.isnull(row['Code']) or pd.isnull(row['Name']) or pd.isnull(row['Attendance_Date']) or pd.isnull(row['In_Time']) or pd.isnull(row['Supervisor_Name']):
+            raise ValidationError("Missing required data", [f"Error in row {index + 1}: Missing required data."])
+
+
+def replace_attendance(df, validate=True):
+    """Replace the Attendance table with an upload in one write."""
+    if validate:
+        validate_attendance(df)
+
+    if shards.enabled():
+        return shards.replace_table("Attendance", df, lambda conn, rows: conn.executemany(
+            INSERT_ATTENDANCE_SQL, rows[ATTENDANCE_COLUMNS].itertuples(index=False, name=None)))
+
+    def replace_rows(conn):
+        conn.execute("DELETE FROM Attendance")
+        conn.executemany(INSERT_ATTENDANCE_SQL, df[ATTENDANCE_COLUMNS].itertuples(index=False, name=None))
+
+    # Delete and reload run as one write, so the table is never seen half loaded
+    Database.run_write(replace_rows)
+    return len(df)
@@ -0,0 +1,378 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import Database
+from services import archive, clock
+from services.errors import BackupError, NotFound
+from services.images import current_folder
+
+# Snapshots live in backups/ beside the database they copy (each shard has its own)
+BACKUP_DIR = "backups"
+SNAPSHOT_PREFIX = "Tools_And_Tools-"
+KEEP = 7
+LOG_FILE = "backup_log.jsonl"
+
+# Pages copied per backup step and the pause between steps. The source is only
+# read-locked during a step, so writers get the database back in between.
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+# A write from another connection makes SQLite restart a stepped copy; after
+# this many restarts the copy is done in one step (one read transaction, which
+# WAL lets writers carry on beside).
+MAX_RESTARTS = 3
+
+# How often the stall probe asks for the write lock while a backup runs
+PROBE_INTERVAL = 0.05
+
+
+def backup_folder():
+    return os.path.join(os.path.dirname(os.path.abspath(Database.resolve_path())), BACKUP_DIR)
+
+
+def _blob_path(folder, digest):
+    # Photos and archive files are stored once per content, shared by every snapshot
+    return os.path.join(folder, "files", digest[:2], digest)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _stall_probe(path):
+    """Collect how long BEGIN IMMEDIATE waits (ms) while the block runs: the stall a punch-in would see."""
+    samples = []
+    stop = threading.Event()
+
+    def probe():
+        conn = sqlite3.connect(path, timeout=Database.BUSY_TIMEOUT, isolation_level=None)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                samples.append((time.perf_counter() - start) * 1000)
+                conn.execute("ROLLBACK")
+                stop.wait(PROBE_INTERVAL)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=probe, name="backup-stall-probe", daemon=True)
+    thread.start()
+    try:
+        yield samples
+    finally:
+        stop.set()
+        thread.join()
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy_pages(source_path, target_path, pages, sleep):
+    """Copy a database with the online backup API. Returns step and restart counts."""
+    stats = {"steps": 0, "restarts": 0, "pages": 0}
+
+    def progress(status, remaining, total):
+        copied = total - remaining
+        if stats["steps"] and copied < stats["copied"]:
+            stats["restarts"] += 1
+            if stats["restarts"] >= MAX_RESTARTS:
+                raise _Restarted()
+        stats["steps"] += 1
+        stats["copied"] = copied
+        stats["pages"] = total
+        if remaining:
+            # The step's read lock is already released here; backup()'s own sleep only applies after SQLITE_BUSY
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_path, timeout=Database.BUSY_TIMEOUT)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except _Restarted:
+                source.backup(target, pages=-1)
+                stats["steps"] += 1
+            target.execute("PRAGMA journal_mode=DELETE")
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            target.close()
+    finally:
+        source.close()
+    stats.pop("copied", None)
+    if check != "ok":
+        raise BackupError(f"The copy failed its integrity check: {check}")
+    return stats
+
+
+def _tracked_files(root, previous):
+    """{path relative to root: [sha256, size, mtime_ns]} of the photos and archive files.
+
+    Files whose size and mtime match the previous manifest keep their hash, so
+    only new or rewritten photos are read.
+    """
+    files = {}
+    # Both folders are resolved against the working directory, as the app does
+    for folder in (os.path.abspath(current_folder()), os.path.join(root, archive.ARCHIVE_DIR)):
+        if not os.path.isdir(folder):
+            continue
+        for directory, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(("-wal", "-shm", "-journal", ".compact")):
+                    continue
+                stat = os.stat(path)
+                relative = os.path.relpath(path, root).replace(os.sep, "/")
+                known = previous.get(relative)
+                if known and known[1:] == [stat.st_size, stat.st_mtime_ns]:
+                    files[relative] = known
+                else:
+                    files[relative] = [_sha256(path), stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def snapshots():
+    """Manifests of the snapshots in backups/, newest first."""
+    folder = backup_folder()
+    if not os.path.isdir(folder):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(folder), reverse=True):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(".json"):
+            with open(os.path.join(folder, name), encoding="utf-8") as file:
+                manifests.append(json.load(file))
+    return manifests
+
+
+def find(name="latest"):
+    """The manifest of a snapshot by name (or its timestamp), or the newest one for 'latest'."""
+    for manifest in snapshots():
+        if name in ("latest", manifest["name"], manifest["name"][len(SNAPSHOT_PREFIX):]):
+            return manifest
+    raise NotFound(f"No snapshot {name} in {backup_folder()}")
+
+
+def rotate(keep=KEEP):
+    """Delete all but the newest `keep` snapshots and the stored files only they used. Returns the names removed."""
+    folder = backup_folder()
+    manifests = snapshots()
+    removed = []
+    for manifest in manifests[keep:]:
+        for suffix in (".sqlite.gz", ".json"):
+            path = os.path.join(folder, manifest["name"] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(manifest["name"])
+
+    used = {entry[0] for manifest in manifests[:keep] for entry in manifest["files"].values()}
+    files_folder = os.path.join(folder, "files")
+    if os.path.isdir(files_folder):
+        for directory, _, names in os.walk(files_folder):
+            for name in names:
+                if name not in used:
+                    os.remove(os.path.join(directory, name))
+    return removed
+
+
+def _log(folder, stats):
+    with open(os.path.join(folder, LOG_FILE), "a", encoding="utf-8") as file:
+        file.write(json.dumps(stats) + "\n")
+
+
+def history(limit=20):
+    """The last `limit` backup runs (timings, stall, sizes), newest first."""
+    path = os.path.join(backup_folder(), LOG_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        lines = file.readlines()[-limit:]
+    return [json.loads(line) for line in reversed(lines)]
+
+
+def snapshot(keep=KEEP, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Back up the (routed) database while the app keeps running.
+
+    The pages are copied with the SQLite backup API a few at a time, the copy
+    is checked and gzipped, and the photos and archive files are added to
+    the manifest (new ones copied into backups/files/). Old snapshots are
+    rotated out. Returns the run's stats, which are also appended to the log.
+    """
+    started = time.perf_counter()
+    db_path = os.path.abspath(Database.resolve_path())
+    root = os.path.dirname(db_path)
+    folder = backup_folder()
+    os.makedirs(folder, exist_ok=True)
+    name = SNAPSHOT_PREFIX + clock.now().strftime("%Y%m%d-%H%M%S")
+    copy_path = os.path.join(folder, name + ".sqlite")
+
+    copy_start = time.perf_counter()
+    with _stall_probe(db_path) as stalls:
+        copy = _copy_pages(db_path, copy_path, pages, sleep)
+    copy_seconds = time.perf_counter() - copy_start
+
+    try:
+        digest = _sha256(copy_path)
+        size = os.path.getsize(copy_path)
+        with open(copy_path, "rb") as source, gzip.open(os.path.join(folder, name + ".sqlite.gz"), "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    finally:
+        os.remove(copy_path)
+
+    previous = snapshots()
+    files = _tracked_files(root, previous[0]["files"] if previous else {})
+    new_files = 0
+    for relative, (file_digest, _, _) in files.items():
+        blob = _blob_path(folder, file_digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            shutil.copyfile(os.path.join(root, relative), blob + ".part")
+            os.replace(blob + ".part", blob)
+            new_files += 1
+
+    manifest = {
+        "name": name,
+        "created": clock.timestamp(),
+        "database": {"file": os.path.basename(db_path), "sha256": digest, "bytes": size},
+        "files": files,
+    }
+    # The manifest is written last: a snapshot without one is incomplete and ignored
+    with open(os.path.join(folder, name + ".json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    removed = rotate(keep)
+
+    stalls = sorted(stalls)
+    stats = {
+        "name": name,
+        "created": manifest["created"],
+        "seconds": round(time.perf_counter() - started, 3),
+        "copy_seconds": round(copy_seconds, 3),
+        "pages": copy["pages"],
+        "steps": copy["steps"],
+        "restarts": copy["restarts"],
+        "stall_max_ms": round(stalls[-1], 2) if stalls else None,
+        "stall_p99_ms": round(stalls[min(len(stalls) - 1, int(len(stalls) * 0.99))], 2) if stalls else None,
+        "bytes": size,
+        "gzip_bytes": os.path.getsize(os.path.join(folder, name + ".sqlite.gz")),
+        "files": len(files),
+        "new_files": new_files,
+        "rotated": removed,
+    }
+    _log(folder, stats)
+    return stats
+
+
+def _unpack(folder, manifest, target):
+    with gzip.open(os.path.join(folder, manifest["name"] + ".sqlite.gz"), "rb") as source, open(target, "wb") as file:
+        shutil.copyfileobj(source, file, 1024 * 1024)
+
+
+def _table_counts(conn):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def verify(name="latest"):
+    """Check a snapshot without touching the live data. Returns {table: rows} of the snapshot.
+
+    The unpacked database has to match the manifest's hash and pass
+    PRAGMA integrity_check, and every stored file has to match its hash.
+    """
+    manifest = find(name)
+    folder = backup_folder()
+    unpacked = os.path.join(folder, manifest["name"] + ".verify.sqlite")
+    try:
+        _unpack(folder, manifest, unpacked)
+        if _sha256(unpacked) != manifest["database"]["sha256"]:
+            raise BackupError(f"{manifest['name']}: the database does not match its manifest")
+        conn = sqlite3.connect(unpacked)
+        try:
+            check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            counts = _table_counts(conn)
+        finally:
+            conn.close()
+        if check != "ok":
+            raise BackupError(f"{manifest['name']}: integrity check failed: {check}")
+    finally:
+        if os.path.exists(unpacked):
+            os.remove(unpacked)
+
+    missing = [relative for relative, (digest, _, _) in manifest["files"].items()
+               if not os.path.exists(_blob_path(folder, digest)) or _sha256(_blob_path(folder, digest)) != digest]
+    if missing:
+        raise BackupError(f"{manifest['name']}: {len(missing)} stored files are missing or damaged, e.g. {', '.join(missing[:5])}")
+    return counts
+
+
+def restore(name="latest"):
+    """Replace the (routed) database and its photos with a snapshot, then check the result.
+
+    Meant to run with the app stopped. The snapshot is verified first, so a
+    bad one never touches the live file. Photos are put back where missing or
+    changed; photos taken after the snapshot are left alone. Table_Versions
+    counters only move forward, so API clients never revalidate against the
+    restored data with an older ETag.
+    """
+    counts = verify(name)
+    manifest = find(name)
+    folder = backup_folder()
+    db_path = os.path.abspath(Database.resolve_path())
+    root = os.path.dirname(db_path)
+
+    live = sqlite3.connect(db_path, timeout=Database.BUSY_TIMEOUT)
+    try:
+        live_versions = dict(live.execute("SELECT Table_Name, Version FROM Table_Versions").fetchall())
+        live_sequences = dict(live.execute("SELECT name, seq FROM sqlite_sequence").fetchall())
+    except sqlite3.OperationalError:
+        live_versions, live_sequences = {}, {}
+    finally:
+        live.close()
+
+    unpacked = os.path.join(folder, manifest["name"] + ".restore.sqlite")
+    try:
+        _unpack(folder, manifest, unpacked)
+        source = sqlite3.connect(unpacked)
+        live = sqlite3.connect(db_path, timeout=Database.BUSY_TIMEOUT)
+        try:
+            source.backup(live)
+            with live:
+                for table_name, version in live_versions.items():
+                    live.execute("UPDATE Table_Versions SET Version = MAX(Version, ?) + 1 WHERE Table_Name = ?", (version, table_name))
+                # Change_Log consumers may have seen Seqs past the snapshot: continue after them and tell them to resync
+                live.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'Change_Log'", (live_sequences.get("Change_Log", 0),))
+                live.execute("INSERT INTO Change_Log (Table_Name, Operation, Row_Key) VALUES ('*', 'restore', json_object('snapshot', ?))",
+                             (manifest["name"],))
+            restored = _table_counts(live)
+        finally:
+            live.close()
+            source.close()
+    finally:
+        if os.path.exists(unpacked):
+            os.remove(unpacked)
+
+    mismatched = [table for table, rows in counts.items() if table not in ("Table_Versions", "Change_Log", "sqlite_sequence") and restored.get(table) != rows]
+    if mismatched:
+        raise BackupError(f"{manifest['name']}: restored row counts differ in {', '.join(mismatched)}")
+
+    files_restored = 0
+    for relative, (digest, _, _) in manifest["files"].items():
+        path = os.path.join(root, relative)
+        if os.path.exists(path) and _sha256(path) == digest:
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(_blob_path(folder, digest), path + ".part")
+        os.replace(path + ".part", path)
+        files_restored += 1
+    return {"name": manifest["name"], "tables": restored, "files": len(manifest["files"]), "files_restored": files_restored}
@@ -0,0 +1,109 @@
+import os
+
+import openpyxl
+import pandas as pd
+
+import Database
+from services import passwords, schema, shards
+from services.attendance import ATTENDANCE_COLUMNS, INSERT_ATTENDANCE_SQL, validate_attendance
+from services.errors import ValidationError
+from services.users import INSERT_USER_SQL, USER_COLUMNS, validate_users
+
+# Rows held in memory at once while reading an import file
+CHUNK_ROWS = 5000
+
+
+def _frame(columns, rows, start):
+    # Index rows by their position in the file so validation errors name the right row
+    return pd.DataFrame(rows, columns=columns, index=range(start, start + len(rows)))
+
+
+def _xlsx_chunks(path, chunk_rows):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(column) for column in header]
+        buffer, start = [], 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_rows:
+                yield _frame(columns, buffer, start)
+                start += len(buffer)
+                buffer = []
+        if buffer or not start:
+            # A header-only sheet still yields one (empty) frame so its columns get checked
+            yield _frame(columns, buffer, start)
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """DataFrames of at most chunk_rows rows from a .xlsx or .csv file, first sheet only."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(path, chunksize=chunk_rows)
+    if extension == ".xlsx":
+        return _xlsx_chunks(path, chunk_rows)
+    raise ValidationError(f"Unsupported file type {extension}", [f"{path}: expected a .xlsx or .csv file"])
+
+
+def _rows(df, columns):
+    return (Database.sql_values(row) for row in df[columns].itertuples(index=False, name=None))
+
+
+def _import(path, table_name, columns, insert_sql, validate, chunk_rows, dry_run, prepare=None):
+    # First pass: validate every chunk before the table is touched. prepare(chunk)
+    # does slow per-row work (password hashing) here too, outside the write, and
+    # returns {column: values} to put into the chunk in the second pass.
+    total = 0
+    prepared = []
+    for chunk in read_chunks(path, chunk_rows):
+        validate(chunk)
+        if prepare is not None and not dry_run:
+            prepared.append(prepare(chunk))
+        total += len(chunk)
+    if dry_run:
+        return total
+
+    # Second pass: delete and reload in one write, so readers never see the table half loaded
+    def replace_rows(conn, wanted=None):
+        conn.execute(f"DELETE FROM {table_name}")
+        for index, chunk in enumerate(read_chunks(path, chunk_rows)):
+            if prepare is not None:
+                chunk = chunk.assign(**prepared[index])
+            if wanted is not None:
+                chunk = chunk[wanted(shards.row_keys(table_name, chunk))]
+            conn.executemany(insert_sql, _rows(chunk, columns))
+        if table_name == "User_Credentials":
+            schema.rebuild_org(conn)
+
+    # A large file may take longer than a page write is allowed to, so wait for it
+    if shards.enabled() and table_name in shards.SHARDED_TABLES:
+        # One pass over the file per shard keeps memory flat and each shard's reload atomic
+        supervisors = shards.keys()
+        for key in supervisors:
+            Database.run_write(lambda conn, key=key: replace_rows(conn, lambda keys: keys == key),
+                               shards.ensure(key), timeout=None, label=f"import: {table_name}")
+        Database.run_write(lambda conn: replace_rows(conn, lambda keys: ~keys.isin(supervisors)),
+                           Database.DB_PATH, timeout=None, label=f"import: {table_name}")
+    else:
+        Database.run_write(replace_rows, Database.DB_PATH, timeout=None, label=f"import: {table_name}")
+        if table_name == "User_Credentials":
+            shards.sync_users()
+    return total
+
+
+def import_users(path, chunk_rows=CHUNK_ROWS, dry_run=False):
+    """Replace User_Credentials with a .xlsx/.csv file. Returns the number of rows."""
+    return _import(path, "User_Credentials", USER_COLUMNS, INSERT_USER_SQL, validate_users, chunk_rows, dry_run,
+                   prepare=lambda chunk: {"Password": passwords.hash_many(chunk["Password"])})
+
+
+def import_attendance(path, chunk_rows=CHUNK_ROWS, dry_run=False):
+    """Replace Attendance with a .xlsx/.csv file. Returns the number of rows."""
+    return _import(path, "Attendance", ATTENDANCE_COLUMNS, INSERT_ATTENDANCE_SQL, validate_attendance, chunk_rows, dry_run)
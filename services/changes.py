@@ -0,0 +1,188 @@
+import csv
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+import Database
+from services import schema
+from services.errors import ValidationError
+
+CHANGE_COLUMNS = ["Seq", "Table_Name", "Operation", "Row_Key", "Row_Data", "Changed_At"]
+# Rows read from Change_Log per query while exporting or syncing
+CHUNK_ROWS = 5000
+# Change_Log rows older than this are dropped by prune()
+KEEP_DAYS = 35
+
+# A restore rewinds the data; consumers that see this row have to start over from a full copy
+RESTORE_OPERATION = "restore"
+
+CHANGES_SQL = '''
+    SELECT Seq, Table_Name, Operation, Row_Key, Row_Data, Changed_At
+    FROM Change_Log
+    WHERE Seq > ? {where}
+    ORDER BY Seq
+    LIMIT ?
+'''
+
+
+def latest(conn=None):
+    """The last Seq handed out, 0 if nothing has been logged. Pruning does not lower it."""
+    with Database.connection(conn) as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Change_Log'").fetchone()
+        return row[0] if row else 0
+
+
+def oldest(conn=None):
+    """The first Seq still in Change_Log, or None when it is empty."""
+    with Database.connection(conn) as conn:
+        return conn.execute("SELECT MIN(Seq) FROM Change_Log").fetchone()[0]
+
+
+def since(seq, limit=CHUNK_ROWS, tables=None, conn=None):
+    """Up to `limit` changes after `seq`, oldest first, as a DataFrame with CHANGE_COLUMNS."""
+    where, params = "", []
+    if tables:
+        where = f"AND Table_Name IN ({', '.join('?' for _ in tables)})"
+        params = list(tables)
+    with Database.reading(conn) as conn:
+        return pd.read_sql_query(CHANGES_SQL.format(where=where), conn, params=[seq, *params, limit])
+
+
+def iter_since(seq, tables=None, chunk_rows=CHUNK_ROWS):
+    """Every change after `seq` as tuples in CHANGE_COLUMNS order, read chunk_rows at a time."""
+    where, params = "", []
+    if tables:
+        where = f"AND Table_Name IN ({', '.join('?' for _ in tables)})"
+        params = list(tables)
+    with Database.reading() as conn:
+        while True:
+            rows = conn.execute(CHANGES_SQL.format(where=where), [seq, *params, chunk_rows]).fetchall()
+            yield from rows
+            if len(rows) < chunk_rows:
+                return
+            seq = rows[-1][0]
+
+
+def export(seq, output, tables=None):
+    """Write the changes after `seq` to a .csv or .jsonl file. Returns (rows written, last Seq).
+
+    Pass the returned Seq as `seq` next time to get only what changed since.
+    """
+    extension = os.path.splitext(output)[1].lower()
+    if extension not in (".csv", ".jsonl"):
+        raise ValidationError(f"Unsupported file type {extension}", [f"{output}: expected a .csv or .jsonl file"])
+
+    count, last = 0, seq
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file) if extension == ".csv" else None
+        if writer:
+            writer.writerow(CHANGE_COLUMNS)
+        for row in iter_since(seq, tables):
+            if writer:
+                writer.writerow(row)
+            else:
+                record = dict(zip(CHANGE_COLUMNS, row))
+                record["Row_Key"] = json.loads(record["Row_Key"])
+                record["Row_Data"] = json.loads(record["Row_Data"]) if record["Row_Data"] else None
+                file.write(json.dumps(record) + "\n")
+            count, last = count + 1, row[0]
+    return count, last
+
+
+def prune(keep_days=KEEP_DAYS):
+    """Drop Change_Log rows older than keep_days. Returns the number removed."""
+    # Changed_At is UTC (CURRENT_TIMESTAMP). Seq keeps counting from the highest
+    # value ever used, so pruning never reuses a number.
+    return Database.run_write(lambda conn: conn.execute("DELETE FROM Change_Log WHERE Changed_At < datetime('now', ?)",
+                                                        (f"-{int(keep_days)} days",)).rowcount,
+                              timeout=None, label="changes: prune")
+
+
+def _mirror_state(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS Mirror_State (Source TEXT PRIMARY KEY, Seq INTEGER)")
+    return conn
+
+
+def _full_copy(source_path, target):
+    """Replace the mirror with a consistent copy of the source. Returns the Seq the copy includes."""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    conn = Database.get_db_connection(source_path)
+    try:
+        # VACUUM INTO reads one snapshot, so the copy and its Change_Log agree
+        conn.execute("VACUUM INTO ?", (target,))
+    finally:
+        conn.close()
+
+    mirror = sqlite3.connect(target)
+    try:
+        with mirror:
+            # The mirror only replays the source's log, it does not keep one of its own
+            for (name,) in mirror.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_Change_%'").fetchall():
+                mirror.execute(f"DROP TRIGGER {name}")
+            row = mirror.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Change_Log'").fetchone()
+            seq = row[0] if row else 0
+            mirror.execute("DELETE FROM Change_Log")
+            _mirror_state(mirror).execute("INSERT OR REPLACE INTO Mirror_State (Source, Seq) VALUES (?, ?)",
+                                          (os.path.abspath(source_path), seq))
+        mirror.execute("VACUUM")
+    finally:
+        mirror.close()
+    return seq
+
+
+def _apply(conn, table, operation, row_key, row_data):
+    key = json.loads(row_key)
+    conn.execute(f"DELETE FROM {table} WHERE " + " AND ".join(f"{column} = ?" for column in key), tuple(key.values()))
+    if operation in ("insert", "update"):
+        data = json.loads(row_data)
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(data)}) VALUES ({', '.join('?' for _ in data)})",
+                     tuple(data.values()))
+
+
+def sync_mirror(target, chunk_rows=CHUNK_ROWS):
+    """Bring a mirror database up to date with the (routed) database. Returns (changes applied, Seq).
+
+    The first run, or a run after the source was restored from a backup,
+    copies the whole file; later runs replay only the Change_Log rows added
+    since. Rows moved out by services.archive are dropped from the mirror too.
+    """
+    source_path = os.path.abspath(Database.resolve_path())
+    target = os.path.abspath(target)
+    seq = None
+    if os.path.exists(target):
+        mirror = _mirror_state(sqlite3.connect(target))
+        try:
+            row = mirror.execute("SELECT Seq FROM Mirror_State WHERE Source = ?", (source_path,)).fetchone()
+        finally:
+            mirror.close()
+        seq = row[0] if row else None
+    first = oldest()
+    # Unknown, from before a restore, or older than what prune() kept: start over
+    if seq is None or seq > latest() or (first is not None and seq < first - 1):
+        return 0, _full_copy(source_path, target)
+
+    applied = 0
+    mirror = sqlite3.connect(target)
+    try:
+        while True:
+            rows = since(seq, chunk_rows, tables=[*schema.CHANGE_LOGGED_TABLES, "*"])
+            if rows.empty:
+                break
+            if (rows["Operation"] == RESTORE_OPERATION).any():
+                mirror.close()
+                return applied, _full_copy(source_path, target)
+            with mirror:
+                for change in rows.itertuples(index=False):
+                    _apply(mirror, change.Table_Name, change.Operation, change.Row_Key, change.Row_Data)
+                if (rows["Table_Name"] == "User_Credentials").any():
+                    schema.rebuild_org(mirror)
+                seq = int(rows["Seq"].iloc[-1])
+                mirror.execute("UPDATE Mirror_State SET Seq = ? WHERE Source = ?", (seq, source_path))
+            applied += len(rows)
+    finally:
+        mirror.close()
+    return applied, seq
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import pytz
+
+# Every date the app stores is an Indian date
+IST = pytz.timezone("Asia/Kolkata")
+
+ATTENDANCE_DATE_FORMAT = "%d-%m-%Y"   # Attendance.Attendance_Date
+PUNCH_TIME_FORMAT = "%I.%M.%S %p"     # In_Time / Out_Time from the camera punch
+MANUAL_TIME_FORMAT = "%I:%M:%S %p"    # In_Time / Out_Time marked by a supervisor
+SALES_DATE_FORMAT = "%Y-%m-%d"        # Workstation_Data.date / Advisor_Data.date
+
+
+def now():
+    return datetime.now(IST)
+
+
+def attendance_date(day=None):
+    """A date (today by default) as stored in Attendance_Date."""
+    return (day or now()).strftime(ATTENDANCE_DATE_FORMAT)
+
+
+def timestamp():
+    return now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def to_iso(attendance_date_text):
+    """'DD-MM-YYYY' -> 'YYYY-MM-DD', for comparisons done in SQL."""
+    return datetime.strptime(attendance_date_text, ATTENDANCE_DATE_FORMAT).strftime(SALES_DATE_FORMAT)
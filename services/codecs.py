@@ -0,0 +1,95 @@
+import io
+import os
+
+from PIL import Image, UnidentifiedImageError
+
+from services.errors import ImageError
+
+# Which backend compresses punch photos: "pillow" or "opencv"
+CODEC = os.environ.get("TOOLS_IMAGE_CODEC", "pillow")
+
+# Longer side of a stored photo. Camera frames are smaller than this and are
+# kept as they are; larger uploads are decoded at a reduced scale and shrunk.
+MAX_SIDE = 800
+
+
+def _reduction(size, max_side):
+    """Largest JPEG DCT scale (1, 2, 4 or 8) that keeps the longer side at or above max_side."""
+    scale = 1
+    while scale < 8 and max(size) // (scale * 2) >= max_side:
+        scale *= 2
+    return scale
+
+
+class PillowCodec:
+    name = "pillow"
+
+    def decode(self, data, max_side=MAX_SIDE):
+        try:
+            image = Image.open(io.BytesIO(data))
+            # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of the full frame
+            image.draft("RGB", (max_side, max_side))
+            image = image.convert("RGB")
+        except (UnidentifiedImageError, OSError) as e:
+            raise ImageError(f"Could not read the photo: {e}") from e
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side))
+        return image
+
+    def encode(self, image, quality):
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality)
+        return output.getvalue()
+
+
+class OpenCVCodec:
+    name = "opencv"
+
+    def __init__(self):
+        import cv2
+        import numpy
+
+        self.cv2 = cv2
+        self.numpy = numpy
+
+    def decode(self, data, max_side=MAX_SIDE):
+        cv2 = self.cv2
+        # Same orientation as the Pillow backend (which does not apply EXIF rotation)
+        flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        try:
+            # Only the header is parsed here, to pick the reduced decode
+            size = Image.open(io.BytesIO(data)).size
+        except (UnidentifiedImageError, OSError) as e:
+            raise ImageError(f"Could not read the photo: {e}") from e
+        reduced = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+        scale = _reduction(size, max_side)
+        if scale > 1:
+            flags = reduced[scale] | cv2.IMREAD_IGNORE_ORIENTATION
+        image = cv2.imdecode(self.numpy.frombuffer(data, dtype=self.numpy.uint8), flags)
+        if image is None:
+            raise ImageError("Could not read the photo")
+        height, width = image.shape[:2]
+        if max(height, width) > max_side:
+            ratio = max_side / max(height, width)
+            image = cv2.resize(image, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA)
+        return image
+
+    def encode(self, image, quality):
+        ok, encoded = self.cv2.imencode(".jpg", image, [self.cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ImageError("Could not encode the photo")
+        return encoded.tobytes()
+
+
+CODECS = {codec.name: codec for codec in (PillowCodec, OpenCVCodec)}
+_instances = {}
+
+
+def get_codec(name=None):
+    """The codec named by `name`, or by TOOLS_IMAGE_CODEC."""
+    name = name or CODEC
+    if name not in CODECS:
+        raise ValueError(f"Unknown image codec {name!r}, expected one of {', '.join(CODECS)}")
+    if name not in _instances:
+        _instances[name] = CODECS[name]()
+    return _instances[name]
@@ -0,0 +1,146 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from services import passwords, users
+from services.errors import RateLimited
+
+# The Super Admin is not a User_Credentials row. Its password is only the
+# TOOLS_SUPER_ADMIN_HASH setting (the output of `ToolsCli.py hash-password`);
+# without it nobody can log in as the Super Admin.
+SUPER_ADMIN_CODE = os.environ.get("TOOLS_SUPER_ADMIN_CODE", "Amit")
+SUPER_ADMIN_NAME = os.environ.get("TOOLS_SUPER_ADMIN_NAME", SUPER_ADMIN_CODE)
+SUPER_ADMIN_HASH = os.environ.get("TOOLS_SUPER_ADMIN_HASH") or None
+
+logger = logging.getLogger("toolsapp.credentials")
+
+# Logins allowed in a burst, and seconds until one more is allowed
+CODE_BURST, CODE_REFILL_SECONDS = 5, 30
+ADDRESS_BURST, ADDRESS_REFILL_SECONDS = 30, 2
+# Buckets kept; past this the least recently used one is dropped
+MAX_BUCKETS = 10000
+
+# How long a login stays valid without logging in again
+SESSION_TTL = 12 * 60 * 60
+
+
+class TokenBucket:
+    """`capacity` attempts at once, refilled by one every `refill_seconds`."""
+
+    def __init__(self, capacity, refill_seconds):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait(self, now):
+        """Seconds until a token is available, 0 if one is available now."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.refill_seconds)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) * self.refill_seconds
+
+    def take(self):
+        self.tokens -= 1
+
+
+class LoginLimiter:
+    """Per user code and per client address token buckets, checked before any database work."""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, capacity, refill_seconds):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, refill_seconds)
+            if len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, code, address=None):
+        """Use one attempt of the code and of the address, or raise RateLimited if either has none left."""
+        now = time.monotonic()
+        with self._lock:
+            buckets = [self._bucket(("code", code), CODE_BURST, CODE_REFILL_SECONDS)]
+            if address:
+                buckets.append(self._bucket(("address", address), ADDRESS_BURST, ADDRESS_REFILL_SECONDS))
+            wait = max(bucket.wait(now) for bucket in buckets)
+            if wait:
+                # Nothing is spent on a refused attempt, so a blocked address cannot drain a code's bucket
+                raise RateLimited("Too many login attempts", int(wait) + 1)
+            for bucket in buckets:
+                bucket.take()
+
+
+limiter = LoginLimiter()
+
+# token -> (user dict, expiry on time.monotonic())
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def start_session(user):
+    """Issue a session token for a verified user."""
+    token = secrets.token_urlsafe(32)
+    now = time.monotonic()
+    with _sessions_lock:
+        for expired in [key for key, (_, expires) in _sessions.items() if expires <= now]:
+            del _sessions[expired]
+        _sessions[token] = (dict(user), now + SESSION_TTL)
+    return token
+
+
+def session_user(token):
+    """The user a token was issued for, from memory, or None once it expired or was revoked."""
+    if token is None:
+        return None
+    with _sessions_lock:
+        session = _sessions.get(token)
+        if session is None:
+            return None
+        user, expires = session
+        if expires <= time.monotonic():
+            del _sessions[token]
+            return None
+        return dict(user)
+
+
+def revoke(codes=None):
+    """End the sessions of the given user codes, or every session. Returns how many ended."""
+    with _sessions_lock:
+        tokens = [token for token, (user, _) in _sessions.items() if codes is None or user["code"] in codes]
+        for token in tokens:
+            del _sessions[token]
+    return len(tokens)
+
+
+def revoke_missing(codes):
+    """End the sessions of users that are not in `codes` any more, e.g. after a user upload."""
+    keep = set(codes) | {SUPER_ADMIN_CODE}
+    with _sessions_lock:
+        missing = {user["code"] for user, _ in _sessions.values()} - keep
+    return revoke(missing)
+
+
+def login(code, password, address=None):
+    """The user dict for valid credentials, or None. Raises RateLimited during a flood.
+
+    The limiter runs first, so a flood is turned away without a query or a
+    hash. Pass what the page keeps about the user to start_session() next.
+    """
+    limiter.check(code, address)
+    if code == SUPER_ADMIN_CODE:
+        if SUPER_ADMIN_HASH is None:
+            logger.warning("Super Admin login refused: TOOLS_SUPER_ADMIN_HASH is not set. Set it to the output of "
+                           "`python ToolsCli.py hash-password` and restart the app.")
+            return None
+        if not passwords.verify_password(password, SUPER_ADMIN_HASH):
+            return None
+        return {"code": code, "name": SUPER_ADMIN_NAME, "supervisor_code": None, "role": "Super Admin", "target": None}
+    return users.authenticate(code, password)
@@ -0,0 +1,42 @@
+# Errors raised by the service layer. Pages turn them into st.error / st.warning,
+# scripts and workers can catch them by type.
+
+
+class ServiceError(Exception):
+    """Base class for every error the services raise on purpose."""
+
+
+class NotFound(ServiceError):
+    """A user, record or setting the caller asked for does not exist."""
+
+
+class ValidationError(ServiceError):
+    """Input that cannot be stored. `problems` lists one message per bad row or column."""
+
+    def __init__(self, message, problems=None):
+        super().__init__(message)
+        self.problems = list(problems or [])
+
+
+class AttendanceError(ServiceError):
+    """A punch that does not fit the day's record, e.g. punching out before punching in."""
+
+
+class ImageError(ServiceError):
+    """Photo bytes that could not be read as an image."""
+
+
+class BackupError(ServiceError):
+    """A snapshot that is missing, incomplete or fails verification."""
+
+
+class RateLimited(ServiceError):
+    """Too many attempts from one user code or address. `retry_after` is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobCancelled(ServiceError):
+    """A background build (services.jobs) stopped because its user cancelled it."""
@@ -0,0 +1,108 @@
+import io
+import os
+import zipfile
+
+import Database
+from services import clock, codecs
+
+IMAGES_DIR = "Images"
+MAX_FOLDER_SIZE = 50 * 1024 * 1024
+MAX_PHOTO_BYTES = 50 * 1024
+
+
+def current_folder():
+    """Images/ next to the database this thread is routed to (a shard keeps its photos beside it)."""
+    path = Database.routed_path()
+    return IMAGES_DIR if path is None else os.path.join(os.path.dirname(path), IMAGES_DIR)
+
+
+# Ensure Images folder exists
+def ensure_folder(folder=None):
+    os.makedirs(folder or current_folder(), exist_ok=True)
+
+
+# Delete the oldest photos until the folder is under max_folder_size
+def trim_folder(folder=None, max_folder_size=MAX_FOLDER_SIZE):
+    folder = folder or current_folder()
+    files = []
+    total_size = 0
+    for entry in os.scandir(folder):
+        if entry.is_file():
+            stat = entry.stat()
+            total_size += stat.st_size
+            files.append((stat.st_ctime, entry.path, stat.st_size))
+
+    # Oldest first
+    files.sort()
+    removed = 0
+    while total_size > max_folder_size and files:
+        _, path, size = files.pop(0)
+        os.remove(path)
+        total_size -= size
+        removed += 1
+    return removed
+
+
+def photo_path(code, punch_type, day=None, folder=None):
+    # Image name format: "id_date_punchtype", a second punch of the same type overwrites the first
+    return os.path.join(folder or current_folder(), f"{code}_{clock.attendance_date(day)}_{punch_type}.jpg")
+
+
+def compress_photo(image_bytes, max_bytes=MAX_PHOTO_BYTES, codec=None):
+    """Re-encode a photo as RGB JPEG at the highest quality (95 down to 5, in steps of 5) that fits in max_bytes.
+
+    The quality is found by galloping down from 95 and bisecting, so a photo
+    takes one or two encodes when it nearly fits and at most seven otherwise,
+    instead of one per step. codec is a services.codecs backend name.
+    """
+    codec = codecs.get_codec(codec)
+    image = codec.decode(image_bytes)
+
+    qualities = list(range(95, 0, -5))
+    fits = {}
+
+    def fitting(index):
+        data = codec.encode(image, qualities[index])
+        fits[index] = data if len(data) <= max_bytes else None
+        return fits[index] is not None
+
+    # Gallop down from the top quality (most frames fit at 95 or 90), then bisect
+    # between the last step that was too big and the first that fits
+    previous, index, step = -1, 0, 1
+    while not fitting(index):
+        if index == len(qualities) - 1:
+            # Nothing fits: keep the lowest quality, as before
+            return codec.encode(image, qualities[-1])
+        previous, index, step = index, min(index + step, len(qualities) - 1), step * 2
+    low, high = previous + 1, index - 1
+    while low <= high:
+        middle = (low + high) // 2
+        if fitting(middle):
+            index, high = middle, middle - 1
+        else:
+            low = middle + 1
+    return fits[index]
+
+
+def save_photo(image_bytes, code, punch_type, day=None, folder=None):
+    """Store a punch photo and return its path (the link saved in Attendance)."""
+    folder = folder or current_folder()
+    ensure_folder(folder)
+    trim_folder(folder)
+    path = photo_path(code, punch_type, day, folder)
+    data = compress_photo(image_bytes)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def zip_folder(folder=None, target=None):
+    """The photo folder as ZIP bytes, or written to target (a path or file object) when given."""
+    folder = folder or current_folder()
+    output = io.BytesIO() if target is None else target
+    with zipfile.ZipFile(output, 'w') as zipf:
+        for root, _, files in os.walk(folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(file_path, os.path.relpath(file_path, folder))
+    return output.getvalue() if target is None else None
@@ -0,0 +1,240 @@
+import contextvars
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import Database
+from services.errors import JobCancelled
+
+# Report and export builds run in these processes instead of on the page's
+# script thread, so one big export does not hold the GIL every other session
+# needs. TOOLS_JOB_WORKERS=0 runs them on a thread of the app process instead.
+WORKERS = int(os.environ.get("TOOLS_JOB_WORKERS", 2))
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "tools_jobs")
+# Job folders untouched for this long are removed, e.g. those of closed browser tabs
+KEEP_SECONDS = 6 * 3600
+# Seconds between progress writes of a running job; cancellation is checked on every report()
+REPORT_INTERVAL = 0.25
+
+PROGRESS_FILE = "progress.json"
+CANCEL_FILE = "cancel"
+
+_pool = None
+_pool_lock = threading.Lock()
+# job id -> Job, for the jobs this process submitted
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Folder of the job running in this process (or thread), for report()
+_current = contextvars.ContextVar("job_folder", default=None)
+_last_report = 0.0
+
+
+class Job:
+    """A submitted build, its folder and the future of its run."""
+
+    __slots__ = ("id", "folder", "future")
+
+    def __init__(self, folder, future):
+        self.id = os.path.basename(folder)
+        self.folder = folder
+        self.future = future
+
+
+def _write_json(path, data):
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def report(fraction, text=""):
+    """Record the running job's progress (0 to 1) for its page. Raises JobCancelled once it was cancelled.
+
+    Builds call it between steps; outside a job it does nothing.
+    """
+    global _last_report
+    folder = _current.get()
+    if folder is None:
+        return
+    if os.path.exists(os.path.join(folder, CANCEL_FILE)):
+        raise JobCancelled("Cancelled")
+    now = time.monotonic()
+    if now - _last_report >= REPORT_INTERVAL:
+        _last_report = now
+        _write_progress(folder, fraction, text)
+
+
+def _write_progress(folder, fraction, text):
+    _write_json(os.path.join(folder, PROGRESS_FILE), {"fraction": min(max(fraction, 0.0), 1.0), "text": text, "started": True})
+
+
+def _write_part(path, value):
+    """Write one result value to path. Returns how it was stored."""
+    if isinstance(value, pd.DataFrame):
+        try:
+            # Arrow IPC, read back memory-mapped
+            feather.write_feather(pa.Table.from_pandas(value), path, compression="uncompressed")
+            return "arrow"
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError):
+            pass  # e.g. an object column mixing numbers and text
+    if isinstance(value, bytes):
+        with open(path, "wb") as file:
+            file.write(value)
+        return "bytes"
+    with open(path, "wb") as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return "pickle"
+
+
+def _read_part(path, kind):
+    if kind == "arrow":
+        return feather.read_table(path, memory_map=True).to_pandas()
+    with open(path, "rb") as file:
+        return file.read() if kind == "bytes" else pickle.load(file)
+
+
+def _run(folder, route, fn, args, kwargs):
+    """Run one build in a pool process and leave its result in folder. Returns the parts' file names and kinds."""
+    token = _current.set(folder)
+    try:
+        if os.path.exists(os.path.join(folder, CANCEL_FILE)):
+            raise JobCancelled("Cancelled")
+        _write_progress(folder, 0.0, "Started")
+        with Database.routed(route):
+            result = fn(*args, **kwargs)
+        # A DataFrame or bytes, or a dict of them; each part goes to its own file so none passes through the pool's pipe
+        parts = result if isinstance(result, dict) else {None: result}
+        return {name: (f"part{index}", _write_part(os.path.join(folder, f"part{index}"), value))
+                for index, (name, value) in enumerate(parts.items())}
+    finally:
+        _current.reset(token)
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if WORKERS > 0:
+                # spawn, not fork: the app process has threads (script runs, the writer) holding locks
+                _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job")
+        return _pool
+
+
+def _submit(*args):
+    global _pool
+    try:
+        return _executor().submit(*args)
+    except BrokenProcessPool:
+        # A build process died (e.g. out of memory) and took the pool with it; start a new one
+        with _pool_lock:
+            _pool = None
+        return _executor().submit(*args)
+
+
+def _sweep():
+    if not os.path.isdir(JOBS_DIR):
+        return
+    cutoff = time.time() - KEEP_SECONDS
+    with _jobs_lock:
+        running = {job.folder for job in _jobs.values() if not job.future.done()}
+    for name in os.listdir(JOBS_DIR):
+        folder = os.path.join(JOBS_DIR, name)
+        try:
+            stale = os.path.getmtime(folder) < cutoff
+        except FileNotFoundError:
+            continue
+        if stale and folder not in running:
+            shutil.rmtree(folder, ignore_errors=True)
+            with _jobs_lock:
+                _jobs.pop(name, None)
+
+
+def submit(fn, *args, **kwargs):
+    """Start fn(*args, **kwargs) in the job pool against this session's database. Returns the job id.
+
+    fn must be importable by name (a module-level function) and return a
+    DataFrame, bytes, or a dict of them; it may call report() as it goes.
+    """
+    _sweep()
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    folder = tempfile.mkdtemp(prefix="job_", dir=JOBS_DIR)
+    _write_json(os.path.join(folder, PROGRESS_FILE), {"fraction": 0.0, "text": "Queued", "started": False})
+    job = Job(folder, _submit(_run, folder, Database.routed_path(), fn, args, kwargs))
+    with _jobs_lock:
+        _jobs[job.id] = job
+    return job.id
+
+
+def status(job_id):
+    """{'state', 'fraction', 'text', 'error'} of a job.
+
+    state is queued, running, done, failed, cancelled, or missing for a job
+    this process does not know (e.g. removed, or submitted before a restart).
+    """
+    job = _jobs.get(job_id)
+    if job is None:
+        return {"state": "missing", "fraction": 0.0, "text": "", "error": None}
+    progress = _read_json(os.path.join(job.folder, PROGRESS_FILE)) or {}
+    state, error = ("running" if progress.get("started") else "queued"), None
+    if job.future.cancelled():
+        state = "cancelled"
+    elif job.future.done():
+        error = job.future.exception()
+        state = "done" if error is None else "cancelled" if isinstance(error, JobCancelled) else "failed"
+    return {"state": state, "fraction": progress.get("fraction", 0.0), "text": progress.get("text", ""),
+            "error": None if error is None else str(error) or type(error).__name__}
+
+
+def result(job_id):
+    """A finished job's return value, read back from its folder. Raises what the build raised."""
+    job = _jobs[job_id]
+    parts = {name: _read_part(os.path.join(job.folder, file_name), kind)
+             for name, (file_name, kind) in job.future.result().items()}
+    return parts[None] if None in parts else parts
+
+
+def _cancel(job):
+    if job.future.done() or job.future.cancel():
+        return
+    open(os.path.join(job.folder, CANCEL_FILE), "w").close()
+    progress = _read_json(os.path.join(job.folder, PROGRESS_FILE)) or {}
+    _write_json(os.path.join(job.folder, PROGRESS_FILE), {**progress, "text": "Cancelling"})
+
+
+def cancel(job_id):
+    """Stop a job: a queued one never starts, a running one stops at its next report()."""
+    job = _jobs.get(job_id)
+    if job is not None:
+        _cancel(job)
+
+
+def discard(job_id):
+    """Cancel a job if it has not finished and remove its folder once it has."""
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job is None:
+        return
+    _cancel(job)
+    job.future.add_done_callback(lambda _: shutil.rmtree(job.folder, ignore_errors=True))
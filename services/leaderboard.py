@@ -0,0 +1,80 @@
+import calendar
+
+import pandas as pd
+
+import Database
+from services import clock, schema, shards
+
+LEADERBOARD_COLUMNS = ['Kind', 'Rank', 'Supervisor_Code', 'Workstation_Name', 'Name', 'Target', 'Month_To_Date',
+                       'Achieved_Percent', 'Projected', 'Projected_Percent']
+KEYS = ['kind', 'supervisor_name', 'workstation_name', 'name']
+
+# Every workstation and advisor (with its workstation), so those with nothing entered yet still get a row
+ENTITIES_SQL = '''
+    SELECT 'workstation' AS kind, w.Supervisor_Code AS supervisor_name, w.Name AS workstation_name, w.Name AS name, w.Target
+    FROM User_Credentials w
+    WHERE w.User_Role = 'Workstation' {where}
+    UNION ALL
+    SELECT 'advisor', w.Supervisor_Code, w.Name, a.Name, a.Target
+    FROM User_Credentials a
+    JOIN User_Credentials w ON a.Supervisor_Code = w.Code
+    WHERE a.User_Role = 'Advisor' {where}
+'''
+
+
+@shards.federated
+def month_counters(month, supervisor_code=None, conn=None):
+    """Sales_Counters rows of one 'YYYY-MM' month, optionally for one supervisor's org subtree."""
+    where, params = "", [month]
+    if supervisor_code is not None:
+        where, params = f" AND supervisor_name IN ({schema.SQL_ORG_SUBTREE})", [month, supervisor_code]
+    with Database.reading(conn) as conn:
+        return pd.read_sql_query(f"SELECT {', '.join(KEYS)}, total FROM Sales_Counters WHERE month = ?{where}",
+                                 conn, params=params)
+
+
+def _entities(supervisor_code):
+    where, params = "", []
+    if supervisor_code is not None:
+        where, params = f"AND w.Supervisor_Code IN ({schema.SQL_ORG_SUBTREE})", [supervisor_code, supervisor_code]
+    with Database.reading() as conn:
+        return pd.read_sql_query(ENTITIES_SQL.format(where=where), conn, params=params)
+
+
+def leaderboard(supervisor_code=None, day=None):
+    """Month-to-date sales against User_Credentials.Target for every workstation and advisor.
+
+    Totals come from Sales_Counters, so no sales rows are read. Projected is
+    the month-to-date total at the current daily run rate to the end of the
+    month. Rank is per kind: by percent of target, then those without a
+    target by total. Returns a DataFrame with LEADERBOARD_COLUMNS.
+    """
+    day = day or clock.now().date()
+    counters = month_counters(day.strftime("%Y-%m"), supervisor_code)
+    # Shards each hold their own counters; the same entity may appear in more than one
+    counters = counters.groupby(KEYS, as_index=False)['total'].sum()
+    entities = _entities(supervisor_code)
+    entities[KEYS] = entities[KEYS].fillna("")
+    entities = entities.drop_duplicates(KEYS)
+
+    board = entities.merge(counters, on=KEYS, how='outer')
+    board['total'] = board['total'].fillna(0).astype(int)
+    target = pd.to_numeric(board['Target'], errors='coerce').where(lambda value: value > 0)
+    projected = (board['total'] / day.day * calendar.monthrange(day.year, day.month)[1]).round()
+
+    board = pd.DataFrame({
+        'Kind': board['kind'].str.capitalize(),
+        'Supervisor_Code': board['supervisor_name'],
+        'Workstation_Name': board['workstation_name'],
+        'Name': board['name'],
+        'Target': target.round().astype('Int64'),
+        'Month_To_Date': board['total'],
+        'Achieved_Percent': (board['total'] / target * 100).round(1),
+        'Projected': projected.astype(int),
+        'Projected_Percent': (projected / target * 100).round(1),
+        '_has_target': target.notna(),
+    })
+    board = board.sort_values(['Kind', '_has_target', 'Achieved_Percent', 'Month_To_Date', 'Name'],
+                              ascending=[False, False, False, False, True], ignore_index=True)
+    board['Rank'] = board.groupby('Kind').cumcount() + 1
+    return board[LEADERBOARD_COLUMNS]
@@ -0,0 +1,64 @@
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# PBKDF2-SHA256 work factor. Every doubling doubles the cost of a login and of
+# a guess; set TOOLS_PBKDF2_ITERATIONS to tune it for the server.
+ITERATIONS = int(os.environ.get("TOOLS_PBKDF2_ITERATIONS", "260000"))
+ALGORITHM = "pbkdf2_sha256"
+SALT_BYTES = 16
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password, iterations=None):
+    """'pbkdf2_sha256$<iterations>$<salt>$<hash>' for a password, with a fresh salt."""
+    iterations = iterations or ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", str(password).encode("utf-8"), salt, iterations)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(ALGORITHM + "$")
+
+
+def verify_password(password, stored):
+    """True if the password matches a stored hash (or, for rows not migrated yet, the stored plaintext)."""
+    if stored is None or password is None:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(str(password).encode("utf-8"), str(stored).encode("utf-8"))
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", str(password).encode("utf-8"), base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(_b64(digest), expected)
+
+
+def needs_rehash(stored, iterations=None):
+    """True for plaintext and for hashes made with fewer iterations than configured."""
+    if not is_hashed(stored):
+        return True
+    return int(stored.split("$")[1]) < (iterations or ITERATIONS)
+
+
+def hash_many(values, iterations=None):
+    """hash_password() of each value, leaving values that are already hashed as they are.
+
+    hashlib releases the GIL while hashing, so a thread per core hashes an
+    upload in parallel.
+    """
+    def hash_value(value):
+        if value is None or value != value or is_hashed(value):
+            return value
+        return hash_password(value, iterations)
+
+    values = list(values)
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        return list(pool.map(hash_value, values))
@@ -0,0 +1,270 @@
+import io
+import os
+import tempfile
+import zipfile
+
+import pandas as pd
+
+import Database
+import ExcelExport
+from services import analytics, archive, clock, shards, snapshots
+from services.attendance import SQL_ATTENDANCE_DATE
+from services.errors import ValidationError
+from services.images import IMAGES_DIR, current_folder
+
+# Tables the admin pages may list, export or overwrite
+TABLES = ("User_Credentials", "Attendance", "Past_Attendance", "Advisor_Data", "Workstation_Data")
+
+# Attendance rows folded at a time when a caller asks for a chunked summary
+CHUNK_ROWS = 5000
+
+SUMMARY_COLUMNS = ['Supervisor_Name', 'Code', 'Technician_Name', 'Total_Days', 'Total_Hours', 'Sundays']
+SUMMARY_KEYS = ['Supervisor_Name', 'Code', 'Technician_Name']
+
+ATTENDANCE_REPORT_SQL = f'''
+    SELECT u.Code, u.Name AS Technician_Name, u.Supervisor_Code, s.Name AS Supervisor_Name,
+           a.Attendance_Date, a.Shift_Duration
+    FROM {{attendance}} a
+    JOIN User_Credentials u ON a.Code = u.Code
+    JOIN User_Credentials s ON u.Supervisor_Code = s.Code
+    WHERE {SQL_ATTENDANCE_DATE.format("a.Attendance_Date")} BETWEEN DATE(?) AND DATE(?)
+'''
+
+# Whole archived months, from the rollups services.archive keeps in the live file
+ATTENDANCE_ROLLUP_SQL = '''
+    SELECT s.Name AS Supervisor_Name, u.Code, u.Name AS Technician_Name,
+           SUM(m.Days) AS Days, SUM(m.Shift_Seconds) AS Shift_Seconds, SUM(m.Sundays) AS Sundays
+    FROM Attendance_Monthly m
+    JOIN User_Credentials u ON m.Code = u.Code
+    JOIN User_Credentials s ON u.Supervisor_Code = s.Code
+    WHERE m.Month IN ({months}) {where}
+    GROUP BY s.Name, u.Code, u.Name
+'''
+
+
+# Technicians and their supervisors, for the snapshot path of attendance_summary
+TECHNICIANS_SQL = '''
+    SELECT s.Name AS Supervisor_Name, u.Code, u.Name AS Technician_Name
+    FROM User_Credentials u
+    JOIN User_Credentials s ON u.Supervisor_Code = s.Code
+    WHERE 1 = 1
+'''
+
+
+def check_table(table_name):
+    if table_name not in TABLES:
+        raise ValidationError(f"Unknown table {table_name}")
+    return table_name
+
+
+def _format_hours(duration):
+    seconds = duration.total_seconds()
+    return f"{int(seconds // 3600):02}:{int((seconds % 3600) // 60):02}:{int(seconds % 60):02}"
+
+
+def attendance_summary(start_date, end_date, supervisor_name=None, chunk_rows=None, conn=None, scope=None):
+    """Days, hours and Sundays worked per technician between two 'DD-MM-YYYY' dates.
+
+    With supervisor_name only that supervisor's technicians are included
+    (case-insensitive); with scope, a user code, only the technicians anywhere
+    in that user's org subtree. Returns an empty DataFrame with SUMMARY_COLUMNS
+    when there is no attendance in the range. With chunk_rows the rows are read
+    and folded in chunks, so memory grows with technicians and days, not rows.
+    """
+    summary = _attendance_totals(start_date, end_date, supervisor_name, chunk_rows, conn=conn, scope=scope)
+    if summary.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    # Formatted only now, after the shards' totals were added up
+    summary = summary.sort_values(SUMMARY_KEYS, ignore_index=True)
+    summary['Total_Days'] = summary['Total_Days'].astype(int)
+    summary['Sundays'] = summary['Sundays'].astype(int)
+    summary['Total_Hours'] = summary['Total_Hours'].apply(_format_hours)
+    return summary[SUMMARY_COLUMNS]
+
+
+@shards.federated(merge=shards.summed(SUMMARY_KEYS))
+def _attendance_totals(start_date, end_date, supervisor_name, chunk_rows, conn=None, scope=None):
+    """Total_Days, Total_Hours (a Timedelta) and Sundays per technician, unsorted, for attendance_summary()."""
+    start, end = clock.to_iso(start_date), clock.to_iso(end_date)
+    where, supervisor = analytics.scope_filter(supervisor_name, scope)
+    if snapshots.ENABLED and conn is None:
+        return _snapshot_totals(start, end, where, supervisor)
+
+    keys = SUMMARY_KEYS
+    totals = []
+    days = []
+    rollup_days = None
+
+    def fold(df):
+        df['Attendance_Date'] = pd.to_datetime(df['Attendance_Date'], format='%d-%m-%Y', errors='coerce')
+        df['Shift_Duration'] = pd.to_timedelta(df['Shift_Duration'], errors='coerce')
+        df['Is_Sunday'] = df['Attendance_Date'].dt.dayofweek == 6  # Sunday = 6
+        totals.append(df.groupby(keys).agg(Total_Hours=('Shift_Duration', 'sum'), Sundays=('Is_Sunday', 'sum')))
+        # Distinct days have to be counted across chunks, so keep the (technician, day) pairs
+        days.append(df[keys + ['Attendance_Date']].drop_duplicates())
+
+    with Database.reading(conn) as conn:
+        # Archived months come from the rollups, partly covered ones from the yearly files
+        months, ranges = archive.plan(conn, "Attendance", start, end)
+        with archive.attached(conn, [year for year, _, _ in ranges]) as years:
+            sources = [("Attendance", start, end)]
+            sources += [(f"archive_{year}.Attendance", first, last) for year, first, last in ranges if year in years]
+            for table, first, last in sources:
+                query = ATTENDANCE_REPORT_SQL.format(attendance=table) + where
+                chunks = pd.read_sql_query(query, conn, params=[first, last, *supervisor], chunksize=chunk_rows)
+                for df in ([chunks] if chunk_rows is None else chunks):
+                    if not df.empty:
+                        fold(df)
+
+        if months:
+            rollup = pd.read_sql_query(ATTENDANCE_ROLLUP_SQL.format(months=", ".join("?" for _ in months), where=where),
+                                       conn, params=[*months, *supervisor])
+            if not rollup.empty:
+                rollup['Total_Hours'] = pd.to_timedelta(rollup['Shift_Seconds'], unit='s')
+                rollup = rollup.set_index(keys)
+                totals.append(rollup[['Total_Hours', 'Sundays']])
+                rollup_days = rollup['Days']
+
+    if not totals:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    summary = pd.concat(totals).groupby(level=keys).sum()
+    total_days = pd.Series(0, index=summary.index)
+    if days:
+        total_days = total_days.add(pd.concat(days).groupby(keys)['Attendance_Date'].nunique(), fill_value=0)
+    if rollup_days is not None:
+        total_days = total_days.add(rollup_days.groupby(level=keys).sum(), fill_value=0)
+    summary['Total_Days'] = total_days.astype(int)
+    return summary.reset_index()[SUMMARY_COLUMNS]
+
+
+def _snapshot_totals(start, end, where, supervisor):
+    """_attendance_totals() from the Parquet snapshot (services.snapshots) instead of the SQLite rows."""
+    with Database.reading() as conn:
+        technicians = pd.read_sql_query(TECHNICIANS_SQL + where, conn, params=supervisor)
+    days = snapshots.attendance_days(start, end, technicians['Code'])
+    summary = technicians.merge(days, on='Code')
+    if summary.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    summary['Total_Days'] = summary['Days']
+    summary['Total_Hours'] = pd.to_timedelta(summary['Shift_Ns'].fillna(0), unit='ns')
+    return summary[SUMMARY_COLUMNS]
+
+
+def table_frame(table_name):
+    if shards.is_federated(check_table(table_name)):
+        return _fact_frame(table_name)
+    with Database.reading() as conn:
+        return pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+
+
+@shards.federated
+def _fact_frame(table_name):
+    with Database.reading() as conn:
+        return pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+
+
+def row_count(table_name):
+    if shards.is_federated(check_table(table_name)):
+        return sum(shards.gather(row_count, table_name))
+    with Database.reading() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+
+def table_xlsx(table_name, progress=None):
+    """A whole table as .xlsx bytes, streamed from the cursor.
+
+    progress, if given, is called as progress(fraction, text) while rows are written.
+    """
+    total = max(row_count(table_name), 1) if progress is not None else None
+
+    def rows_written(rows):
+        if progress is not None:
+            progress(rows / total, f"{rows:,} of {total:,} rows")
+
+    if shards.is_federated(check_table(table_name)):
+        output = io.BytesIO()
+        ExcelExport.write_xlsx(output, *shards.stream(f"SELECT * FROM {table_name}"), progress=rows_written)
+        return output.getvalue()
+    with Database.reading() as conn:
+        return ExcelExport.query_to_xlsx(conn, f"SELECT * FROM {table_name}", progress=rows_written)
+
+
+def attendance_report(start_date, end_date, supervisor_name=None, scope=None, progress=None):
+    """attendance_summary() and analytics.attendance_analytics() with a workbook of each, for the report pages.
+
+    Returns a dict with summary, summary_xlsx, exceptions and exceptions_xlsx.
+    """
+    def step(fraction, text):
+        if progress is not None:
+            progress(fraction, text)
+
+    step(0.0, "Summing attendance")
+    summary = attendance_summary(start_date, end_date, supervisor_name, scope=scope)
+    step(0.4, "Writing the report workbook")
+    summary_xlsx = ExcelExport.dataframe_to_xlsx(summary)
+    step(0.5, "Finding late arrivals, missing punch-outs and overtime")
+    exceptions = analytics.attendance_analytics(start_date, end_date, supervisor_name, scope=scope)
+    step(0.9, "Writing the exceptions workbook")
+    exceptions_xlsx = ExcelExport.dataframe_to_xlsx(exceptions)
+    return {"summary": summary, "summary_xlsx": summary_xlsx, "exceptions": exceptions, "exceptions_xlsx": exceptions_xlsx}
+
+
+def export_tables(export_dir, db_path=None, progress=None):
+    """Write every table of the database to export_dir/<table>.xlsx. Returns the paths.
+
+    With shards, a company-wide export of the main file also streams each fact
+    table from every shard into its workbook. progress, if given, is called as
+    progress(fraction, text) before each table.
+    """
+    federated = db_path is None and shards.is_federated()
+    os.makedirs(export_dir, exist_ok=True)
+    with Database.reading(path=db_path) as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+        paths = []
+        for index, table_name in enumerate(tables):
+            if progress is not None:
+                progress(index / len(tables), f"Writing {table_name}")
+            path = os.path.join(export_dir, f"{table_name}.xlsx")
+            # Stream each table straight from the cursor into its workbook
+            if federated and table_name in shards.SHARDED_TABLES:
+                ExcelExport.write_xlsx(path, *shards.stream(f'SELECT * FROM "{table_name}"'))
+            else:
+                ExcelExport.query_to_xlsx(conn, f'SELECT * FROM "{table_name}"', target=path)
+            paths.append(path)
+        return paths
+
+
+def export_archive(db_path=None, images_dir=None, target=None, progress=None):
+    """ZIP with one workbook per table and the photos under images/.
+
+    Returned as bytes, or written to target (a path or file object) when given.
+    Each shard's photos go under images/<shard>/. progress, if given, is
+    called as progress(fraction, text): the tables are the first half, the
+    photos the second.
+    """
+    image_dirs = [(images_dir or current_folder(), "images")]
+    if db_path is None and images_dir is None and shards.is_federated():
+        for path in shards.paths():
+            shard_dir = os.path.dirname(path)
+            image_dirs.append((os.path.join(shard_dir, IMAGES_DIR), os.path.join("images", os.path.basename(shard_dir))))
+    output = io.BytesIO() if target is None else target
+    with tempfile.TemporaryDirectory(prefix="reports_") as export_dir:
+        def tables_progress(fraction, text):
+            progress(fraction / 2, text)
+
+        paths = export_tables(export_dir, db_path, progress and tables_progress)
+        photos = [(os.path.join(root, file), folder, arcname)
+                  for folder, arcname in image_dirs for root, _, files in os.walk(folder) for file in files]
+        with zipfile.ZipFile(output, "w") as zipf:
+            for path in paths:
+                zipf.write(path, os.path.basename(path))
+            for index, (file_path, folder, arcname) in enumerate(photos):
+                if progress is not None and index % 100 == 0:
+                    progress(0.5 + index / len(photos) / 2, f"Adding photos ({index:,} of {len(photos):,})")
+                zipf.write(file_path, os.path.join(arcname, os.path.relpath(file_path, folder)))
+    return output.getvalue() if target is None else None
+
+
+def archive_name():
+    return clock.now().strftime("%d-%B-%Y") + ".zip"
@@ -0,0 +1,376 @@
+import Database
+
+# User Credentials Table
+USER_CREDENTIALS = '''CREATE TABLE IF NOT EXISTS User_Credentials
+                     (
+                        Code TEXT PRIMARY KEY,
+                        Name TEXT,
+                        Password TEXT,
+                        Supervisor_Code TEXT,
+                        User_Role TEXT,
+                        Target INTEGER
+                     )'''
+
+# Attendance Table (with In_Time, Out_Time, and Shift_Duration)
+ATTENDANCE = '''
+                    CREATE TABLE IF NOT EXISTS Attendance (
+                        Code TEXT,
+                        Name TEXT,
+                        Workstation_Name TEXT,
+                        Attendance_Date TEXT,
+                        In_Time TEXT,
+                        In_Time_Photo_Link TEXT,
+                        Out_Time TEXT,
+                        Out_Time_Photo_Link TEXT,
+                        Supervisor_Name TEXT,
+                        Shift_Duration TEXT,
+                        Holiday INTEGER,
+                        Holiday_Remarks TEXT,
+                        PRIMARY KEY (Code, Attendance_Date)
+                    )
+                    '''
+
+#Past attendance enable by Amit
+PAST_ATTENDANCE = '''CREATE TABLE IF NOT EXISTS Past_Attendance
+             (
+                Status TEXT,  -- "Enabled" or "Disabled"
+                Days INTEGER  -- Number of days allowed for past attendance
+             )'''
+
+#Advisor data table
+ADVISOR_DATA = '''CREATE TABLE IF NOT EXISTS Advisor_Data
+                    (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        date DATE NOT NULL,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        workstation_name TEXT,
+                        supervisor_name TEXT,
+                        advisor_name TEXT,
+                        running_repair INTEGER DEFAULT 0,
+                        free_service INTEGER DEFAULT 0,
+                        paid_service INTEGER DEFAULT 0,
+                        body_shop INTEGER DEFAULT 0,
+                        total INTEGER,
+                        align INTEGER DEFAULT 0,
+                        balance INTEGER DEFAULT 0,
+                        align_and_balance INTEGER
+                    )'''
+
+#Workstation data table
+WORKSTATION_DATA = '''CREATE TABLE IF NOT EXISTS Workstation_Data
+                    (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        date DATE NOT NULL,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        workstation_name TEXT,
+                        supervisor_name TEXT,
+                        running_repair INTEGER DEFAULT 0,
+                        free_service INTEGER DEFAULT 0,
+                        paid_service INTEGER DEFAULT 0,
+                        body_shop INTEGER DEFAULT 0,
+                        total INTEGER,
+                        align INTEGER DEFAULT 0,
+                        balance INTEGER DEFAULT 0,
+                        align_and_balance INTEGER
+                    )'''
+
+# One counter per data table, bumped by triggers on every change. Readers
+# (the HTTP API's ETags) compare versions instead of re-reading the tables.
+TABLE_VERSIONS = '''CREATE TABLE IF NOT EXISTS Table_Versions
+                    (
+                        Table_Name TEXT PRIMARY KEY,
+                        Version INTEGER NOT NULL DEFAULT 0
+                    )'''
+
+VERSIONED_TABLES = ("User_Credentials", "Attendance", "Past_Attendance", "Advisor_Data", "Workstation_Data")
+
+VERSION_TRIGGER = '''CREATE TRIGGER IF NOT EXISTS {table}_Version_{event}
+                     AFTER {event} ON {table}
+                     BEGIN
+                        UPDATE Table_Versions SET Version = Version + 1 WHERE Table_Name = '{table}';
+                     END'''
+
+# Every insert, update and delete on the tables in CHANGE_LOGGED_TABLES, in
+# commit order. Seq never goes back or gets reused (AUTOINCREMENT), so a
+# consumer only has to remember the last Seq it saw (services.changes).
+CHANGE_LOG = '''CREATE TABLE IF NOT EXISTS Change_Log
+                    (
+                        Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        Table_Name TEXT NOT NULL,
+                        Operation TEXT NOT NULL,  -- insert, update, delete; archive for rows moved by services.archive
+                        Row_Key TEXT NOT NULL,    -- JSON object of the key columns, before the change
+                        Row_Data TEXT,            -- JSON object of the row after the change, NULL for deletes
+                        Changed_At TEXT DEFAULT CURRENT_TIMESTAMP
+                    )'''
+
+# Logged table -> the columns that identify a row
+CHANGE_LOGGED_TABLES = {
+    "User_Credentials": ("Code",),
+    "Attendance": ("Code", "Attendance_Date"),
+    "Advisor_Data": ("id",),
+    "Workstation_Data": ("id",),
+}
+
+# Columns never copied into Change_Log.Row_Data: whoever reads the log (the API,
+# `ToolsCli.py changes`, mirrors) must not see password hashes
+CHANGE_LOG_EXCLUDED = {"User_Credentials": ("Password",)}
+
+CHANGE_TRIGGER = '''CREATE TRIGGER IF NOT EXISTS {table}_Change_{event}
+                     AFTER {event} ON {table}
+                     BEGIN
+                        INSERT INTO Change_Log (Table_Name, Operation, Row_Key, Row_Data)
+                        VALUES ('{table}', '{operation}', {row_key}, {row_data});
+                     END'''
+
+# Monthly rollups of the rows moved to the yearly archive files (services.archive)
+ATTENDANCE_MONTHLY = '''CREATE TABLE IF NOT EXISTS Attendance_Monthly
+                    (
+                        Month TEXT,              -- 'YYYY-MM'
+                        Code TEXT,
+                        Days INTEGER,            -- distinct attendance dates
+                        Shift_Seconds INTEGER,
+                        Sundays INTEGER,
+                        PRIMARY KEY (Month, Code)
+                    )'''
+
+SALES_FIGURES = '''running_repair INTEGER DEFAULT 0,
+                        free_service INTEGER DEFAULT 0,
+                        paid_service INTEGER DEFAULT 0,
+                        body_shop INTEGER DEFAULT 0,
+                        total INTEGER DEFAULT 0,
+                        align INTEGER DEFAULT 0,
+                        balance INTEGER DEFAULT 0,
+                        align_and_balance INTEGER DEFAULT 0'''
+
+WORKSTATION_MONTHLY = f'''CREATE TABLE IF NOT EXISTS Workstation_Monthly
+                    (
+                        month TEXT,
+                        workstation_name TEXT,
+                        supervisor_name TEXT,
+                        {SALES_FIGURES},
+                        PRIMARY KEY (month, workstation_name, supervisor_name)
+                    )'''
+
+ADVISOR_MONTHLY = f'''CREATE TABLE IF NOT EXISTS Advisor_Monthly
+                    (
+                        month TEXT,
+                        supervisor_name TEXT,
+                        workstation_name TEXT,
+                        advisor_name TEXT,
+                        {SALES_FIGURES},
+                        PRIMARY KEY (month, supervisor_name, workstation_name, advisor_name)
+                    )'''
+
+# Month-to-date sales per workstation and advisor, kept current by triggers on
+# the sales tables so the leaderboard never sums the fact rows. Covers the live
+# rows only: services.archive drops the counters of the months it moves.
+SALES_COUNTERS = '''CREATE TABLE IF NOT EXISTS Sales_Counters
+                    (
+                        month TEXT,              -- 'YYYY-MM'
+                        kind TEXT,               -- 'workstation' or 'advisor'
+                        supervisor_name TEXT,    -- supervisor code, as in the sales tables
+                        workstation_name TEXT,
+                        name TEXT,               -- the workstation's or the advisor's name
+                        total INTEGER DEFAULT 0,
+                        PRIMARY KEY (month, kind, supervisor_name, workstation_name, name)
+                    )'''
+
+# Sales table -> (counter kind, column naming the entity)
+COUNTED_TABLES = {
+    "Workstation_Data": ("workstation", "workstation_name"),
+    "Advisor_Data": ("advisor", "advisor_name"),
+}
+
+# NULL key columns are stored as '' so that the upsert finds the row again
+COUNTER_KEY = "substr({row}.date, 1, 7), '{kind}', COALESCE({row}.supervisor_name, ''), COALESCE({row}.workstation_name, ''), COALESCE({row}.{name}, '')"
+
+COUNTER_ADD = '''INSERT INTO Sales_Counters (month, kind, supervisor_name, workstation_name, name, total)
+                        VALUES ({key}, {sign}COALESCE({row}.total, 0))
+                        ON CONFLICT (month, kind, supervisor_name, workstation_name, name) DO UPDATE SET total = total + excluded.total;'''
+
+COUNTER_TRIGGER = '''CREATE TRIGGER IF NOT EXISTS {table}_Counter_{event}
+                     AFTER {event} ON {table}
+                     BEGIN
+                        {body}
+                     END'''
+
+# Every counter from the live rows, for files that had rows before the counters existed
+COUNTER_REBUILD = '''INSERT INTO Sales_Counters (month, kind, supervisor_name, workstation_name, name, total)
+                      SELECT {key}, SUM(COALESCE(t.total, 0)) FROM {table} t
+                      WHERE t.date IS NOT NULL
+                      GROUP BY 1, 2, 3, 4, 5'''
+
+# One row per workstation, and per advisor, and day: the entry pages upsert on these keys
+SALES_DAY_KEYS = {
+    "Workstation_Data": ("date", "workstation_name"),
+    "Advisor_Data": ("date", "advisor_name"),
+}
+
+SALES_DAY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS {table}_Day ON {table} ({columns})"
+
+# Files from before the unique indexes: keep the last saved row of each day, drop
+# the rest (through the triggers, so Sales_Counters and Change_Log follow)
+SALES_DEDUPE = '''DELETE FROM {table} WHERE id IN (
+                      SELECT id FROM (
+                          SELECT id, ROW_NUMBER() OVER (PARTITION BY {columns} ORDER BY timestamp DESC, id DESC) AS n
+                          FROM {table} WHERE {not_null}
+                      ) WHERE n > 1
+                  )'''
+
+# The Supervisor_Code tree flattened: one row per user and everyone above them,
+# the user included at depth 0. A manager's whole subtree of supervisors,
+# workstations, advisors and technicians is then one indexed lookup on Ancestor.
+# Rebuilt from User_Credentials whenever the users are replaced.
+ORG_CLOSURE = '''CREATE TABLE IF NOT EXISTS Org_Closure
+                 (
+                    Ancestor TEXT,
+                    Descendant TEXT,
+                    Depth INTEGER,
+                    PRIMARY KEY (Ancestor, Descendant)
+                 ) WITHOUT ROWID'''
+
+ORG_CLOSURE_DESCENDANT_INDEX = '''CREATE INDEX IF NOT EXISTS Org_Closure_Descendant
+                                  ON Org_Closure (Descendant, Depth)'''
+
+# Longest Supervisor_Code chain followed; a loop in the uploaded codes stops here
+MAX_ORG_DEPTH = 32
+
+ORG_REBUILD = f'''INSERT INTO Org_Closure (Ancestor, Descendant, Depth)
+                  WITH RECURSIVE tree (Ancestor, Descendant, Depth) AS (
+                      SELECT Code, Code, 0 FROM User_Credentials WHERE Code IS NOT NULL
+                      UNION
+                      SELECT t.Ancestor, u.Code, t.Depth + 1
+                      FROM tree t JOIN User_Credentials u ON u.Supervisor_Code = t.Descendant
+                      WHERE t.Depth < {MAX_ORG_DEPTH} AND u.Code != t.Ancestor
+                  )
+                  SELECT Ancestor, Descendant, MIN(Depth) FROM tree GROUP BY Ancestor, Descendant'''
+
+# Codes in a user's subtree, the user included: "column IN ({SQL_ORG_SUBTREE})" with the user's code as parameter
+SQL_ORG_SUBTREE = "SELECT Descendant FROM Org_Closure WHERE Ancestor = ?"
+
+# Attendance_Date ('DD-MM-YYYY') as an ISO date SQLite can compare
+SQL_ATTENDANCE_DATE = "DATE(substr({0}, 7, 4) || '-' || substr({0}, 4, 2) || '-' || substr({0}, 1, 2))"
+
+# Date range reads (reports, analytics, archiving) filter on the ISO date; the
+# planner uses this index whenever a query spells the expression the same way.
+ATTENDANCE_ISO_DATE_INDEX = f'''CREATE INDEX IF NOT EXISTS Attendance_Iso_Date
+                               ON Attendance ({SQL_ATTENDANCE_DATE.format("Attendance_Date")})'''
+
+# Last day (YYYY-MM-DD) each fact table has been archived through
+ARCHIVE_STATE = '''CREATE TABLE IF NOT EXISTS Archive_State
+                    (
+                        Table_Name TEXT PRIMARY KEY,
+                        Archived_Through TEXT
+                    )'''
+
+TABLES = (USER_CREDENTIALS, ATTENDANCE, PAST_ATTENDANCE, ADVISOR_DATA, WORKSTATION_DATA, TABLE_VERSIONS, CHANGE_LOG,
+          ATTENDANCE_MONTHLY, WORKSTATION_MONTHLY, ADVISOR_MONTHLY, ARCHIVE_STATE, SALES_COUNTERS, ORG_CLOSURE)
+
+INDEXES = (ATTENDANCE_ISO_DATE_INDEX, ORG_CLOSURE_DESCENDANT_INDEX)
+
+# What a yearly archive file holds
+ARCHIVE_TABLES = (ATTENDANCE, ADVISOR_DATA, WORKSTATION_DATA)
+ARCHIVE_INDEXES = (ATTENDANCE_ISO_DATE_INDEX,)
+
+
+def version_statements():
+    for table in VERSIONED_TABLES:
+        yield f"INSERT OR IGNORE INTO Table_Versions (Table_Name, Version) VALUES ('{table}', 0)"
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            yield VERSION_TRIGGER.format(table=table, event=event)
+
+
+def _json_object(columns, row):
+    return "json_object(" + ", ".join(f"'{column}', {row}.{column}" for column in columns) + ")"
+
+
+def change_statements(conn):
+    for table, key in CHANGE_LOGGED_TABLES.items():
+        excluded = CHANGE_LOG_EXCLUDED.get(table, ())
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] not in excluded]
+        # Updates are logged under the old key, so a mirror can drop the old row before writing the new one
+        for event, row, data in (("INSERT", "NEW", "NEW"), ("UPDATE", "OLD", "NEW"), ("DELETE", "OLD", None)):
+            yield CHANGE_TRIGGER.format(table=table, event=event, operation=event.lower(), row_key=_json_object(key, row),
+                                        row_data=_json_object(columns, data) if data else "NULL")
+
+
+def drop_leaky_change_triggers(conn):
+    """Drop change triggers that still copy CHANGE_LOG_EXCLUDED columns, and remove those values from the log.
+
+    For files from before the exclusion; change_statements() recreates the triggers.
+    """
+    for table, excluded in CHANGE_LOG_EXCLUDED.items():
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?",
+                                (table, f"{table}_Change_%")).fetchall()
+        leaky = [name for name, sql in triggers if any(f"'{column}'" in sql for column in excluded)]
+        for name in leaky:
+            conn.execute(f"DROP TRIGGER {name}")
+        if leaky:
+            paths = ", ".join(f"'$.{column}'" for column in excluded)
+            conn.execute(f"UPDATE Change_Log SET Row_Data = json_remove(Row_Data, {paths}) WHERE Table_Name = ? AND Row_Data IS NOT NULL",
+                         (table,))
+
+
+def counter_statements():
+    for table, (kind, name) in COUNTED_TABLES.items():
+        add = COUNTER_ADD.format(key=COUNTER_KEY.format(row="NEW", kind=kind, name=name), sign="", row="NEW")
+        remove = COUNTER_ADD.format(key=COUNTER_KEY.format(row="OLD", kind=kind, name=name), sign="-", row="OLD")
+        for event, body in (("INSERT", add), ("UPDATE", remove + "\n                        " + add), ("DELETE", remove)):
+            yield COUNTER_TRIGGER.format(table=table, event=event, body=body)
+
+
+def rebuild_counters(conn):
+    """Recompute Sales_Counters from the live sales rows."""
+    conn.execute("DELETE FROM Sales_Counters")
+    for table, (kind, name) in COUNTED_TABLES.items():
+        conn.execute(COUNTER_REBUILD.format(key=COUNTER_KEY.format(row="t", kind=kind, name=name), table=table))
+
+
+def sales_day_statements(conn):
+    """Unique day indexes of the sales tables, removing duplicate rows first where an index is new."""
+    for table, columns in SALES_DAY_KEYS.items():
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (f"{table}_Day",)).fetchone()
+        if not exists:
+            yield SALES_DEDUPE.format(table=table, columns=", ".join(columns),
+                                      not_null=" AND ".join(f"{column} IS NOT NULL" for column in columns))
+        yield SALES_DAY_INDEX.format(table=table, columns=", ".join(columns))
+
+
+def rebuild_org(conn):
+    """Recompute Org_Closure from User_Credentials, in the caller's write."""
+    conn.execute("DELETE FROM Org_Closure")
+    conn.execute(ORG_REBUILD)
+
+
+# Create SQLite Tables
+def create_tables(path=None):
+    conn = Database.get_db_connection(path)
+    try:
+        counted = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Sales_Counters'").fetchone()
+        closed = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Org_Closure'").fetchone()
+        for statement in (*TABLES, *INDEXES):
+            conn.execute(statement)
+        for statement in version_statements():
+            conn.execute(statement)
+        drop_leaky_change_triggers(conn)
+        for statement in list(change_statements(conn)):
+            conn.execute(statement)
+        for statement in counter_statements():
+            conn.execute(statement)
+        for statement in list(sales_day_statements(conn)):
+            conn.execute(statement)
+        if not counted:
+            # Files from before the counters existed: start them from the rows already there
+            rebuild_counters(conn)
+        if not closed:
+            rebuild_org(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def table_versions(conn, tables=VERSIONED_TABLES):
+    """{table: version} for the given tables."""
+    placeholders = ", ".join("?" for _ in tables)
+    rows = conn.execute(f"SELECT Table_Name, Version FROM Table_Versions WHERE Table_Name IN ({placeholders})", tuple(tables)).fetchall()
+    return dict(rows)
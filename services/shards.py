@@ -0,0 +1,276 @@
+import functools
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import Database
+from services import schema
+
+# Set TOOLS_SHARDS to a folder to keep each supervisor's attendance, sales and
+# photos in a database file of its own under it (<folder>/<code>/). Unset, the
+# app keeps everything in the single Tools_And_Tools.sqlite.
+SHARDS_DIR = os.environ.get("TOOLS_SHARDS") or None
+SHARD_DB = "Tools_And_Tools.sqlite"
+
+# Tables split by supervisor. User_Credentials stays in the main file (logins,
+# uploads) and is copied into every shard so the existing joins keep working.
+SHARDED_TABLES = ("Attendance", "Workstation_Data", "Advisor_Data")
+
+# Shards read at once by a federated report
+MAX_WORKERS = 8
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def enabled():
+    return SHARDS_DIR is not None
+
+
+def shard_path(key):
+    return os.path.join(SHARDS_DIR, re.sub(r"[^\w-]", "_", str(key)), SHARD_DB)
+
+
+def _directory_rows(sql, params=()):
+    conn = Database.get_db_connection(Database.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def keys():
+    """Supervisor codes, one shard each."""
+    return [row[0] for row in _directory_rows("SELECT Code FROM User_Credentials WHERE User_Role = 'Supervisor' ORDER BY Code")]
+
+
+def code_keys():
+    """{user code: supervisor code of the shard holding their data}."""
+    rows = _directory_rows("SELECT Code, User_Role, Supervisor_Code FROM User_Credentials")
+    parents = {code: supervisor_code for code, _, supervisor_code in rows}
+    mapping = {}
+    for code, role, supervisor_code in rows:
+        if role == "Supervisor":
+            mapping[code] = code
+        elif role == "Advisor":
+            # Advisors report to a workstation, which reports to the supervisor
+            mapping[code] = parents.get(supervisor_code)
+        else:
+            mapping[code] = supervisor_code
+    return mapping
+
+
+def shard_key(user):
+    """Shard of a logged-in user (the dict from users.authenticate), or None for company-wide users.
+
+    A manager over other supervisors is company-wide: their subtree spans
+    several shards, so their reports read every shard, filtered to it.
+    """
+    if not enabled() or user is None:
+        return None
+    if user["role"] == "Supervisor" and _directory_rows(
+            f"SELECT 1 FROM User_Credentials WHERE User_Role = 'Supervisor' AND Code != ? AND Code IN ({schema.SQL_ORG_SUBTREE}) LIMIT 1",
+            (user["code"], user["code"])):
+        return None
+    return code_keys().get(user["code"])
+
+
+def copy_users(path):
+    """Replace a shard's User_Credentials with the main file's."""
+    conn = Database.get_db_connection(Database.DB_PATH)
+    try:
+        cursor = conn.execute("SELECT * FROM User_Credentials")
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    def replace_rows(shard_conn):
+        shard_conn.execute("DELETE FROM User_Credentials")
+        shard_conn.executemany(f"INSERT INTO User_Credentials ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", rows)
+        schema.rebuild_org(shard_conn)
+
+    Database.run_write(replace_rows, path, timeout=None, label="shards: copy users")
+
+
+def ensure(key):
+    """Create the shard's folder, tables and user copy the first time it is used. Returns its path."""
+    path = shard_path(key)
+    with _ready_lock:
+        if path in _ready:
+            return path
+        new = not os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        schema.create_tables(path)
+        if new:
+            copy_users(path)
+        _ready.add(path)
+    return path
+
+
+def _route_path(key):
+    return ensure(key) if enabled() and key else None
+
+
+def route(key):
+    """Point this session's connections, writes and photos at a shard (None: the main file)."""
+    Database.route(_route_path(key))
+
+
+def routed(key):
+    """route() for the length of a with block."""
+    return Database.routed(_route_path(key))
+
+
+def paths():
+    return [ensure(key) for key in keys()]
+
+
+def sync_users():
+    """Copy User_Credentials into every shard, creating shards for new supervisors."""
+    if not enabled():
+        return
+    for path in paths():
+        copy_users(path)
+
+
+def _in_shard(path, fn, args, kwargs):
+    with Database.routed(path):
+        return fn(*args, **kwargs)
+
+
+def gather(fn, *args, **kwargs):
+    """fn(*args, **kwargs) run against every shard and the main file in parallel, as a list of results."""
+    # The main file keeps rows whose supervisor has no shard
+    shard_paths = paths() + [Database.DB_PATH]
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(shard_paths)), thread_name_prefix="shard") as pool:
+        return list(pool.map(lambda path: _in_shard(path, fn, args, kwargs), shard_paths))
+
+
+def stream(sql, params=()):
+    """(columns, rows) of one query over every shard and the main file, read one file at a time."""
+    shard_paths = paths() + [Database.DB_PATH]
+    first = Database.get_report_connection(shard_paths[0])
+    cursor = first.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+
+    def rows():
+        try:
+            yield from cursor
+        finally:
+            first.close()
+        for path in shard_paths[1:]:
+            with Database.reading(path=path) as conn:
+                yield from conn.execute(sql, params)
+
+    return columns, rows()
+
+
+def is_federated(table_name=None):
+    """True when a company-wide caller has to read this fact table from every shard."""
+    return enabled() and Database.routed_path() is None and (table_name is None or table_name in SHARDED_TABLES)
+
+
+def concat(frames):
+    non_empty = [frame for frame in frames if not frame.empty]
+    if not non_empty:
+        return frames[0]
+    return pd.concat(non_empty, ignore_index=True)
+
+
+def summed(keys):
+    """A federated() merge for per-key aggregates: one row per keys, every other column summed.
+
+    A technician or workstation can have rows in more than one file, e.g.
+    after moving to another supervisor, so each file has a partial total.
+    """
+    def merge(frame):
+        if frame.empty:
+            return frame
+        return frame.groupby(keys, as_index=False, sort=False, dropna=False).sum()
+    return merge
+
+
+def federated(fn=None, merge=None):
+    """Run a DataFrame-returning read on every shard and concatenate the results.
+
+    With merge, the concatenated frame is passed through merge(frame), e.g.
+    summed(keys) for aggregates, so the result matches a single file's.
+    Only applies to company-wide callers: a session routed to a shard, a
+    caller passing its own conn, or single-file mode runs fn as is.
+    """
+    if fn is None:
+        return functools.partial(federated, merge=merge)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not is_federated() or kwargs.get("conn") is not None:
+            return fn(*args, **kwargs)
+        frame = concat(gather(fn, *args, **kwargs))
+        return frame if merge is None else merge(frame)
+    return wrapper
+
+
+def row_keys(table_name, df):
+    """Shard key of every row of a fact table upload."""
+    if table_name == "Attendance":
+        return df["Code"].map(code_keys())
+    # The sales tables keep the supervisor code in supervisor_name
+    return df["supervisor_name"]
+
+
+def replace_table(table_name, df, insert):
+    """Replace a fact table in every shard with the upload's rows for that shard, one write per shard.
+
+    Rows of supervisors without a shard go to the main file. insert(conn, rows_df)
+    adds the rows inside each write.
+    """
+    supervisors = keys()
+    shard_keys = row_keys(table_name, df)
+    targets = [(ensure(key), df[shard_keys == key]) for key in supervisors]
+    targets.append((Database.DB_PATH, df[~shard_keys.isin(supervisors)]))
+    for path, rows in targets:
+        def replace_rows(conn, rows=rows):
+            conn.execute(f"DELETE FROM {table_name}")
+            insert(conn, rows)
+
+        Database.run_write(replace_rows, path, timeout=None, label=f"shards: replace {table_name}")
+    return len(df)
+
+
+def split(chunk_rows=5000):
+    """Move the fact rows of the main file into the shards. Returns {table: rows moved}.
+
+    A one-off migration when switching TOOLS_SHARDS on; take a backup first.
+    Rows whose supervisor has no shard stay in the main file.
+    """
+    shard_keys = keys()
+    moved = {}
+    for table_name in SHARDED_TABLES:
+        moved[table_name] = 0
+        conn = Database.get_db_connection(Database.DB_PATH)
+        try:
+            for chunk in pd.read_sql_query(f"SELECT * FROM {table_name}", conn, chunksize=chunk_rows):
+                # Shards number their own sales rows
+                chunk = chunk.drop(columns=["id"], errors="ignore")
+                for key, rows in chunk.groupby(row_keys(table_name, chunk)):
+                    if key not in shard_keys:
+                        continue
+                    Database.run_write(lambda shard_conn, rows=rows: Database.insert_dataframe(shard_conn, table_name, rows),
+                                       ensure(key), timeout=None, label=f"shards: split {table_name}")
+                    moved[table_name] += len(rows)
+        finally:
+            conn.close()
+
+        if table_name == "Attendance":
+            codes = [code for code, key in code_keys().items() if key in shard_keys]
+            where, params = "Code IN (SELECT value FROM json_each(?))", codes
+        else:
+            where, params = "supervisor_name IN (SELECT value FROM json_each(?))", shard_keys
+        Database.run_write(lambda main_conn: main_conn.execute(f"DELETE FROM {table_name} WHERE {where}", (json.dumps(params),)),
+                           Database.DB_PATH, timeout=None, label=f"shards: split {table_name}")
+    return moved
@@ -0,0 +1,410 @@
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows: Serve.py's workers need a POSIX host
+    fcntl = None
+
+import Database
+from services import archive, changes, clock, schema
+from services.attendance import SQL_ATTENDANCE_DATE
+
+# Set TOOLS_SNAPSHOTS=1 to answer the attendance summary and the sales totals
+# from Parquet copies of the fact tables, kept in snapshots/ beside the
+# database and brought up to date from Change_Log before each report.
+ENABLED = os.environ.get("TOOLS_SNAPSHOTS", "0") == "1"
+SNAPSHOT_DIR = "snapshots"
+STATE_FILE = "state.json"
+LOCK_FILE = "refresh.lock"
+
+# Rows fetched at a time while rebuilding, and keys per lookup while refreshing
+FETCH_ROWS = 20000
+KEY_CHUNK = 400
+# More changed rows than this since the last refresh and the tables are rebuilt instead
+REBUILD_CHANGES = 50000
+# Month files kept decoded in memory between reports, least recently used dropped first
+CACHE_BYTES = int(os.environ.get("TOOLS_SNAPSHOT_CACHE_MB", 256)) * 1024 * 1024
+
+ATTENDANCE_ISO_DATE = SQL_ATTENDANCE_DATE.format("Attendance_Date")
+
+# Table -> (key columns, date column compared against report ranges, extra columns selected with each row).
+# _Month picks the partition file; Attendance also keeps the ISO date the SQL reports filter on.
+SNAPSHOT_TABLES = {
+    "Attendance": (("Code", "Attendance_Date"), "_Date",
+                   f"{ATTENDANCE_ISO_DATE} AS _Date, substr({ATTENDANCE_ISO_DATE}, 1, 7) AS _Month"),
+    "Workstation_Data": (("id",), "date", "substr(date, 1, 7) AS _Month"),
+    "Advisor_Data": (("id",), "date", "substr(date, 1, 7) AS _Month"),
+}
+
+# Partition of rows whose date has no 'YYYY-MM' month; read with every range
+OTHER = "other"
+MONTH = re.compile(r"\d{4}-\d{2}")
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+# path -> ((mtime_ns, size), Arrow table)
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def snapshot_dir(db_path=None):
+    """The snapshot folder beside the (routed) database."""
+    return os.path.join(os.path.dirname(Database.resolve_path(db_path)), SNAPSHOT_DIR)
+
+
+@contextmanager
+def _lock(folder):
+    """Held while a snapshot is refreshed, by one thread and (with Serve.py's workers) one process at a time."""
+    with _locks_lock:
+        lock = _locks.setdefault(os.path.abspath(folder), threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, LOCK_FILE), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def read_state(folder=None):
+    """The snapshot's state.json as a dict, or None before the first build."""
+    try:
+        with open(os.path.join(folder or snapshot_dir(), STATE_FILE), encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(folder, state):
+    path = os.path.join(folder, STATE_FILE)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=2)
+    os.replace(temporary, path)
+
+
+def _partition(month):
+    return month if month and MONTH.fullmatch(month) else OTHER
+
+
+def _declared_types(conn, table_name):
+    return {row[1]: (row[2] or "").upper() for row in conn.execute(f"PRAGMA table_info({table_name})")}
+
+
+def _array(values, declared):
+    if declared.startswith("INT"):
+        try:
+            return pa.array(values, pa.int64())
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+            # Reals or text in an INTEGER column (spreadsheet uploads): keep the numbers as floats
+            return pa.array(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce"), pa.float64(), from_pandas=True)
+    return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+
+def _arrow(table_name, columns, rows, types):
+    """Fetched rows as an Arrow table, without _Month, plus the parsed columns the reports aggregate."""
+    data = {name: _array([row[index] for row in rows], types.get(name, ""))
+            for index, name in enumerate(columns) if name != "_Month"}
+    if table_name == "Attendance":
+        # Parsed the same way reports.attendance_summary parses them
+        day = pd.to_datetime(data["Attendance_Date"].to_pandas(), format=clock.ATTENDANCE_DATE_FORMAT, errors="coerce")
+        shift = pd.to_timedelta(data["Shift_Duration"].to_pandas(), errors="coerce")
+        data["_Day"] = pa.array(day, from_pandas=True).cast(pa.date32())
+        data["_Shift_Ns"] = pa.array(shift, from_pandas=True).cast(pa.int64())
+    return pa.table(data)
+
+
+def _write_partition(folder, partition, table, append=False):
+    """Write (or with append, add to) one month's file; an empty table removes it."""
+    path = os.path.join(folder, f"{partition}.parquet")
+    if append and os.path.exists(path):
+        table = pa.concat_tables([pq.read_table(path), table], promote_options="permissive")
+    if table.num_rows == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    temporary = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, temporary)
+    os.replace(temporary, path)
+
+
+def _sources(years):
+    """Schema names to read rows from: main, then the attached yearly archive files."""
+    return ["main", *(f"archive_{year}" for year in years)]
+
+
+def _rebuild_table(conn, sources, table_name, folder):
+    extra = SNAPSHOT_TABLES[table_name][2]
+    types = _declared_types(conn, table_name)
+    os.makedirs(folder, exist_ok=True)
+    written = set()
+    rows_written = 0
+    for source in sources:
+        cursor = conn.execute(f"SELECT *, {extra} FROM {source}.{table_name} ORDER BY _Month")
+        columns = [description[0] for description in cursor.description]
+        month_index = columns.index("_Month")
+        pending, pending_month = [], None
+
+        def flush():
+            if pending:
+                partition = _partition(pending_month)
+                _write_partition(folder, partition, _arrow(table_name, columns, pending, types), append=partition in written)
+                written.add(partition)
+
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            rows_written += len(rows)
+            for month, group in itertools.groupby(rows, key=lambda row: row[month_index]):
+                if month != pending_month:
+                    flush()
+                    pending, pending_month = [], month
+                pending.extend(group)
+        flush()
+    return rows_written
+
+
+def rebuild():
+    """Write a new generation of every snapshot table from the (routed) database and switch to it."""
+    started = time.perf_counter()
+    folder = snapshot_dir()
+    generation = f"g{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}_{time.perf_counter_ns() % 1000000}"
+    target = os.path.join(folder, generation)
+    stats = {"rows": {}}
+    with Database.reading() as conn, archive.attached(conn, archive.archived_years()) as years:
+        # Everything below is read in one transaction, so it matches this Seq exactly
+        conn.execute("BEGIN")
+        seq = changes.latest(conn)
+        for table_name in SNAPSHOT_TABLES:
+            stats["rows"][table_name] = _rebuild_table(conn, _sources(years), table_name, os.path.join(target, table_name))
+        conn.execute("COMMIT")
+
+    previous = read_state(folder)
+    _write_state(folder, {"source": os.path.abspath(Database.resolve_path()), "generation": generation, "seq": seq})
+    # The generation before the one just replaced can go; the replaced one may still be open in a report
+    for name in os.listdir(folder):
+        if name.startswith("g") and name not in (generation, (previous or {}).get("generation")):
+            shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    stats.update(seq=seq, generation=generation, rebuilt=True, seconds=round(time.perf_counter() - started, 3))
+    return stats
+
+
+def _key_strings(table, key):
+    columns = [pc.cast(table[name], pa.string()) for name in key]
+    return columns[0] if len(columns) == 1 else pc.binary_join_element_wise(*columns, "\x1f")
+
+
+def _fetch_rows(conn, sources, table_name, keys):
+    """Current rows (from the live file or an archive file) for the changed keys, by partition."""
+    key, _, extra = SNAPSHOT_TABLES[table_name]
+    by_partition, columns = {}, None
+    keys = sorted(keys)
+    for source in sources:
+        for start in range(0, len(keys), KEY_CHUNK):
+            chunk = keys[start:start + KEY_CHUNK]
+            if len(key) == 1:
+                where = f"{key[0]} IN ({', '.join('?' for _ in chunk)})"
+                params = [value[0] for value in chunk]
+            else:
+                where = f"({', '.join(key)}) IN (VALUES {', '.join('(' + ', '.join('?' for _ in key) + ')' for _ in chunk)})"
+                params = [value for values in chunk for value in values]
+            cursor = conn.execute(f"SELECT *, {extra} FROM {source}.{table_name} WHERE {where}", params)
+            columns = [description[0] for description in cursor.description]
+            for row in cursor.fetchall():
+                by_partition.setdefault(_partition(row[columns.index("_Month")]), []).append(row)
+    return columns, by_partition
+
+
+def _refresh_table(conn, sources, table_name, folder, keys):
+    key = SNAPSHOT_TABLES[table_name][0]
+    os.makedirs(folder, exist_ok=True)
+    changed = pa.array(sorted({"\x1f".join(str(value) for value in values) for values in keys}), pa.string())
+
+    # Partitions holding an old version of a changed row
+    affected = set()
+    for name in os.listdir(folder):
+        if name.endswith(".parquet"):
+            stored = pq.read_table(os.path.join(folder, name), columns=list(key))
+            if pc.any(pc.is_in(_key_strings(stored, key), value_set=changed)).as_py():
+                affected.add(name[:-len(".parquet")])
+
+    columns, fresh = _fetch_rows(conn, sources, table_name, keys)
+    types = _declared_types(conn, table_name)
+    for partition in affected | set(fresh):
+        path = os.path.join(folder, f"{partition}.parquet")
+        parts = []
+        if os.path.exists(path):
+            stored = pq.read_table(path)
+            parts.append(stored.filter(pc.invert(pc.is_in(_key_strings(stored, key), value_set=changed))))
+        if partition in fresh:
+            parts.append(_arrow(table_name, columns, fresh[partition], types))
+        _write_partition(folder, partition, pa.concat_tables(parts, promote_options="permissive"))
+    return len(affected | set(fresh))
+
+
+def _changed_keys(seq):
+    """({table: set of key tuples}, last Seq, count) of the changes after seq, or None if a rebuild is needed."""
+    keys = {table_name: set() for table_name in SNAPSHOT_TABLES}
+    last, count = seq, 0
+    for change_seq, table_name, operation, row_key, row_data, _ in changes.iter_since(seq, [*SNAPSHOT_TABLES, "*"]):
+        if operation == changes.RESTORE_OPERATION:
+            return None
+        last = change_seq
+        if operation == "archive":
+            # Moved to a yearly archive file unchanged; the snapshot keeps it where it is
+            continue
+        count += 1
+        if count > REBUILD_CHANGES:
+            return None
+        key = SNAPSHOT_TABLES[table_name][0]
+        keys[table_name].add(tuple(json.loads(row_key)[name] for name in key))
+        if row_data:
+            # An update can move a row to another key (e.g. a corrected Attendance_Date)
+            data = json.loads(row_data)
+            keys[table_name].add(tuple(data[name] for name in key))
+    return keys, last, count
+
+
+def refresh(force=False):
+    """Bring the (routed) database's snapshot up to date. Returns stats.
+
+    Only the month files holding rows changed since the last refresh are
+    rewritten; the first run, a restore, a pruned Change_Log gap, a very large
+    batch of changes or force rebuild everything.
+    """
+    folder = snapshot_dir()
+    with _lock(folder):
+        state = read_state(folder)
+        source = os.path.abspath(Database.resolve_path())
+        if force or state is None or state.get("source") != source:
+            return rebuild()
+        latest, first = changes.latest(), changes.oldest()
+        if state["seq"] == latest:
+            return {"seq": latest, "generation": state["generation"], "rebuilt": False, "changes": 0, "partitions": 0}
+        if state["seq"] > latest or (first is not None and state["seq"] < first - 1):
+            return rebuild()
+        changed = _changed_keys(state["seq"])
+        if changed is None:
+            return rebuild()
+
+        keys, last, count = changed
+        started = time.perf_counter()
+        partitions = 0
+        generation = os.path.join(folder, state["generation"])
+        with Database.reading() as conn, archive.attached(conn, archive.archived_years()) as years:
+            sources = _sources(years)
+            for table_name, table_keys in keys.items():
+                if table_keys:
+                    partitions += _refresh_table(conn, sources, table_name, os.path.join(generation, table_name), table_keys)
+        state["seq"] = last
+        _write_state(folder, state)
+        return {"seq": last, "generation": state["generation"], "rebuilt": False, "changes": count,
+                "partitions": partitions, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _read(path):
+    """A month file as an Arrow table, from memory while the file is unchanged."""
+    global _cache_bytes
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == version:
+            _cache.move_to_end(path)
+            return cached[1]
+    table = pq.read_table(path)
+    with _cache_lock:
+        if path in _cache:
+            _cache_bytes -= _cache.pop(path)[1].nbytes
+        _cache[path] = (version, table)
+        _cache_bytes += table.nbytes
+        while _cache_bytes > CACHE_BYTES and len(_cache) > 1:
+            _cache_bytes -= _cache.popitem(last=False)[1][1].nbytes
+    return table
+
+
+def _months(start, end):
+    first, last = date.fromisoformat(str(start)[:10]), date.fromisoformat(str(end)[:10])
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f"{year:04}-{month:02}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def load(table_name, start, end, columns=None):
+    """Rows of a snapshot table with its date between start and end (ISO, inclusive) as an Arrow table.
+
+    Refreshes the snapshot first. Only the month files in the range are read,
+    and only the first and last month are filtered row by row. `.to_pandas()`
+    on the result shares the numeric buffers instead of copying rows.
+    """
+    refresh()
+    _, date_column, _ = SNAPSHOT_TABLES[table_name]
+    folder = os.path.join(snapshot_dir(), read_state()["generation"], table_name)
+    wanted = None if columns is None else list(dict.fromkeys([*columns, date_column]))
+    months = _months(start, end)
+    parts = []
+    for partition in [*months, OTHER]:
+        path = os.path.join(folder, f"{partition}.parquet")
+        if not os.path.exists(path):
+            continue
+        table = _read(path)
+        table = table if wanted is None else table.select(wanted)
+        if partition in (months[0], months[-1], OTHER):
+            table = table.filter(pc.and_(pc.greater_equal(table[date_column], str(start)),
+                                         pc.less_equal(table[date_column], str(end))))
+        parts.append(table)
+    if not parts:
+        return None
+    return pa.concat_tables(parts, promote_options="permissive")
+
+
+def sales_totals(table_name, keys, start_date, end_date, supervisor_code=None):
+    """Summed FIGURES per keys of a sales table between two dates, sorted by keys, or None if there are no rows.
+
+    With supervisor_code only rows of that supervisor's org subtree are summed.
+    """
+    table = load(table_name, start_date, end_date, columns=[*keys, "supervisor_name", *archive.FIGURES])
+    if table is None:
+        return None
+    if supervisor_code is not None:
+        with Database.reading() as conn:
+            subtree = [row[0] for row in conn.execute(schema.SQL_ORG_SUBTREE, (supervisor_code,))]
+        table = table.filter(pc.is_in(table["supervisor_name"], value_set=pa.array(subtree, pa.string())))
+    grouped = table.group_by(list(keys)).aggregate([(name, "sum") for name in archive.FIGURES])
+    totals = grouped.to_pandas().rename(columns={f"{name}_sum": name for name in archive.FIGURES})
+    return totals[[*keys, *archive.FIGURES]].sort_values(list(keys), na_position="first", ignore_index=True)
+
+
+def attendance_days(start, end, codes):
+    """Days, summed shift nanoseconds and Sundays per technician code between two ISO dates, as a DataFrame."""
+    table = load("Attendance", start, end, columns=["Code", "_Day", "_Shift_Ns"])
+    if table is None:
+        return pd.DataFrame(columns=["Code", "Days", "Shift_Ns", "Sundays"])
+    table = table.filter(pc.is_in(table["Code"], value_set=pa.array(list(codes), pa.string())))
+    table = table.append_column("_Sunday", pc.equal(pc.day_of_week(table["_Day"]), 6))  # Monday = 0
+    grouped = table.group_by("Code").aggregate([("_Day", "count_distinct"), ("_Shift_Ns", "sum"), ("_Sunday", "sum")])
+    return grouped.to_pandas().rename(columns={"_Day_count_distinct": "Days", "_Shift_Ns_sum": "Shift_Ns", "_Sunday_sum": "Sundays"})
@@ -0,0 +1,169 @@
+import pandas as pd
+
+import Database
+from services import passwords, schema, shards
+from services.errors import NotFound, ValidationError
+
+USER_COLUMNS = ['Code', 'Name', 'Password', 'Supervisor_Code', 'User_Role', 'Target']
+INSERT_USER_SQL = "INSERT INTO User_Credentials (Code, Name, Password, Supervisor_Code, User_Role, Target) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def _user(row):
+    if row is None:
+        return None
+    code, name, _, supervisor_code, role, target = row
+    return {'code': code, 'name': name, 'supervisor_code': supervisor_code, 'role': role, 'target': target}
+
+
+def _query(sql, params=()):
+    conn = Database.get_db_connection()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def authenticate(code, password):
+    """The user as a dict (code, name, supervisor_code, role, target), or None if the credentials are wrong.
+
+    The stored hash is read with one lookup by Code and checked after the
+    connection is closed, so the slow hashing never holds a database lock.
+    A password still stored in plaintext, or hashed with fewer iterations
+    than configured, is rehashed on the first successful login.
+    """
+    rows = _query('SELECT Code, Name, Password, Supervisor_Code, User_Role, Target FROM User_Credentials WHERE Code = ?',
+                  (code,))
+    if not rows or not passwords.verify_password(password, rows[0][2]):
+        return None
+    if passwords.needs_rehash(rows[0][2]):
+        set_password_hashes([(code, rows[0][2], passwords.hash_password(password))])
+    return _user(rows[0])
+
+
+def set_password_hashes(changes):
+    """Store new hashes given as (code, old stored value, new hash), in the main file and every shard.
+
+    A row whose password changed since it was read is left alone.
+    """
+    updates = [(new, code, old) for code, old, new in changes]
+
+    def update_rows(conn):
+        conn.executemany("UPDATE User_Credentials SET Password = ? WHERE Code = ? AND Password = ?", updates)
+
+    Database.run_write(update_rows, Database.DB_PATH)
+    if shards.enabled():
+        for path in shards.paths():
+            Database.run_write(update_rows, path)
+    return len(updates)
+
+
+def hash_stored_passwords():
+    """Replace every password still stored in plaintext with its hash. Returns the number changed.
+
+    The hashes are computed before the write, which then only runs the UPDATEs.
+    Hashes below the configured work factor need the password, so they are
+    upgraded by authenticate() instead.
+    """
+    plaintext = [(code, stored) for code, stored in _query("SELECT Code, Password FROM User_Credentials")
+                 if stored is not None and not passwords.is_hashed(stored)]
+    if not plaintext:
+        return 0
+    hashes = passwords.hash_many([stored for _, stored in plaintext])
+    return set_password_hashes([(code, stored, new) for (code, stored), new in zip(plaintext, hashes)])
+
+
+def get_user(code):
+    rows = _query('SELECT Code, Name, Password, Supervisor_Code, User_Role, Target FROM User_Credentials WHERE Code = ?', (code,))
+    if not rows:
+        raise NotFound(f"No user with code {code}")
+    return _user(rows[0])
+
+
+def user_name(code):
+    return get_user(code)['name']
+
+
+def supervisor_name(code):
+    """Name of the supervisor the user reports to."""
+    rows = _query('''SELECT s.Name
+                     FROM User_Credentials u
+                     JOIN User_Credentials s ON s.Code = u.Supervisor_Code
+                     WHERE u.Code = ?''', (code,))
+    if not rows:
+        raise NotFound(f"No supervisor found for {code}")
+    return rows[0][0]
+
+
+def workstation_names():
+    """Every workstation, for the technician's punch-in dropdown."""
+    return [row[0] for row in _query("SELECT Name FROM User_Credentials WHERE User_Role = 'Workstation'")]
+
+
+def supervisors():
+    """(Code, Name) of every supervisor, by name."""
+    return _query("SELECT Code, Name FROM User_Credentials WHERE User_Role = 'Supervisor' ORDER BY Name")
+
+
+def reports(supervisor_code, role=None):
+    """(Code, Name) of the users reporting to a supervisor or workstation, by name."""
+    if role is None:
+        return _query('SELECT Code, Name FROM User_Credentials WHERE Supervisor_Code = ? ORDER BY Name', (supervisor_code,))
+    return _query('SELECT Code, Name FROM User_Credentials WHERE Supervisor_Code = ? AND User_Role = ? ORDER BY Name',
+                  (supervisor_code, role))
+
+
+def subtree_codes(code):
+    """Codes of everyone in a user's org subtree (services.schema.Org_Closure), the user included."""
+    return [row[0] for row in _query(schema.SQL_ORG_SUBTREE, (code,))]
+
+
+def manages_supervisors(code):
+    """True for a manager: someone with other supervisors below them in the Supervisor_Code tree."""
+    return bool(_query(f'''SELECT 1 FROM User_Credentials
+                            WHERE User_Role = 'Supervisor' AND Code != ? AND Code IN ({schema.SQL_ORG_SUBTREE})
+                            LIMIT 1''', (code, code)))
+
+
+def users_frame(supervisor_code=None):
+    """User_Credentials as a DataFrame, optionally only the users anywhere under one supervisor or manager."""
+    conn = Database.get_db_connection()
+    try:
+        if supervisor_code is None:
+            return pd.read_sql_query("SELECT * FROM User_Credentials", conn)
+        return pd.read_sql_query('''SELECT u.* FROM Org_Closure o JOIN User_Credentials u ON u.Code = o.Descendant
+                                    WHERE o.Ancestor = ? AND o.Depth > 0
+                                    ORDER BY o.Depth, u.Code''', conn, params=(supervisor_code,))
+    finally:
+        conn.close()
+
+
+def validate_users(df):
+    """Raise ValidationError listing the missing columns or the first bad row of an upload."""
+    missing = [column for column in USER_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValidationError("Missing columns", [f"Missing column: {column}" for column in missing])
+
+    for index, row in df.iterrows():
+        if pd.isnull(row['Code']) or pd.isnull(row['Name']) or pd.isnull(row['Password']) or pd.isnull(row['User_Role']):
+            raise ValidationError("Missing required data", [f"Error in row {index + 1}: Missing required data."])
+        # Allow Supervisor_Code to be blank or null for non-Technician roles
+        if row['User_Role'] == 'Technician' and pd.isnull(row['Supervisor_Code']):
+            raise ValidationError("Missing supervisor", [f"Error in row {index + 1}: Supervisor_Code is required for Technician."])
+
+
+def replace_users(df, validate=True):
+    """Replace User_Credentials with an upload in one write."""
+    if validate:
+        validate_users(df)
+    # Hashed before the write, so the write lock is only held for the INSERTs
+    df = df.assign(Password=passwords.hash_many(df['Password']))
+
+    def replace_rows(conn):
+        conn.execute("DELETE FROM User_Credentials")
+        conn.executemany(INSERT_USER_SQL, df[USER_COLUMNS].itertuples(index=False, name=None))
+        schema.rebuild_org(conn)
+
+    # Delete and reload run as one write, so the table is never seen half loaded
+    Database.run_write(replace_rows, Database.DB_PATH)
+    shards.sync_users()
+    return len(df)
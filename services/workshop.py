@@ -0,0 +1,211 @@
+import pandas as pd
+
+import Database
+from services import archive, clock, schema, shards, snapshots
+from services.errors import NotFound, ValidationError
+
+# Figures entered per day; total and align_and_balance are derived from them
+FIGURES = ("running_repair", "free_service", "paid_service", "body_shop", "align", "balance")
+TOTALS = ("running_repair", "free_service", "paid_service", "body_shop", "total", "align", "balance", "align_and_balance")
+
+
+def with_totals(figures):
+    """The entered figures plus total and align_and_balance."""
+    values = {name: int(figures.get(name) or 0) for name in FIGURES}
+    values["total"] = values["running_repair"] + values["free_service"] + values["paid_service"] + values["body_shop"]
+    values["align_and_balance"] = values["align"] + values["balance"]
+    return values
+
+
+def summarize(df, start_date, end_date, keys):
+    """Sum sales rows per `keys` between two dates (inclusive)."""
+    filtered_df = df[(df['date'] >= str(start_date)) & (df['date'] <= str(end_date))]
+    return filtered_df.groupby(keys).agg(
+        Running_Repair=('running_repair', 'sum'),
+        Free_Service=('free_service', 'sum'),
+        Paid_Service=('paid_service', 'sum'),
+        Body_Shop=('body_shop', 'sum'),
+        Total=('total', 'sum'),
+        Align=('align', 'sum'),
+        Balance=('balance', 'sum'),
+        Align_and_Balance=('align_and_balance', 'sum'),
+    ).reset_index()
+
+
+# Sum Workstation_Data rows per workstation between two dates (inclusive)
+def summarize_workshop_data(df, start_date, end_date):
+    return summarize(df, start_date, end_date, 'workstation_name')
+
+
+# Column names of the summed figures in the report tables
+TOTAL_COLUMNS = {
+    "running_repair": "Running_Repair", "free_service": "Free_Service", "paid_service": "Paid_Service",
+    "body_shop": "Body_Shop", "total": "Total", "align": "Align", "balance": "Balance",
+    "align_and_balance": "Align_and_Balance",
+}
+
+
+# The same sums as summarize(), computed by SQLite so no rows are loaded
+TOTALS_SQL = """
+    SELECT {keys},
+           SUM(running_repair) AS Running_Repair, SUM(free_service) AS Free_Service,
+           SUM(paid_service) AS Paid_Service, SUM(body_shop) AS Body_Shop, SUM(total) AS Total,
+           SUM(align) AS Align, SUM(balance) AS Balance, SUM(align_and_balance) AS Align_and_Balance
+    FROM ({source})
+    GROUP BY {keys}
+    ORDER BY {keys}
+"""
+
+
+def _merge_totals(frame):
+    """totals() from every shard as one row per keys, summed and sorted as the SQL sorts them."""
+    keys = [column for column in frame.columns if column not in TOTAL_COLUMNS.values()]
+    return shards.summed(keys)(frame).sort_values(keys, na_position="first", ignore_index=True)
+
+
+@shards.federated(merge=_merge_totals)
+def totals(table_name, keys, start_date, end_date, supervisor_code=None, conn=None):
+    """summarize() of a sales table between two dates, optionally for one supervisor's org subtree, as a DataFrame.
+
+    Archived months are added from the monthly rollups, and partly covered
+    ones from the yearly archive files, only when the range reaches them.
+    """
+    if snapshots.ENABLED and conn is None:
+        return _snapshot_totals(table_name, keys, start_date, end_date, supervisor_code)
+
+    columns = ", ".join([*keys, *TOTALS])
+    where = f"AND supervisor_name IN ({schema.SQL_ORG_SUBTREE})" if supervisor_code is not None else ""
+    supervisor = [supervisor_code] if supervisor_code is not None else []
+    rollup_table = archive.SALES_TABLES[table_name][0]
+
+    with Database.reading(conn) as conn:
+        months, ranges = archive.plan(conn, table_name, start_date, end_date)
+        with archive.attached(conn, [year for year, _, _ in ranges]) as years:
+            parts = [f"SELECT {columns} FROM {table_name} WHERE date BETWEEN ? AND ? {where}"]
+            params = [str(start_date), str(end_date), *supervisor]
+            if months:
+                parts.append(f"SELECT {columns} FROM {rollup_table} WHERE month IN ({', '.join('?' for _ in months)}) {where}")
+                params += [*months, *supervisor]
+            for year, first, last in ranges:
+                if year in years:
+                    parts.append(f"SELECT {columns} FROM archive_{year}.{table_name} WHERE date BETWEEN ? AND ? {where}")
+                    params += [first, last, *supervisor]
+            query = TOTALS_SQL.format(keys=", ".join(keys), source=" UNION ALL ".join(parts))
+            return pd.read_sql_query(query, conn, params=params)
+
+
+def _snapshot_totals(table_name, keys, start_date, end_date, supervisor_code):
+    """totals() from the Parquet snapshot (services.snapshots) instead of SQLite."""
+    sums = snapshots.sales_totals(table_name, keys, start_date, end_date, supervisor_code)
+    if sums is None:
+        sums = pd.DataFrame(columns=[*keys, *TOTALS])
+    return sums.rename(columns=TOTAL_COLUMNS)
+
+
+def workshop_totals(start_date, end_date, supervisor_code=None, conn=None):
+    return totals("Workstation_Data", ["workstation_name"], start_date, end_date, supervisor_code, conn=conn)
+
+
+@shards.federated
+def workshop_data(supervisor_code=None):
+    """Workstation_Data as a DataFrame; a supervisor only sees the workstations in their org subtree."""
+    with Database.reading() as conn:
+        if supervisor_code is None:
+            return pd.read_sql_query("SELECT * FROM Workstation_Data", conn)
+        return pd.read_sql_query(f"SELECT * FROM Workstation_Data WHERE supervisor_name IN ({schema.SQL_ORG_SUBTREE})",
+                                 conn, params=(supervisor_code,))
+
+
+def validate_days(table_name, df):
+    """Raise ValidationError listing the days an upload has more than one row for (see schema.SALES_DAY_KEYS)."""
+    keys = list(schema.SALES_DAY_KEYS[table_name])
+    if any(key not in df.columns for key in keys):
+        return
+    keyed = df.dropna(subset=keys)
+    repeated = keyed[keyed.duplicated(keys, keep=False)]
+    if not repeated.empty:
+        raise ValidationError("Duplicate rows", [f"More than one row for {', '.join(str(value) for value in day)}"
+                                                 for day in repeated[keys].drop_duplicates().itertuples(index=False, name=None)])
+
+
+def replace_workshop_data(df):
+    validate_days("Workstation_Data", df)
+    if shards.enabled():
+        return shards.replace_table("Workstation_Data", df, lambda conn, rows: Database.insert_dataframe(conn, "Workstation_Data", rows))
+
+    # Replace the table contents in a single write so readers never see it empty
+    def replace_workstation_data(conn):
+        conn.execute("DELETE FROM Workstation_Data")
+        Database.insert_dataframe(conn, "Workstation_Data", df)
+
+    Database.run_write(replace_workstation_data)
+    return len(df)
+
+
+def workstation(code):
+    """(name, supervisor_code) of a workstation login."""
+    conn = Database.get_db_connection()
+    try:
+        row = conn.execute("SELECT Name, Supervisor_Code FROM User_Credentials WHERE Code = ?", (code,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise NotFound(f"No workstation with code {code}")
+    return row
+
+
+def target(workstation_name):
+    """The workstation's monthly Target, or None if none is assigned."""
+    conn = Database.get_db_connection()
+    try:
+        row = conn.execute('SELECT Target FROM User_Credentials WHERE Name = ?', (workstation_name,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def month_totals(workstation_name, day=None):
+    """Summed figures (TOTALS order) from the first of the month, or None if nothing was entered yet."""
+    start_of_month = (day or clock.now()).replace(day=1).strftime(clock.SALES_DATE_FORMAT)
+    conn = Database.get_db_connection()
+    try:
+        totals = conn.execute('''
+            SELECT SUM(running_repair), SUM(free_service), SUM(paid_service), SUM(body_shop),
+                   SUM(total), SUM(align), SUM(balance), SUM(align_and_balance)
+            FROM Workstation_Data
+            WHERE date >= ? AND workstation_name = ?
+        ''', (start_of_month, workstation_name)).fetchone()
+    finally:
+        conn.close()
+    return totals if any(totals) else None
+
+
+def day_figures(workstation_name, date):
+    """A workstation's row for one day (TOTALS order), or None."""
+    conn = Database.get_db_connection()
+    try:
+        return conn.execute('''
+            SELECT running_repair, free_service, paid_service, body_shop, total, align, balance, align_and_balance
+            FROM Workstation_Data
+            WHERE date = ? AND workstation_name = ?
+        ''', (str(date), workstation_name)).fetchone()
+    finally:
+        conn.close()
+
+
+def save_day(date, workstation_name, supervisor_code, figures):
+    """Insert or update a workstation's figures for one day. Returns the stored values."""
+    values = with_totals(figures)
+    date = str(date)
+
+    def save_rows(conn):
+        # One statement on the (date, workstation_name) index; an existing row keeps its supervisor
+        conn.execute(f'''
+            INSERT INTO Workstation_Data (date, workstation_name, supervisor_name, timestamp, {", ".join(TOTALS)})
+            VALUES (?, ?, ?, ?, {", ".join("?" for _ in TOTALS)})
+            ON CONFLICT (date, workstation_name) DO UPDATE SET
+                timestamp = excluded.timestamp, {", ".join(f"{name} = excluded.{name}" for name in TOTALS)}
+        ''', (date, workstation_name, supervisor_code, clock.timestamp(), *(values[name] for name in TOTALS)))
+
+    Database.run_write(save_rows)
+    return values